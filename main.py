@@ -1,10 +1,55 @@
 import streamlit as st
-import re
-from src.ui.components import setup_page, display_file_uploaders, display_dataframe_viewer, display_workbook_download, display_key_data_workbook
-from src.parsing import get_parser
-from src.parsing.utils import detect_ags_version
-from src.processing.combiner import combine_files, expand_rows, get_key_data_groups
-from src.domain.models import AGSVersion, ParsedAGSFile
+from src.ui.components import setup_page, display_file_uploaders, display_dataframe_viewer, display_workbook_download, display_key_data_workbook, \
+    display_depth_search, display_keyword_search, display_soil_classification
+from functools import partial
+from src.processing.combiner import CombinedStore, KeyDataSession, combine_group, combined_group_names, expand_rows, get_key_data_groups
+from src.domain.models import AGSVersion, ParsedAGSFile, HoleFilter, LEGACY_IGNORED_HOLE_TYPES
+from src.processing.cache import ParseCache
+from src.processing.keys import SharedKeys
+from src.processing.ingest import IngestJob, IngestResult, ingest_files, default_worker_count
+from src.parsing.lazy import LazyGroups
+
+def get_parse_cache() -> ParseCache:
+    """Parse cache stored in the session so it survives Streamlit reruns."""
+    if "parse_cache" not in st.session_state:
+        st.session_state["parse_cache"] = ParseCache()
+    return st.session_state["parse_cache"]
+
+def get_combined_store() -> CombinedStore:
+    """Combined groups stored in the session, so a rerun only combines the files that changed."""
+    if "combined_store" not in st.session_state:
+        st.session_state["combined_store"] = CombinedStore()
+    return st.session_state["combined_store"]
+
+def get_key_data_session(key_data_groups: dict) -> KeyDataSession:
+    """Key data intervals stored in the session, reused by reruns while the key groups are unchanged."""
+    session = st.session_state.get("key_data_session")
+    if session is None or not session.holds(key_data_groups):
+        session = KeyDataSession(key_data_groups)
+        st.session_state["key_data_session"] = session
+    return session
+
+RC_TYPE_OPTION = "Any hole type that contains 'RC'"
+
+def get_hole_filter():
+    """Sidebar row filter: hole types to ignore and/or hole IDs to keep. None when nothing is set."""
+    ignored_types = st.sidebar.multiselect(
+        "Ignore hole types",
+        options=list(LEGACY_IGNORED_HOLE_TYPES) + [RC_TYPE_OPTION],
+        help="Rows of holes with these HOLE_TYPE / LOCA_TYPE values are dropped while files are parsed."
+    )
+    hole_ids_text = st.sidebar.text_input(
+        "Only keep hole IDs",
+        help="Comma separated. IDs are matched as written in the files, before any filename prefix is added."
+    )
+    hole_ids = [h for h in hole_ids_text.split(",") if h.strip()]
+    if not ignored_types and not hole_ids:
+        return None
+    return HoleFilter.create(
+        hole_ids=hole_ids or None,
+        exclude_types=[t for t in ignored_types if t != RC_TYPE_OPTION],
+        exclude_type_contains=["RC"] if RC_TYPE_OPTION in ignored_types else (),
+    )
 
 def main():
     setup_page()
@@ -18,6 +63,24 @@ def main():
         index=1
     )
     target_version_str = "AGS3" if "AGS3" in mode else "AGS4"
+    max_workers = st.sidebar.number_input(
+        "Parser worker processes",
+        min_value=1,
+        max_value=default_worker_count(),
+        value=default_worker_count(),
+        help="Files are parsed in parallel worker processes. Use 1 to parse in the app process."
+    )
+    lazy_groups = st.sidebar.checkbox(
+        "Parse groups on demand",
+        value=False,
+        help="Only index the groups of each file up front and parse a group when it is first viewed or exported."
+    )
+    typed_columns = st.sidebar.checkbox(
+        "Typed columns",
+        value=False,
+        help="Convert depth and other numeric columns to numbers, dates to dates and code columns to categories while parsing."
+    )
+    hole_filter = get_hole_filter()
     
     # 2. Upload
     files_no_prefix, files_with_prefix = display_file_uploaders()
@@ -36,55 +99,54 @@ def main():
     st.success(f"**{len(all_files)} file(s)** ready for processing in **{target_version_str}** mode")
     
     # 3. Processing
-    parsed_results = []
-    failed_files = []
+    cache = get_parse_cache()
+    outcomes = [None] * len(all_files)
+    upload_keys = [None] * len(all_files)
+    jobs, job_slots, job_keys = [], [], []
     
     with st.status("Processing files…", expanded=True) as status:
-        for idx, (file_obj, needs_prefix) in enumerate(all_files, 1):
+        for idx, (file_obj, needs_prefix) in enumerate(all_files):
             fname = file_obj.name
-            status.update(label=f"Processing {fname} ({idx}/{len(all_files)})")
-            
-            try:
-                content = file_obj.getvalue()
-                
-                # A. Detect Version
-                detected = detect_ags_version(content)
-                if target_version_str == "AGS3" and detected == "AGS4":
-                     raise ValueError("Detected AGS4 file in AGS3 mode.")
-                if target_version_str == "AGS4" and detected == "AGS3":
-                     raise ValueError("Detected AGS3 file in AGS4 mode.")
-                     
-                # B. Parse
-                parser = get_parser(target_version_str)
-                parsed_file = parser.parse(content, fname)
-                
-                if not parsed_file.is_valid:
-                    error_msg = "; ".join([e.message for e in parsed_file.errors])
-                    raise ValueError(f"Parsing failed: {error_msg}")
-                    
-                if not parsed_file.groups:
-                    raise ValueError("No valid groups found.")
-                
-                # C. Apply Prefix (in-memory modifier on the dataframe)
-                if needs_prefix:
-                    base = fname.split('.')[0].upper()
-                    # Sanitize prefix (alphanumeric only, max 5 chars)
-                    prefix = re.sub(r'[^A-Z0-9]', '', base)[:5] + "_"
-                    st.write(f"Applying prefix '{prefix}' for {fname}")
-                    
-                    for group, df in parsed_file.groups.items():
-                        # Simple heuristic: find 'HOLE_ID' or 'LOCA_ID'
-                        cols = df.columns
-                        target_col = next((c for c in cols if c in ['HOLE_ID', 'LOCA_ID', 'HOLEID']), None)
-                        if target_col:
-                            df[target_col] = prefix + df[target_col].astype(str).str.strip()
+            content = file_obj.getvalue()
+            cache_key = ParseCache.make_key(content, fname, target_version_str, needs_prefix, hole_filter, typed_columns, lazy_groups)
+            # One combined-store entry per upload, even when the same file is uploaded twice
+            upload_keys[idx] = (cache_key, sum(key[0] == cache_key for key in upload_keys[:idx]))
+            cached = cache.get(cache_key)
+            if cached is not None:
+                outcomes[idx] = IngestResult(filename=fname, parsed_file=cached)
+                st.write(f"✅ Success (cached): {fname}")
+                continue
+            jobs.append(IngestJob(filename=fname, content=content, needs_prefix=needs_prefix))
+            job_slots.append(idx)
+            job_keys.append(cache_key)
+
+        done = []
+
+        def report(job_idx: int, result: IngestResult):
+            done.append(job_idx)
+            status.update(label=f"Processing {result.filename} ({len(done)}/{len(jobs)})")
+            if result.ok:
+                cache.put(job_keys[job_idx], result.parsed_file)
+                if result.prefix:
+                    st.write(f"Applying prefix '{result.prefix}' for {result.filename}")
+                st.write(f"✅ Success: {result.filename}")
+            else:
+                st.error(f"❌ Failed {result.filename}: {result.error}")
+
+        if jobs:
+            for job_idx, result in enumerate(ingest_files(jobs, target_version_str, max_workers, on_result=report,
+                                                         lazy=lazy_groups, hole_filter=hole_filter, typed=typed_columns)):
+                outcomes[job_slots[job_idx]] = result
+
+        cache_stats = cache.stats()
+        st.caption(
+            f"Parse cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+            f"{cache_stats['entries']} files ({cache_stats['bytes'] / 1e6:.1f} MB)"
+        )
 
-                parsed_results.append(parsed_file)
-                st.write(f"✅ Success: {fname}")
-                
-            except Exception as e:
-                failed_files.append({"File": fname, "Error": str(e)})
-                st.error(f"❌ Failed {fname}: {e}")
+    parsed_results = [r.parsed_file for r in outcomes if r.ok]
+    parsed_uploads = {key: r.parsed_file for key, r in zip(upload_keys, outcomes) if r.ok}
+    failed_files = [{"File": r.filename, "Error": r.error} for r in outcomes if not r.ok]
 
     # 4. Results & Combining
     if failed_files:
@@ -96,7 +158,14 @@ def main():
         return
         
     st.write("Combining groups...")
-    combined_groups = combine_files(parsed_results)
+    if lazy_groups:
+        # Each group is parsed and combined across files the first time it is needed
+        # (one key dictionary for all groups, so their SOURCE_FILE / HOLE_ID codes stay comparable)
+        combined_groups = LazyGroups(combined_group_names(parsed_results), partial(combine_group, parsed_results, keys=SharedKeys()))
+    else:
+        store = get_combined_store()
+        store.sync(parsed_uploads)
+        combined_groups = store.groups
     
     # 5. Viewing
     display_dataframe_viewer(combined_groups)
@@ -104,7 +173,11 @@ def main():
     
     # Key data extraction
     key_data = get_key_data_groups(combined_groups)
-    display_key_data_workbook(key_data)
+    key_data_session = get_key_data_session(key_data)
+    display_key_data_workbook(key_data_session)
+    display_depth_search(key_data_session)
+    display_keyword_search(key_data_session)
+    display_soil_classification(key_data_session)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,6 @@
 from enum import Enum, auto
-from dataclasses import dataclass, field
-from typing import Dict, Any, List
+from dataclasses import dataclass, field, replace
+from typing import Dict, Any, FrozenSet, Iterable, List, MutableMapping, Optional, Tuple
 import pandas as pd
 
 class AGSVersion(Enum):
@@ -15,12 +15,84 @@ class AGS4Error:
     line: int
     message: str
 
+# Columns holding the borehole key, in the order they are looked for
+HOLE_KEY_COLUMNS = ("HOLE_ID", "LOCA_ID", "HOLEID")
+
+def hole_key_columns(columns: Iterable[str]) -> List[str]:
+    """Every column of a group holding a hole key, user-defined ones included (AGS3 "?HOLE_ID")."""
+    return [col for col in columns if str(col).lstrip("?") in HOLE_KEY_COLUMNS]
+
+# Hole types the legacy Concat_AGS tool offered to ignore (plus "any type containing RC")
+LEGACY_IGNORED_HOLE_TYPES = ("TP", "GCOP", "IP", "CH", "VC", "ICH", "ROTARY")
+
+@dataclass(frozen=True)
+class HoleFilter:
+    """
+    Row filter applied by the parsers while reading: rows whose hole key is rejected are never stored.
+    `hole_ids` keeps only those holes; `exclude_types` / `exclude_type_contains` drop holes by their
+    HOLE_TYPE (AGS3) or LOCA_TYPE (AGS4), looked up in the file's HOLE/LOCA group.
+    Hole IDs are matched as they appear in the file (before any prefix), types case-insensitively.
+    """
+    hole_ids: Optional[FrozenSet[str]] = None
+    exclude_types: FrozenSet[str] = frozenset()
+    exclude_type_contains: Tuple[str, ...] = ()
+    # Filled in by the parser from the hole types of the file being read
+    exclude_hole_ids: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def create(cls, hole_ids: Optional[Iterable[str]] = None, exclude_types: Iterable[str] = (),
+               exclude_type_contains: Iterable[str] = ()) -> "HoleFilter":
+        return cls(
+            hole_ids=frozenset(h.strip() for h in hole_ids) if hole_ids is not None else None,
+            exclude_types=frozenset(t.strip().upper() for t in exclude_types),
+            exclude_type_contains=tuple(t.strip().upper() for t in exclude_type_contains),
+        )
+
+    @property
+    def filters_types(self) -> bool:
+        return bool(self.exclude_types or self.exclude_type_contains)
+
+    def excludes_type(self, hole_type: Any) -> bool:
+        hole_type = str(hole_type).strip().upper() if isinstance(hole_type, str) else ""
+        return hole_type in self.exclude_types or any(part in hole_type for part in self.exclude_type_contains)
+
+    def resolve(self, hole_table: Optional[pd.DataFrame], id_column: str, type_column: str) -> "HoleFilter":
+        """Copy of the filter that also drops the holes of `hole_table` (HOLE/LOCA) with an excluded type."""
+        if not self.filters_types or hole_table is None or id_column not in hole_table or type_column not in hole_table:
+            return self
+        if "HEADING" in hole_table:
+            # AGS4 tables also hold the UNIT/TYPE rows
+            hole_table = hole_table[hole_table["HEADING"] == "DATA"]
+        excluded = hole_table.loc[hole_table[type_column].map(self.excludes_type), id_column]
+        return replace(self, exclude_hole_ids=self.exclude_hole_ids | frozenset(excluded.astype(str).str.strip()))
+
+    def keeps(self, hole_id: str) -> bool:
+        if self.hole_ids is not None and hole_id not in self.hole_ids:
+            return False
+        return hole_id not in self.exclude_hole_ids
+
+@dataclass
+class AGSDetection:
+    """
+    Result of sniffing the start of an AGS file.
+    `encoding` is what the scanned prefix decodes as ("utf-8", "latin-1", or the UTF-16 codec named
+    by the BOM) and `bom` holds the byte-order mark bytes, so parsers can skip them without decoding again.
+    `confidence` is 1.0 when the version marker is confirmed by the next record, 0.0 when nothing was found.
+    """
+    version: str
+    confidence: float
+    encoding: str
+    bom: bytes = b""
+    bytes_scanned: int = 0
+    lines_scanned: int = 0
+
 @dataclass
 class ParsedAGSFile:
     """Result of parsing an AGS file."""
     filename: str
     version: AGSVersion
-    groups: Dict[str, pd.DataFrame] = field(default_factory=dict)
+    # A plain dict, or a LazyGroups mapping when parsed with lazy=True
+    groups: MutableMapping[str, pd.DataFrame] = field(default_factory=dict)
     errors: List[AGS4Error] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
 
@@ -1,67 +1,294 @@
-from typing import Dict, List, Any
+from functools import partial
+from io import BytesIO
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Mapping, Optional, Set, Tuple
+import numpy as np
 import pandas as pd
 from src.parsing.interface import AGSParser
-from src.domain.models import ParsedAGSFile, AGSVersion
-from src.parsing.utils import split_quoted_csv, normalize_token
+from src.domain.models import ParsedAGSFile, AGSVersion, AGSDetection, HoleFilter, HOLE_KEY_COLUMNS
+from src.parsing.utils import iter_ags_records, normalize_token, sniff_bom, select_columns, ColumnSelection, \
+    DEFAULT_CHUNK_ROWS
+from src.parsing.index import GroupIndex, index_ags3_groups
+from src.parsing.lazy import LazyGroups
+from src.parsing.column_types import BatchColumnTypes, apply_column_types, column_types
+
+# hole id -> whether its rows are kept (see HoleFilter.keeps)
+HoleKeep = Callable[[str], bool]
+
+class _MergedCell:
+    """
+    <CONT> state of one cell of the last row.
+    `chunks` are joined with " | " when the row is finalised; `seen` counts the stripped parts
+    the joined string would split into, and `tail` is its last raw part (the only one a new
+    " | " separator can change), so a merge never re-splits or re-joins the whole cell.
+    """
+    __slots__ = ("chunks", "tail", "seen")
+
+    def __init__(self, prev: str):
+        self.chunks: List[str] = [prev] if prev else []
+        self.seen: Dict[str, int] = {}
+        pieces = prev.split(" | ")
+        self._count(pieces, 1)
+        self.tail = pieces[-1]
+
+    def _count(self, pieces: List[str], step: int):
+        seen = self.seen
+        for p in pieces:
+            if p:
+                key = p.strip()
+                seen[key] = seen.get(key, 0) + step
+
+    def add(self, val: str) -> bool:
+        """Appends `val` unless it is already one of the parts. Returns True if the cell changed."""
+        if self.seen.get(val):
+            return False
+        if self.chunks:
+            self._count([self.tail], -1)
+            pieces = f"{self.tail} | {val}".split(" | ")
+        else:
+            pieces = val.split(" | ")
+        self._count(pieces, 1)
+        self.tail = pieces[-1]
+        self.chunks.append(val)
+        return True
+
+    @property
+    def value(self) -> str:
+        return " | ".join(self.chunks)
+
+
+class _GroupColumns:
+    """
+    Column-oriented row storage for one AGS3 group.
+    Each row is appended straight into per-heading lists; headings missing from a row are padded with NaN.
+    With `keep`, only the headings it accepts are stored (column projection).
+    """
+
+    def __init__(self, keep: Optional[Callable[[str], bool]] = None):
+        self.keep = keep
+        self.columns: Dict[str, List[Any]] = {}
+        self.n_rows = 0
+        self._headings: List[str] = []
+        self._heading_count = 0
+        self._targets: List[List[Any]] = []
+        self._unique = True
+        self._merged: Dict[str, _MergedCell] = {}
+        # Set after a row dropped by the hole filter, so that its <CONT> lines are dropped too
+        self._skipping = False
+        # Heading -> unit, from the group's <UNITS> rows
+        self.units: Dict[str, str] = {}
+
+    def fresh(self) -> "_GroupColumns":
+        """Empty buffer for the next batch of the same group (same projection and units)."""
+        buffer = _GroupColumns(self.keep)
+        buffer.units = self.units
+        return buffer
+
+    def set_units(self, headings: List[str], parts: List[str]):
+        # "<UNITS>" sits in the first heading's place, as <CONT> does
+        for field, unit in zip(headings[1:], parts[1:]):
+            if unit.strip():
+                self.units[field] = unit.strip()
+
+    def _column(self, field: str) -> List[Any]:
+        col = self.columns.get(field)
+        if col is None:
+            col = [np.nan] * self.n_rows
+            self.columns[field] = col
+        return col
+
+    def skip_row(self, headings: List[str], parts: List[str]):
+        """
+        Drops a data row rejected by the hole filter. Its columns are still created, as filtering
+        the finished table would leave them, and the <CONT> lines that follow it are ignored.
+        """
+        if self._merged:
+            self._finish_merges()
+        for field in dict.fromkeys(headings[:len(parts)]):
+            if self.keep is None or self.keep(field):
+                self._column(field)
+        self._skipping = True
+
+    def append_row(self, headings: List[str], parts: List[str]):
+        self._skipping = False
+        if self._merged:
+            self._finish_merges()
+
+        # Headings are replaced or extended in place (Rule 13), so re-resolve the target columns when they change
+        if headings is not self._headings or len(headings) != self._heading_count:
+            self._headings = headings
+            self._heading_count = len(headings)
+            self._targets = []
+            self._unique = len(set(headings)) == len(headings)
+
+        n = min(len(headings), len(parts))
+        if self.keep is not None:
+            n = self._append_projected(headings, parts, n)
+        elif self._unique:
+            targets = self._targets
+            # Columns are created on first use, in heading order, as dict(zip(headings, parts)) would
+            while len(targets) < n:
+                targets.append(self._column(headings[len(targets)]))
+            for col, val in zip(targets, parts):
+                col.append(val)
+        else:
+            # A repeated heading keeps its last value, as in dict(zip(headings, parts))
+            row = dict(zip(headings, parts))
+            n = len(row)
+            for field, val in row.items():
+                self._column(field).append(val)
+
+        self.n_rows += 1
+        if n != len(self.columns):
+            for col in self.columns.values():
+                if len(col) < self.n_rows:
+                    col.append(np.nan)
+
+    def _append_projected(self, headings: List[str], parts: List[str], n: int) -> int:
+        # Same as the paths above, skipping headings `keep` rejects; returns the number of stored fields
+        keep = self.keep
+        if self._unique:
+            targets = self._targets
+            while len(targets) < n:
+                field = headings[len(targets)]
+                targets.append(self._column(field) if keep(field) else None)
+            stored = 0
+            for col, val in zip(targets, parts):
+                if col is not None:
+                    col.append(val)
+                    stored += 1
+            return stored
+        row = {field: val for field, val in zip(headings, parts) if keep(field)}
+        for field, val in row.items():
+            self._column(field).append(val)
+        return len(row)
+
+    def _last_value(self, field: str) -> str:
+        col = self.columns.get(field)
+        if col is None or not isinstance(col[-1], str):
+            return ""
+        return col[-1]
+
+    def merge_last(self, field: str, val: str):
+        """Merges a <CONT> value into the last row, skipping values already present in the cell."""
+        if self._skipping or (self.keep is not None and not self.keep(field)):
+            return
+        cell = self._merged.get(field)
+        if cell is None:
+            cell = self._merged[field] = _MergedCell(self._last_value(field))
+        if cell.add(val):
+            # Create the column now so that column order does not depend on when merges are flushed
+            self._column(field)
+
+    def _finish_merges(self):
+        for field, cell in self._merged.items():
+            if cell.chunks:
+                self.columns[field][-1] = cell.value
+        self._merged = {}
+
+    def to_frame(self) -> pd.DataFrame:
+        if self._merged:
+            self._finish_merges()
+        if not self.n_rows:
+            return pd.DataFrame()
+        if not self.columns:
+            # Every heading projected away: keep the row count
+            return pd.DataFrame(index=pd.RangeIndex(self.n_rows))
+        return pd.DataFrame(self.columns)
+
+
+# Legacy renames, applied to group names and column names
+RENAME_MAP = {
+    "?ETH": "WETH", "?ETH_TOP": "WETH_TOP", "?ETH_BASE": "WETH_BASE",
+    "?ETH_GRAD": "WETH_GRAD", "?LEGD": "LEGD", "?HORN": "HORN","?CNMT_ULIM": "CNMT_ULIM","?CNMT_LBID": "CNMT_LBID","?CONS_CVRT": "CONS_CVRT","CONS_CLVG": "CONS_CLVG","CONS_CVLG": "CONS_CVLG","?CONS_REM": "CONS_REM","?TRIX_CU": "TRIX_CU"
+}
+
+
+def _column_filter(columns: Optional[ColumnSelection], group: str) -> Optional[Callable[[str], bool]]:
+    # Column projection for one group, matched on the renamed column names
+    selected = columns.get(group) if columns else None
+    if selected is None:
+        return None
+    return lambda field: RENAME_MAP.get(field, field) in selected
+
+
+def _renamed_units(buffer: _GroupColumns) -> Dict[str, str]:
+    return {RENAME_MAP.get(field, field): unit for field, unit in buffer.units.items()}
+
+
+def _raw_group_names(index: GroupIndex, wanted: Optional[Set[str]]) -> Dict[str, str]:
+    # Final (renamed) name -> raw group name; when two raw names map to one final name the later group wins
+    raw_names: Dict[str, str] = {}
+    for raw_name in index:
+        final_name = RENAME_MAP.get(raw_name, raw_name)
+        if wanted is None or final_name in wanted:
+            raw_names[final_name] = raw_name
+    return raw_names
+
 
 class AGS3Parser(AGSParser):
     """Parser for legacy AGS3 files."""
 
-    def parse(self, file_content: bytes, filename: str) -> ParsedAGSFile:
-        text = file_content.decode("latin-1", errors="ignore")
-        raw_lines = text.splitlines()
-        
-        group_data: Dict[str, List[Dict[str, str]]] = {}
+    def _read_records(self, records: Iterable[Tuple[int, List[str]]], group_data: Dict[str, _GroupColumns],
+                      columns: Optional[ColumnSelection] = None, keep_hole: Optional[HoleKeep] = None):
+        """
+        Runs the AGS3 rules over tokenized records, filling `group_data`.
+        With `keep_hole`, data rows (and their <CONT> lines) of rejected holes are skipped.
+        """
+        for _ in self._iter_records(records, group_data, columns, keep_hole):
+            pass
+
+    def _iter_records(self, records: Iterable[Tuple[int, List[str]]], group_data: Dict[str, _GroupColumns],
+                      columns: Optional[ColumnSelection] = None, keep_hole: Optional[HoleKeep] = None,
+                      chunk_rows: Optional[int] = None) -> Iterator[str]:
+        """
+        Generator behind `_read_records`. With `chunk_rows`, yields a raw group name whenever that
+        group's buffer holds only finished rows and should be flushed: before a row that would exceed
+        `chunk_rows`, and when a new group section starts. The caller swaps in a new buffer.
+        """
         group_headings: Dict[str, List[str]] = {}
         
         current_group = None
         headings: List[str] = []
         data_started = False
+        # Position of the hole key in `headings` (the last one wins, as in dict(zip(headings, parts)))
+        key_idx = None
+
+        def find_key() -> Optional[int]:
+            if keep_hole is None:
+                return None
+            for key in HOLE_KEY_COLUMNS:
+                if key in headings:
+                    return len(headings) - 1 - headings[::-1].index(key)
+            return None
         
         def ensure_group(name: str):
-            group_data.setdefault(name, [])
+            if name not in group_data:
+                group_data[name] = _GroupColumns(_column_filter(columns, RENAME_MAP.get(name, name)))
 
         def _merge_val(idx: int, val: str):
             if idx >= len(headings): return
-            if not str(val).strip(): return
-            
             val = str(val).strip()
-            field = headings[idx]
-            last_row = group_data[current_group][-1]
-            prev = last_row.get(field, "")
+            if not val: return
             
-            existing_parts = [p.strip() for p in prev.split(" | ") if p]
-            if val not in existing_parts:
-                last_row[field] = f"{prev} | {val}" if prev else val
+            group_data[current_group].merge_last(headings[idx], val)
 
         def append_continuation(parts: List[str]):
-            if not (current_group and headings and group_data[current_group]):
+            if not (current_group and headings and group_data[current_group].n_rows):
                 return
             
             expected_len = len(headings) + 1
             if len(parts) < expected_len:
                 parts = parts + [""] * (expected_len - len(parts))
             
-            # AGS3 Rule: <CONT> is parts[0], parts[1] is variable 1 (headings[1]?? No headers[0]?)
-            # In original code: "parts[0] is <CONT>. parts[1] is Variable 1."
-            # "So parts[1] maps to Headings[1]. No Shift." <- This comment was in original agsparser.py
-            # Wait, if parts[1] maps to Headings[1], what maps to Headings[0]?
-            # Variable 1 usually IS Headings[0]. 
-            # Let's trust the logic: logic was `heading_index = i` where range starts at 1.
-            # So parts[1] -> headings[1]. 
-            # This implies <CONT> lines in AGS3 skip the first key column? 
-            # Actually, standard AGS3 <CONT> usually repeats the key keys. 
-            # I will preserve the original logic exactly as it was.
-            
+            # parts[0] holds <CONT> in the first heading's place, so parts[i] continues headings[i]
+            # (the legacy parser's mapping). Each value is merged into the last row through the cell's
+            # _MergedCell, which skips values the cell already holds without re-splitting it.
             for i in range(1, expected_len):
                 heading_index = i
                 _merge_val(heading_index, parts[i])
 
-        for line in raw_lines:
-            if not line.strip(): continue
-            parts = split_quoted_csv(line)
-            if not parts: continue
-            
+        for _, parts in records:
             keyword = normalize_token(parts[0])
             
             # Handle Continuation
@@ -73,15 +300,22 @@ class AGS3Parser(AGSParser):
                 append_continuation(parts)
                 continue
                 
-            if keyword in ["<UNITS>", "UNIT", "<UNIT>", "PROJ", "ABBR"]:
+            if keyword == "<UNITS>":
+                if current_group and headings:
+                    group_data[current_group].set_units(headings, parts)
+                continue
+            if keyword in ["UNIT", "<UNIT>", "PROJ", "ABBR"]:
                 continue
                 
             # AGS3 Logic
             if keyword.startswith("**"):
+                if chunk_rows and current_group and group_data[current_group].n_rows:
+                    yield current_group
                 current_group = keyword[2:]
                 ensure_group(current_group)
                 headings = []
                 data_started = False
+                key_idx = None
          
                  
                 
@@ -94,38 +328,173 @@ class AGS3Parser(AGSParser):
                     headings = new_headings
                 if current_group:
                     group_headings[current_group] = headings
+                key_idx = find_key()
                     
             elif current_group and headings:
                 data_started = True
-                row_dict = dict(zip(headings, parts[:len(headings)]))
-                group_data[current_group].append(row_dict)
+                if key_idx is not None and not keep_hole(parts[key_idx].strip() if key_idx < len(parts) else ""):
+                    group_data[current_group].skip_row(headings, parts)
+                    continue
+                if chunk_rows and group_data[current_group].n_rows >= chunk_rows:
+                    yield current_group
+                group_data[current_group].append_row(headings, parts)
             
             
+    def _to_frame(self, buffer: _GroupColumns, filename: str, typed: bool = False) -> pd.DataFrame:
+        df = buffer.to_frame()
+        if len(df.index):
+            # Apply legacy renames to columns
+            df = df.rename(columns=RENAME_MAP)
+            if typed:
+                apply_column_types(df, column_types(df.columns, _renamed_units(buffer)))
+            df["SOURCE_FILE"] = filename
+        return df
+
+    def _load_group(self, content: bytes, filename: str, index: GroupIndex, raw_names: Dict[str, str],
+                    columns: Optional[ColumnSelection], keep_hole: Optional[HoleKeep], typed: bool,
+                    name: str) -> pd.DataFrame:
+        """Parses one group from its indexed sections (used by the lazy group mapping)."""
+        raw_name = raw_names[name]
+        group_data: Dict[str, _GroupColumns] = {}
+        for start, end, _ in index[raw_name]:
+            self._read_records(iter_ags_records(content[start:end]), group_data, columns, keep_hole)
+        return self._to_frame(group_data.get(raw_name, _GroupColumns()), filename, typed)
+
+    def _hole_keep(self, file_content: bytes, filename: str, detection: Optional[AGSDetection],
+                   hole_filter: Optional[HoleFilter]) -> Optional[HoleKeep]:
+        """Resolves excluded HOLE_TYPEs to hole ids by parsing only HOLE_ID/HOLE_TYPE of the HOLE group."""
+        if hole_filter is None:
+            return None
+        if hole_filter.filters_types:
+            hole = self.parse(file_content, filename, detection, groups=["HOLE"],
+                              columns={"HOLE": ["HOLE_ID", "HOLE_TYPE"]}).groups.get("HOLE")
+            hole_filter = hole_filter.resolve(hole, "HOLE_ID", "HOLE_TYPE")
+        return hole_filter.keeps
+
+    def parse(self, file_content: bytes, filename: str, detection: Optional[AGSDetection] = None,
+              lazy: bool = False, groups: Optional[Iterable[str]] = None,
+              columns: Optional[Mapping[str, Iterable[str]]] = None,
+              hole_filter: Optional[HoleFilter] = None, typed: bool = False) -> ParsedAGSFile:
+        """
+        Parses an AGS3 file. With `lazy=True` only the group sections are located up front and
+        `groups` is a LazyGroups mapping that parses each group on first access.
+        `groups` / `columns` (group -> column names) limit what is tokenized and stored;
+        names are the output names (after the legacy renames).
+        `hole_filter` skips the rows of unwanted holes (by HOLE_ID, or HOLE_TYPE via the HOLE group)
+        while they are read; groups without a hole key column are kept whole.
+        With `typed=True` columns are converted once here (see `column_types`): floats and dates from
+        the <UNITS> row or the heading dictionary, categoricals for code columns.
+        """
+        keep_hole = self._hole_keep(file_content, filename, detection, hole_filter)
+        wanted = set(groups) if groups is not None else None
+        columns = select_columns(columns)
+
+        # AGS3 text is read as latin-1 after the BOM, unless the BOM says UTF-16
+        bom, encoding = (detection.bom, detection.encoding) if detection else sniff_bom(file_content)
+        if not encoding.startswith("utf-16"):
+            encoding = "latin-1"
+
+        if (lazy or wanted is not None) and encoding == "latin-1":
+            # Only the sections of the requested groups are ever tokenized
+            index = index_ags3_groups(file_content, start=len(bom))
+            raw_names = _raw_group_names(index, wanted)
+            lazy_groups = LazyGroups(
+                list(raw_names),
+                partial(self._load_group, file_content, filename, index, raw_names, columns, keep_hole, typed),
+                source_bytes=len(file_content),
+            )
+            return ParsedAGSFile(
+                filename=filename,
+                version=AGSVersion.AGS3,
+                groups=lazy_groups if lazy else lazy_groups.materialize()
+            )
+
+        if bom:
+            file_content = file_content[len(bom):]
+        group_data: Dict[str, _GroupColumns] = {}
+        self._read_records(iter_ags_records(file_content, encoding), group_data, columns, keep_hole)
+
         # Convert to DataFrames
         final_groups = {}
-        
-        # Define rename map
-        rename_map = {
-            "?ETH": "WETH", "?ETH_TOP": "WETH_TOP", "?ETH_BASE": "WETH_BASE",
-            "?ETH_GRAD": "WETH_GRAD", "?LEGD": "LEGD", "?HORN": "HORN","?CNMT_ULIM": "CNMT_ULIM","?CNMT_LBID": "CNMT_LBID","?CONS_CVRT": "CONS_CVRT","CONS_CLVG": "CONS_CLVG","CONS_CVLG": "CONS_CVLG","?CONS_REM": "CONS_REM","?TRIX_CU": "TRIX_CU"
-        }
-        
-        for gname, rows in group_data.items():
-            df = pd.DataFrame(rows)
-            if not df.empty:
-                # Apply legacy renames to columns
-                df = df.rename(columns=rename_map)
-                df["SOURCE_FILE"] = filename
-            
-            # Rename group name if it exists in rename_map
-            final_group_name = rename_map.get(gname, gname)
-            final_groups[final_group_name] = df
-            
-                
+        for gname, buffer in group_data.items():
+            # Rename group name if it exists in RENAME_MAP
+            final_group_name = RENAME_MAP.get(gname, gname)
+            if wanted is not None and final_group_name not in wanted:
+                continue
+            final_groups[final_group_name] = self._to_frame(buffer, filename, typed)
 
-        
         return ParsedAGSFile(
             filename=filename,
             version=AGSVersion.AGS3,
             groups=final_groups
         )
+
+    def iter_chunks(self, file_content: bytes, filename: str, detection: Optional[AGSDetection] = None,
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS, groups: Optional[Iterable[str]] = None,
+                    columns: Optional[Mapping[str, Iterable[str]]] = None,
+                    hole_filter: Optional[HoleFilter] = None, typed: bool = False) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Streams an AGS3 file as (group name, DataFrame) batches of at most `chunk_rows` rows, in file
+        order. Only one batch is buffered at a time; concatenating the batches of a group gives the
+        table `parse` returns (a group without rows yields one empty frame).
+        `groups`, `columns`, `hole_filter` and `typed` are applied as in `parse`. With `typed=True` each
+        column's conversion is decided once for the whole group, so the file is read twice: once to
+        check every batch, then again to yield them with the same dtypes.
+        """
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be at least 1")
+        keep_hole = self._hole_keep(file_content, filename, detection, hole_filter)
+        batches = self._iter_batches(file_content, filename, detection, chunk_rows, groups, columns, keep_hole)
+        if not typed:
+            yield from ((name, df) for name, df, _ in batches)
+            return
+
+        group_types: Dict[str, BatchColumnTypes] = {}
+        for name, df, units in batches:
+            if name not in group_types:
+                group_types[name] = BatchColumnTypes(column_types(df.columns, units))
+            group_types[name].observe(df)
+        for name, df, _ in self._iter_batches(file_content, filename, detection, chunk_rows, groups, columns, keep_hole):
+            yield name, group_types[name].apply(df)
+
+    def _iter_batches(self, file_content: bytes, filename: str, detection: Optional[AGSDetection], chunk_rows: int,
+                      groups: Optional[Iterable[str]], columns: Optional[Mapping[str, Iterable[str]]],
+                      keep_hole: Optional[HoleKeep]) -> Iterator[Tuple[str, pd.DataFrame, Dict[str, str]]]:
+        """Text batches of `iter_chunks`, with the <UNITS> of their group."""
+        wanted = set(groups) if groups is not None else None
+        columns = select_columns(columns)
+
+        bom, encoding = (detection.bom, detection.encoding) if detection else sniff_bom(file_content)
+        if not encoding.startswith("utf-16"):
+            encoding = "latin-1"
+
+        # Read through a stream rather than slices, so the raw content is never copied
+        source = BytesIO(file_content)
+        source.seek(len(bom))
+        selected = None
+        records = iter_ags_records(source, encoding)
+        if encoding == "latin-1":
+            # Renamed duplicates are resolved as in `parse`; a subset of groups only reads their sections
+            index = index_ags3_groups(file_content, start=len(bom))
+            selected = set(_raw_group_names(index, wanted).values())
+            if len(selected) < len(index):
+                sections = sorted(section for raw_name in selected for section in index[raw_name])
+                records = chain.from_iterable(iter_ags_records(file_content[start:end]) for start, end, _ in sections)
+
+        def is_selected(raw_name: str) -> bool:
+            if selected is not None:
+                return raw_name in selected
+            return wanted is None or RENAME_MAP.get(raw_name, raw_name) in wanted
+
+        group_data: Dict[str, _GroupColumns] = {}
+        emitted = set()
+        for raw_name in self._iter_records(records, group_data, columns, keep_hole, chunk_rows):
+            buffer = group_data[raw_name]
+            group_data[raw_name] = buffer.fresh()
+            if is_selected(raw_name):
+                emitted.add(raw_name)
+                yield RENAME_MAP.get(raw_name, raw_name), self._to_frame(buffer, filename), _renamed_units(buffer)
+
+        for raw_name, buffer in group_data.items():
+            if is_selected(raw_name) and (buffer.n_rows or raw_name not in emitted):
+                yield RENAME_MAP.get(raw_name, raw_name), self._to_frame(buffer, filename), _renamed_units(buffer)
@@ -1,39 +1,176 @@
-from typing import Dict, List
+from functools import partial
+from io import StringIO
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 import pandas as pd
-from python_ags4 import AGS4
 from src.parsing.interface import AGSParser
-from src.domain.models import ParsedAGSFile, AGSVersion, AGS4Error
+from src.parsing.ags4_native import HoleKeep, AGS4FormatError, ags4_to_dataframe, index_ags4_groups, is_utf8, iter_ags4_chunks, \
+    read_ags4_sections, _read_groups
+from src.parsing.index import GroupIndex
+from src.parsing.lazy import LazyGroups
+from src.parsing.column_types import BatchColumnTypes, apply_column_types, column_types, split_descriptor_rows
+from src.parsing.utils import sniff_bom, select_columns, ColumnSelection, DEFAULT_CHUNK_ROWS
+from src.domain.models import ParsedAGSFile, AGSVersion, AGS4Error, AGSDetection, HoleFilter, HOLE_KEY_COLUMNS
+
+try:
+    from python_ags4 import AGS4
+except ImportError:  # optional: the native engine reads AGS4 without it
+    AGS4 = None
+
+AGS4_ENGINES = ("auto", "python_ags4", "native")
+
+
+def _project(df: pd.DataFrame, group: str, columns: Optional[ColumnSelection]) -> pd.DataFrame:
+    selected = columns.get(group) if columns else None
+    if selected is None:
+        return df
+    # drop() gives an independent frame (SOURCE_FILE is assigned to it afterwards)
+    return df.drop(columns=[col for col in df.columns if col != "HEADING" and col not in selected])
+
+
+def _filter_holes(df: pd.DataFrame, keep_hole: Optional[HoleKeep]) -> pd.DataFrame:
+    # python-ags4 builds whole tables, so its DATA rows are filtered afterwards
+    key = next((key for key in HOLE_KEY_COLUMNS if key in df.columns), None)
+    if keep_hole is None or key is None or "HEADING" not in df.columns:
+        return df
+    keep = (df["HEADING"] != "DATA") | df[key].astype(str).str.strip().map(keep_hole)
+    return df if keep.all() else df[keep].reset_index(drop=True)
+
+
+def _typed_table(df: pd.DataFrame) -> pd.DataFrame:
+    # UNIT/TYPE rows decide the column types and are removed, as python_ags4's convert_to_numeric does
+    units, ags_types, df = split_descriptor_rows(df)
+    return apply_column_types(df, column_types(df.columns, units, ags_types))
+
 
 class AGS4Parser(AGSParser):
-    """Parser for AGS4 files using the official python-ags4 library."""
-
-    def parse(self, file_content: bytes, filename: str) -> ParsedAGSFile:
-        # python-ags4 expects a file-like object or path
-        # It handles encoding internally, but usually expects utf-8 or cp1252
-        # We'll pass a StringIO or BytesIO if supported. 
-        # AGS4.AGS4_to_dataframe takes "filepath_or_buffer".
-        
-        # We need to decode first because AGS4_to_dataframe might expect text if passing a StringIO,
-        # or it handles bytes if we pass BytesIO? 
-        # Looking at AGS4.py: `if _is_file_like(filepath_or_buffer):` ...
+    """
+    Parser for AGS4 files.
+    engine="python_ags4" uses the official python-ags4 library, engine="native" tokenizes the raw
+    bytes straight into columns (same tables, no python-ags4 needed). "auto" prefers python-ags4
+    when it is installed.
+    """
+
+    def __init__(self, engine: str = "auto"):
+        if engine not in AGS4_ENGINES:
+            raise ValueError(f"Unknown AGS4 engine '{engine}', expected one of {AGS4_ENGINES}")
+        if engine == "auto":
+            engine = "python_ags4" if AGS4 is not None else "native"
+        elif engine == "python_ags4" and AGS4 is None:
+            raise ImportError("python-ags4 is not installed; use engine='native'")
+        self.engine = engine
+
+    def _read_tables(self, file_content: bytes, detection: Optional[AGSDetection],
+                     columns: Optional[ColumnSelection], keep_hole: Optional[HoleKeep] = None) -> Dict[str, pd.DataFrame]:
+        bom, encoding = (detection.bom, detection.encoding) if detection else sniff_bom(file_content)
+
+        if self.engine == "native":
+            tables, _ = ags4_to_dataframe(file_content, encoding or None, columns, keep_hole)
+            return tables
+
+        # python-ags4 expects a file-like object or path.
         # It seems safer to decode to string and pass StringIO to ensure encoding control.
-        
-        try:
-            text_content = file_content.decode("utf-8")
-        except UnicodeDecodeError:
+        if encoding.startswith("utf-16"):
+            text_content = file_content[len(bom):].decode(encoding)
+        elif encoding == "latin-1":
+            # The detected prefix is already not UTF-8, so the whole file cannot be
             text_content = file_content.decode("latin-1", errors="replace")
-            
-        from io import StringIO
+        else:
+            try:
+                text_content = file_content.decode("utf-8")
+            except UnicodeDecodeError:
+                text_content = file_content.decode("latin-1", errors="replace")
+
         f = StringIO(text_content)
-        
+
+        # get_line_numbers=False, rename_duplicate_headers=True
+        tables, headings = AGS4.AGS4_to_dataframe(f)
+        return {name: _filter_holes(_project(df, name, columns), keep_hole) for name, df in tables.items()}
+
+    def _load_group(self, content: bytes, filename: str, index: GroupIndex, force_latin1: bool,
+                    columns: Optional[ColumnSelection], keep_hole: Optional[HoleKeep], typed: bool,
+                    name: str) -> pd.DataFrame:
+        """Parses one group from its indexed section (used by the lazy group mapping)."""
+        if self.engine == "native":
+            df = read_ags4_sections(content, index[name], force_latin1, columns, keep_hole)
+        else:
+            start, end, _ = index[name][0]
+            text = content[start:end].decode("latin-1" if force_latin1 else "utf-8", errors="replace")
+            tables, _ = AGS4.AGS4_to_dataframe(StringIO(text))
+            df = _filter_holes(_project(tables[name], name, columns), keep_hole)
+        if typed:
+            df = _typed_table(df)
+        df["SOURCE_FILE"] = filename
+        return df
+
+    @staticmethod
+    def _indexable(file_content: bytes, detection: Optional[AGSDetection]) -> Tuple[bytes, bool]:
+        """Content to read by byte offsets, and whether it is read as latin-1."""
+        bom, encoding = (detection.bom, detection.encoding) if detection else sniff_bom(file_content)
+        if encoding.startswith("utf-16"):
+            # Sections are located by byte offsets of "\n", so UTF-16 content is indexed as UTF-8
+            return file_content[len(bom):].decode(encoding).encode("utf-8"), False
+        # Decided once for the whole file, like the full read's UTF-8 -> latin-1 fallback
+        return file_content, encoding == "latin-1" or not is_utf8(file_content)
+
+    def _lazy_groups(self, file_content: bytes, filename: str, detection: Optional[AGSDetection],
+                     groups: Optional[Iterable[str]], columns: Optional[ColumnSelection],
+                     keep_hole: Optional[HoleKeep] = None, typed: bool = False) -> LazyGroups:
+        file_content, force_latin1 = self._indexable(file_content, detection)
+        index = index_ags4_groups(file_content, force_latin1)
+        # Rows before the first GROUP are still checked now, as a full read would
+        first_group = min((sections[0][0] for sections in index.values()), default=len(file_content))
+        _read_groups(file_content[:first_group], force_latin1)
+
+        wanted = set(groups) if groups is not None else None
+        return LazyGroups(
+            [name for name in index if wanted is None or name in wanted],
+            partial(self._load_group, file_content, filename, index, force_latin1, columns, keep_hole, typed),
+            source_bytes=len(file_content),
+        )
+
+    def _hole_keep(self, file_content: bytes, filename: str, detection: Optional[AGSDetection],
+                   hole_filter: Optional[HoleFilter]) -> Optional[HoleKeep]:
+        """Resolves excluded LOCA_TYPEs to hole ids by parsing only LOCA_ID/LOCA_TYPE of the LOCA group."""
+        if hole_filter is None:
+            return None
+        if hole_filter.filters_types:
+            loca = self._lazy_groups(file_content, filename, detection, ["LOCA"],
+                                     select_columns({"LOCA": ["LOCA_ID", "LOCA_TYPE"]})).get("LOCA")
+            hole_filter = hole_filter.resolve(loca, "LOCA_ID", "LOCA_TYPE")
+        return hole_filter.keeps
+
+    def parse(self, file_content: bytes, filename: str, detection: Optional[AGSDetection] = None,
+              lazy: bool = False, groups: Optional[Iterable[str]] = None,
+              columns: Optional[Mapping[str, Iterable[str]]] = None,
+              hole_filter: Optional[HoleFilter] = None, typed: bool = False) -> ParsedAGSFile:
+        """
+        Parses an AGS4 file. With `lazy=True` only GROUP rows are read up front (duplicated groups
+        are still reported) and `groups` is a LazyGroups mapping that parses each group on first
+        access; format errors inside a group then raise when that group is accessed.
+        `groups` / `columns` (group -> column names) limit what is parsed; the other groups are
+        not tokenized (nor checked) and the HEADING column is always kept.
+        `hole_filter` drops the DATA rows of unwanted holes (by LOCA_ID, or LOCA_TYPE via the LOCA group)
+        while the native engine reads them; the python_ags4 engine filters its finished tables.
+        With `typed=True` the UNIT/TYPE rows set the column types (see `column_types`) and are
+        removed from the tables, as python_ags4's convert_to_numeric does.
+        """
+        columns = select_columns(columns)
         try:
-            # get_line_numbers=False, rename_duplicate_headers=True
-            tables, headings = AGS4.AGS4_to_dataframe(f)
-            
+            keep_hole = self._hole_keep(file_content, filename, detection, hole_filter)
+            if lazy or groups is not None:
+                lazy_groups = self._lazy_groups(file_content, filename, detection, groups, columns, keep_hole, typed)
+                return ParsedAGSFile(
+                    filename=filename,
+                    version=AGSVersion.AGS4,
+                    groups=lazy_groups if lazy else lazy_groups.materialize()
+                )
+
+            tables = self._read_tables(file_content, detection, columns, keep_hole)
+
             # Convert to our structure
-            # AGS4 lib returns Dict[str, DataFrame]
-            
             for key in tables:
+                if typed:
+                    tables[key] = _typed_table(tables[key])
                 tables[key]["SOURCE_FILE"] = filename
                 
             return ParsedAGSFile(
@@ -49,3 +186,52 @@ class AGS4Parser(AGSParser):
                 version=AGSVersion.AGS4,
                 errors=[AGS4Error(rule="Parser", line=0, message=str(e))]
             )
+
+    def iter_chunks(self, file_content: bytes, filename: str, detection: Optional[AGSDetection] = None,
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS, groups: Optional[Iterable[str]] = None,
+                    columns: Optional[Mapping[str, Iterable[str]]] = None,
+                    hole_filter: Optional[HoleFilter] = None, typed: bool = False) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Streams an AGS4 file as (group name, DataFrame) batches of at most `chunk_rows` rows; a group's
+        UNIT/TYPE rows come with its first batch. Concatenating the batches of a group gives the table
+        `parse` returns. The native engine holds one batch at a time; python_ags4 reads whole tables,
+        so that engine parses the file and slices the result.
+        Unlike `parse`, format errors are raised, since earlier batches may already have been used.
+        With `typed=True` the UNIT/TYPE rows of a group's first batch type all of its batches, and each
+        column's conversion is decided once for the whole group, so the native engine reads the file twice.
+        """
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be at least 1")
+
+        if self.engine != "native":
+            parsed = self.parse(file_content, filename, detection, groups=groups, columns=columns,
+                                hole_filter=hole_filter, typed=typed)
+            if not parsed.is_valid:
+                raise AGS4FormatError("; ".join(e.message for e in parsed.errors))
+            for name, df in parsed.groups.items():
+                for start in range(0, max(len(df.index), 1), chunk_rows):
+                    yield name, df.iloc[start:start + chunk_rows].reset_index(drop=True)
+            return
+
+        keep_hole = self._hole_keep(file_content, filename, detection, hole_filter)
+        columns = select_columns(columns)
+        file_content, force_latin1 = self._indexable(file_content, detection)
+        sections = None
+        if groups is not None:
+            index = index_ags4_groups(file_content, force_latin1)
+            wanted = set(groups)
+            sections = sorted(section for name in index if name in wanted for section in index[name])
+
+        group_types: Dict[str, BatchColumnTypes] = {}
+        if typed:
+            # Each column's conversion is decided over all batches of its group before any is yielded
+            for name, df in iter_ags4_chunks(file_content, force_latin1, chunk_rows, sections, columns, keep_hole):
+                units, ags_types, df = split_descriptor_rows(df)
+                if name not in group_types:
+                    group_types[name] = BatchColumnTypes(column_types(df.columns, units, ags_types))
+                group_types[name].observe(df)
+        for name, df in iter_ags4_chunks(file_content, force_latin1, chunk_rows, sections, columns, keep_hole):
+            if typed:
+                df = group_types[name].apply(split_descriptor_rows(df)[2])
+            df["SOURCE_FILE"] = filename
+            yield name, df
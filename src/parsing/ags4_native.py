@@ -0,0 +1,311 @@
+import codecs
+import csv
+from operator import itemgetter
+from io import StringIO
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from src.parsing.index import GroupIndex
+from src.parsing.utils import ColumnSelection
+from src.domain.models import HOLE_KEY_COLUMNS
+
+# Size of the raw byte blocks decoded at a time; bounds the transient text copies.
+NATIVE_BLOCK_SIZE = 1 << 20
+
+# hole id -> whether its DATA rows are kept (see HoleFilter.keeps)
+HoleKeep = Callable[[str], bool]
+
+
+class AGS4FormatError(ValueError):
+    """Raised for AGS4 content that cannot be read into tables (mirrors python_ags4's AGS4Error)."""
+
+
+class _RestartAsLatin1(Exception):
+    """Non-ASCII text already decoded as UTF-8 before an invalid byte was found."""
+
+
+def _remove_byte_order_mark(line: str) -> str:
+    # Same stripping as python_ags4 applies to every line
+    return line.encode("utf-8") \
+               .strip(codecs.BOM_UTF8) \
+               .strip(codecs.BOM) \
+               .strip(codecs.BOM_BE) \
+               .strip(codecs.BOM_LE) \
+               .decode("utf-8")
+
+
+def _iter_text_blocks(content: bytes, force_latin1: bool, block_size: int) -> Iterator[str]:
+    """
+    Decodes `content` block by block, each block ending on a newline byte.
+    Text is UTF-8 unless an invalid byte is found, in which case the file is read as latin-1
+    (like decoding the whole file with a fallback). While every block so far was pure ASCII the
+    switch happens in place; otherwise the caller has to start again with `force_latin1`.
+    """
+    view = memoryview(content)
+    size = len(view)
+    encoding = "latin-1" if force_latin1 else "utf-8"
+    all_ascii = True
+    pos = 0
+    while pos < size:
+        end = content.find(b"\n", pos + block_size)
+        end = size if end == -1 else end + 1
+        raw = view[pos:end]
+        if encoding == "utf-8":
+            try:
+                text = str(raw, "utf-8")
+            except UnicodeDecodeError:
+                if not all_ascii:
+                    raise _RestartAsLatin1()
+                encoding = "latin-1"
+        if encoding == "latin-1":
+            text = str(raw, "latin-1", "replace")
+        all_ascii = all_ascii and raw.tobytes().isascii()
+        yield text
+        pos = end
+
+
+def _split_line(line: str) -> List[str]:
+    # Irregular lines: python_ags4's own BOM stripping and csv parsing (line includes its "\\n")
+    return list(csv.reader(StringIO(_remove_byte_order_mark(line)), quotechar='"'))[0]
+
+
+def iter_ags4_records(content: bytes, force_latin1: bool = False, block_size: int = NATIVE_BLOCK_SIZE,
+                      start_line: int = 1) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Yields (line_number, fields) for every line of an AGS4 file, with the fields python_ags4 reads:
+    lines end at "\\n" only, plain `"a","b"` records are split directly and anything else goes
+    through the csv module. Blank lines yield an empty list (they close the current group).
+    """
+    line_no = start_line - 1
+    for block in _iter_text_blocks(content, force_latin1, block_size):
+        lines = block.split("\n")
+        ends_with_newline = lines[-1] == ""
+        if ends_with_newline:
+            lines.pop()
+        last = len(lines) - 1
+        for idx, line in enumerate(lines):
+            line_no += 1
+            core = line[:-1] if line[-1:] == "\r" else line
+            if len(core) >= 2 and core[0] == '"' and core[-1] == '"' \
+                    and core.count('"', 1, -1) == 2 * core.count('","', 1, -1):
+                yield line_no, core[1:-1].split('","')
+                continue
+            if idx < last or ends_with_newline:
+                line += "\n"
+            yield line_no, _split_line(line)
+
+
+def _rename_duplicate_headings(line: List[str]) -> List[str]:
+    # Appends _1, _2, ... to repeated headings, exactly as python_ags4 does
+    item_count: Dict[str, Dict[str, int]] = {}
+    for i, item in enumerate(line):
+        if item not in item_count:
+            item_count[item] = {'i': i, 'count': 0}
+        else:
+            item_count[item]['i'] = i
+            item_count[item]['count'] += 1
+            line[i] = line[i] + '_' + str(item_count[item]['count'])
+    return line
+
+
+def _read_groups(content: bytes, force_latin1: bool, start_line: int = 1,
+                 columns: Optional[ColumnSelection] = None,
+                 keep_hole: Optional[HoleKeep] = None) -> Tuple[Dict[str, List[List[str]]], Dict[str, List[str]]]:
+    """
+    Collects the UNIT/TYPE/DATA records of every group, with the same checks python_ags4 makes.
+    Groups listed in `columns` only keep those fields (plus HEADING); the returned headings are the kept ones.
+    With `keep_hole`, DATA rows of groups keyed by LOCA_ID are dropped as they are read when it returns False.
+    """
+    rows: Dict[str, List[List[str]]] = {}
+    headings: Dict[str, List[str]] = {}
+    for _ in _iter_groups(content, force_latin1, rows, headings, start_line, columns, keep_hole):
+        pass
+    return rows, headings
+
+
+def _iter_groups(content: bytes, force_latin1: bool, rows: Dict[str, List[List[str]]], headings: Dict[str, List[str]],
+                 start_line: int = 1, columns: Optional[ColumnSelection] = None,
+                 keep_hole: Optional[HoleKeep] = None, chunk_rows: Optional[int] = None) -> Iterator[str]:
+    """
+    Generator behind `_read_groups`, filling `rows` / `headings`. With `chunk_rows`, yields a group
+    name when its rows should be flushed: before a row that would exceed `chunk_rows` and when the
+    group ends. The caller takes `rows[group]` and leaves an empty list in its place.
+    """
+    group = None
+    group_rows = None
+    n_fields = 0
+    pick = None
+    key_idx = None
+
+    for line_no, line in iter_ags4_records(content, force_latin1, start_line=start_line):
+        if len(line) == 0:
+            # Blank line: the current group has ended
+            if chunk_rows and group_rows:
+                yield group
+            group = None
+            group_rows = None
+            continue
+
+        keyword = line[0]
+        if keyword == 'DATA' or keyword == 'UNIT' or keyword == 'TYPE':
+            if group_rows is None:
+                raise AGS4FormatError(f"Line {line_no} is not preceded by a GROUP and HEADING row.")
+            if len(line) != n_fields:
+                raise AGS4FormatError(f"Line {line_no} does not have the same number of entries as the HEADING row in {group}.")
+            if key_idx is not None and keyword == 'DATA' and not keep_hole(line[key_idx].strip()):
+                continue
+            if chunk_rows and len(group_rows) >= chunk_rows:
+                yield group
+                group_rows = rows[group]
+            group_rows.append(pick(line) if pick else line)
+
+        elif keyword == 'GROUP':
+            if chunk_rows and group_rows:
+                yield group
+            group = line[1]
+            if group in rows:
+                raise AGS4FormatError(f"{group} group duplicated in Line {line_no}. Cannot parse file without overwriting data, "
+                                      "therefore please combine all duplicate groups first.")
+            rows[group] = []
+            group_rows = None
+
+        elif keyword == 'HEADING':
+            if group is None:
+                raise AGS4FormatError(f"HEADER row in Line {line_no} is not associated with a GROUP. "
+                                      "Please ensure that the GROUP name is defined in the line immediately preceding the HEADER row.")
+            if len(line) != len(set(line)):
+                line = _rename_duplicate_headings(line)
+            n_fields = len(line)
+            pick = None
+            key_idx = None
+            if keep_hole is not None:
+                key_idx = next((line.index(key) for key in HOLE_KEY_COLUMNS if key in line), None)
+            selected = columns.get(group) if columns else None
+            if selected is not None and len(set(line)) == n_fields:
+                keep = [0] + [i for i in range(1, n_fields) if line[i] in selected]
+                # itemgetter returns a bare value for a single index
+                pick = itemgetter(*keep) if len(keep) > 1 else (lambda fields: (fields[0],))
+                line = [line[i] for i in keep]
+            headings[group] = line
+            # A repeated HEADING row starts the group's columns again
+            group_rows = rows[group] = []
+
+
+def _rows_to_frame(headings: List[str], rows: List[List[str]]) -> pd.DataFrame:
+    if not rows:
+        return pd.DataFrame({item: [] for item in headings})
+    if len(set(headings)) != len(headings):
+        # Renaming can still clash with an existing heading (A, A_1, A); python_ags4 fails on these too
+        raise AGS4FormatError("All arrays must be of the same length")
+    # One 2D object block for the whole group instead of one array per column
+    return pd.DataFrame(np.array(rows, dtype=object), columns=headings)
+
+
+def ags4_to_dataframe(content: bytes, encoding: Optional[str] = None,
+                      columns: Optional[ColumnSelection] = None,
+                      keep_hole: Optional[HoleKeep] = None) -> Tuple[Dict[str, pd.DataFrame], Dict[str, List[str]]]:
+    """
+    Native equivalent of python_ags4's `AGS4_to_dataframe` (with duplicate headers renamed),
+    reading the raw bytes block by block and stacking each group's records into a single 2D block.
+    UNIT and TYPE rows are kept as the first rows of each table, as python_ags4 returns them.
+    `encoding` is the detected encoding, if known: "latin-1" skips the UTF-8 attempt and
+    UTF-16 content is transcoded first (lines are split on the "\n" byte).
+    `columns` limits the fields stored per group and `keep_hole` the DATA rows (see `_read_groups`).
+    """
+    if encoding and encoding.startswith("utf-16"):
+        content = content.decode(encoding).encode("utf-8")
+        encoding = "utf-8"
+    try:
+        rows, headings = _read_groups(content, encoding == "latin-1", columns=columns, keep_hole=keep_hole)
+    except _RestartAsLatin1:
+        rows, headings = _read_groups(content, True, columns=columns, keep_hole=keep_hole)
+
+    tables = {group: _rows_to_frame(headings.get(group, []), group_rows) for group, group_rows in rows.items()}
+    return tables, headings
+
+
+def iter_ags4_chunks(content: bytes, force_latin1: bool, chunk_rows: int,
+                     sections: Optional[List[Tuple[int, int, int]]] = None,
+                     columns: Optional[ColumnSelection] = None,
+                     keep_hole: Optional[HoleKeep] = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    Yields (group, DataFrame) batches of at most `chunk_rows` records, holding one batch at a time.
+    `sections` (from `index_ags4_groups`) limits the read to those byte ranges; by default the
+    whole file is read. Rows already yielded are not taken back by a repeated HEADING row, and a
+    group without records yields one empty frame once the read is done.
+    """
+    emitted = set()
+    if sections is None:
+        sections = [(0, len(content), 1)]
+    for start, end, first_line in sections:
+        rows: Dict[str, List[List[str]]] = {}
+        headings: Dict[str, List[str]] = {}
+        for group in _iter_groups(content[start:end], force_latin1, rows, headings, first_line, columns,
+                                  keep_hole, chunk_rows):
+            chunk, rows[group] = rows[group], []
+            emitted.add(group)
+            yield group, _rows_to_frame(headings.get(group, []), chunk)
+        for group, group_rows in rows.items():
+            if group_rows or group not in emitted:
+                emitted.add(group)
+                yield group, _rows_to_frame(headings.get(group, []), group_rows)
+
+
+def is_utf8(content: bytes) -> bool:
+    if content.isascii():
+        return True
+    try:
+        content.decode("utf-8")
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def index_ags4_groups(content: bytes, force_latin1: bool) -> GroupIndex:
+    """
+    Byte ranges of the GROUP sections of an AGS4 file, found by tokenizing only the lines that
+    contain "GROUP". Raises AGS4FormatError for a duplicated group, as a full read would.
+    Lines before the first GROUP row are not indexed.
+    """
+    encoding = "latin-1" if force_latin1 else "utf-8"
+    headers: List[Tuple[int, str, int]] = []
+    seen = set()
+    line_no, counted = 1, 0
+    pos = content.find(b"GROUP")
+    while pos != -1:
+        line_start = content.rfind(b"\n", 0, pos) + 1
+        line_end = content.find(b"\n", pos)
+        line_end = len(content) if line_end == -1 else line_end + 1
+
+        line = _split_line(str(content[line_start:line_end], encoding, "replace"))
+        if line and line[0] == 'GROUP':
+            line_no += content.count(b"\n", counted, line_start)
+            counted = line_start
+            group = line[1]
+            if group in seen:
+                raise AGS4FormatError(f"{group} group duplicated in Line {line_no}. Cannot parse file without overwriting data, "
+                                      "therefore please combine all duplicate groups first.")
+            seen.add(group)
+            headers.append((line_start, group, line_no))
+        pos = content.find(b"GROUP", line_end)
+
+    index: GroupIndex = {}
+    for i, (section_start, group, first_line) in enumerate(headers):
+        section_end = headers[i + 1][0] if i + 1 < len(headers) else len(content)
+        index[group] = [(section_start, section_end, first_line)]
+    return index
+
+
+def read_ags4_sections(content: bytes, sections: List[Tuple[int, int, int]], force_latin1: bool,
+                       columns: Optional[ColumnSelection] = None,
+                       keep_hole: Optional[HoleKeep] = None) -> pd.DataFrame:
+    """Reads one group from its indexed section(s), giving the same table a full read gives."""
+    group_rows: List[List[str]] = []
+    group_headings: List[str] = []
+    for start, end, first_line in sections:
+        rows, headings = _read_groups(content[start:end], force_latin1, start_line=first_line, columns=columns,
+                                      keep_hole=keep_hole)
+        for group, section_rows in rows.items():
+            group_rows = section_rows
+            group_headings = headings.get(group, [])
+    return _rows_to_frame(group_headings, group_rows)
@@ -0,0 +1,219 @@
+import re
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+import pandas as pd
+
+# Column kinds produced by typed parsing; everything else stays as text (object)
+FLOAT = "float"
+DATE = "date"
+CATEGORY = "category"
+
+# (kind, strptime format for dates)
+ColumnType = Tuple[str, Optional[str]]
+
+# AGS4 TYPE codes. Numeric codes are those python_ags4's convert_to_numeric treats as numbers (nDP, nSF, nSCI, MC)
+_AGS4_NUMERIC_TYPE = re.compile(r"DP|MC|SF|SCI")
+AGS4_CODE_TYPES = {"PA", "PT", "PU", "YN"}
+
+# Date formats found in AGS UNIT/<UNITS> rows (matched case-insensitively)
+DATE_FORMATS = {
+    "dd/mm/yyyy": "%d/%m/%Y",
+    "dd/mm/yy": "%d/%m/%y",
+    "yyyy-mm-dd": "%Y-%m-%d",
+    "yyyy-mm-ddthh:mm": "%Y-%m-%dT%H:%M",
+    "yyyy-mm-ddthh:mm:ss": "%Y-%m-%dT%H:%M:%S",
+}
+# Units of time-of-day / elapsed-time columns, kept as text
+TIME_UNITS = {"hhmm", "hhmmss", "hh:mm", "hh:mm:ss"}
+
+# Heading dictionary for columns without a TYPE row or unit (most AGS3 files)
+DEPTH_SUFFIXES = ("_TOP", "_BASE", "_BOT", "_DPTH")
+HEADING_TYPES: Dict[str, ColumnType] = {
+    # Coordinates, levels and final depths
+    "HOLE_NATE": (FLOAT, None), "HOLE_NATN": (FLOAT, None), "HOLE_GL": (FLOAT, None), "HOLE_FDEP": (FLOAT, None),
+    "LOCA_NATE": (FLOAT, None), "LOCA_NATN": (FLOAT, None), "LOCA_GL": (FLOAT, None), "LOCA_FDEP": (FLOAT, None),
+    # SPT N-values
+    "ISPT_NVAL": (FLOAT, None),
+    # Dates
+    "HOLE_STAR": (DATE, "%d/%m/%Y"), "HOLE_ENDD": (DATE, "%d/%m/%Y"), "PROJ_DATE": (DATE, "%d/%m/%Y"),
+    "LOCA_STAR": (DATE, "%Y-%m-%d"), "LOCA_ENDD": (DATE, "%Y-%m-%d"),
+    # Codes
+    "HOLE_TYPE": (CATEGORY, None), "LOCA_TYPE": (CATEGORY, None), "GEOL_LEG": (CATEGORY, None),
+    "GEOL_GEOL": (CATEGORY, None), "GEOL_GEO2": (CATEGORY, None), "SAMP_TYPE": (CATEGORY, None),
+    "WETH_GRAD": (CATEGORY, None),
+}
+
+# A code column becomes categorical only when it repeats its values at least this much
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def _heading_type(heading: str) -> Optional[ColumnType]:
+    if heading in HEADING_TYPES:
+        return HEADING_TYPES[heading]
+    if heading.endswith(DEPTH_SUFFIXES):
+        return (FLOAT, None)
+    return None
+
+
+def _unit_type(unit: str) -> Optional[ColumnType]:
+    unit = unit.strip().lower()
+    if not unit or unit in TIME_UNITS:
+        return None
+    if unit in DATE_FORMATS:
+        return (DATE, DATE_FORMATS[unit])
+    if "dd" in unit or "hh" in unit or "yy" in unit:
+        # Other date/time layouts (e.g. "dd/mm/yyyy ; hhmm") are kept as text
+        return None
+    return (FLOAT, None)
+
+
+def _ags4_type(ags_type: str, unit: str) -> Optional[ColumnType]:
+    if ags_type == "DT":
+        return _unit_type(unit) if unit.strip().lower() in DATE_FORMATS else None
+    if ags_type in AGS4_CODE_TYPES:
+        return (CATEGORY, None)
+    if _AGS4_NUMERIC_TYPE.search(ags_type):
+        return (FLOAT, None)
+    return None
+
+
+def column_types(headings: Iterable[str], units: Optional[Mapping[str, str]] = None,
+                 ags_types: Optional[Mapping[str, str]] = None) -> Dict[str, ColumnType]:
+    """
+    Decides the kind of each heading: from its AGS4 TYPE code when there is one, otherwise from
+    its unit (AGS4 UNIT / AGS3 <UNITS> row), otherwise from the heading dictionary.
+    Headings left out stay as text.
+    """
+    units = units or {}
+    ags_types = ags_types or {}
+    types: Dict[str, ColumnType] = {}
+    for heading in headings:
+        ags_type = (ags_types.get(heading) or "").strip().upper()
+        unit = units.get(heading) or ""
+        if ags_type:
+            kind = _ags4_type(ags_type, unit)
+        else:
+            kind = _unit_type(unit) if unit.strip() else _heading_type(heading)
+        if kind is not None:
+            types[heading] = kind
+    return types
+
+
+def _blank(values: pd.Series) -> pd.Series:
+    return values.isna() | values.astype(str).str.strip().eq("")
+
+
+def _convert(values: pd.Series, kind: str, date_format: Optional[str]) -> Optional[pd.Series]:
+    """Typed copy of `values`, or None when a non-blank value would not survive the conversion."""
+    if kind == CATEGORY:
+        unique = values.nunique(dropna=True)
+        if unique > CATEGORY_MAX_UNIQUE_RATIO * len(values.index):
+            return None
+        return values.astype("category")
+
+    blank = _blank(values)
+    text = values.where(~blank).astype(str).str.strip()
+    if kind == FLOAT:
+        converted = pd.to_numeric(text.where(~blank), errors="coerce").astype("float64")
+    else:
+        converted = pd.to_datetime(text.where(~blank), format=date_format, errors="coerce")
+    if (converted.isna() & ~blank).any():
+        return None
+    return converted
+
+
+def numeric_values(values: pd.Series) -> pd.Series:
+    """
+    Numeric view of a column for depth arithmetic: a typed (numeric) column is returned as it is,
+    a text column is converted with `pd.to_numeric(errors="coerce")`.
+    """
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values
+    return pd.to_numeric(values, errors="coerce")
+
+
+def apply_column_types(df: pd.DataFrame, types: Mapping[str, ColumnType]) -> pd.DataFrame:
+    """
+    Converts the columns listed in `types` in place: floats and dates (blank cells become NaN/NaT)
+    and categoricals for repeated codes. A column is only converted when no value would be lost,
+    so merged " | " values or free text in a numeric column leave it as text.
+    """
+    for col, (kind, date_format) in types.items():
+        if col not in df.columns or df[col].dtype != object or not len(df.index):
+            continue
+        converted = _convert(df[col], kind, date_format)
+        if converted is not None:
+            df[col] = converted
+    return df
+
+
+class BatchColumnTypes:
+    """
+    Column conversions of one group streamed in batches. Each column's conversion is decided once
+    for the whole group: `observe` every batch first, then `apply` gives each batch the dtype
+    `apply_column_types` gives the whole table (or leaves the column as text in every batch).
+    """
+
+    def __init__(self, types: Mapping[str, ColumnType]):
+        self.types = dict(types)
+        self._rows = 0
+        self._lossless = dict.fromkeys(self.types, True)
+        # Category columns keep their distinct values in order of appearance
+        self._uniques: Dict[str, dict] = {col: {} for col, (kind, _) in self.types.items() if kind == CATEGORY}
+        self._dtypes: Optional[Dict[str, object]] = None
+
+    def observe(self, df: pd.DataFrame) -> None:
+        self._rows += len(df.index)
+        for col, (kind, date_format) in self.types.items():
+            if col not in df.columns or not self._lossless[col] or not len(df.index):
+                continue
+            if df[col].dtype != object:
+                self._lossless[col] = False
+            elif kind == CATEGORY:
+                self._uniques[col].update(dict.fromkeys(df[col].dropna().tolist()))
+            else:
+                self._lossless[col] = _convert(df[col], kind, date_format) is not None
+
+    def _decide(self) -> Dict[str, object]:
+        dtypes: Dict[str, object] = {}
+        if not self._rows:
+            return dtypes
+        for col, (kind, _) in self.types.items():
+            if not self._lossless[col]:
+                continue
+            if kind != CATEGORY:
+                dtypes[col] = kind
+            elif len(self._uniques[col]) <= CATEGORY_MAX_UNIQUE_RATIO * self._rows:
+                # Same categories as astype("category") on the whole column
+                dtypes[col] = pd.Series(list(self._uniques[col]), dtype=object).astype("category").dtype
+        return dtypes
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Converts the columns of one batch in place, once every batch has been observed."""
+        if self._dtypes is None:
+            self._dtypes = self._decide()
+        for col, dtype in self._dtypes.items():
+            if col not in df.columns or df[col].dtype != object:
+                continue
+            kind, date_format = self.types[col]
+            df[col] = df[col].astype(dtype) if kind == CATEGORY else _convert(df[col], kind, date_format)
+        return df
+
+
+def split_descriptor_rows(df: pd.DataFrame) -> Tuple[Dict[str, str], Dict[str, str], pd.DataFrame]:
+    """
+    (units, types, data rows) of an AGS4 table as python_ags4 returns it: the UNIT and TYPE rows
+    are read into dicts and removed, like python_ags4's convert_to_numeric does.
+    """
+    if "HEADING" not in df.columns:
+        return {}, {}, df
+    heading = df["HEADING"]
+    units: Dict[str, str] = {}
+    ags_types: Dict[str, str] = {}
+    for row_kind, target in (("UNIT", units), ("TYPE", ags_types)):
+        rows = df.loc[heading == row_kind]
+        if len(rows.index):
+            target.update({col: val for col, val in rows.iloc[0].items() if isinstance(val, str)})
+    descriptors = heading.isin(["UNIT", "TYPE"])
+    if descriptors.any():
+        df = df.loc[~descriptors].reset_index(drop=True)
+    return units, ags_types, df
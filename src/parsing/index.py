@@ -0,0 +1,50 @@
+import re
+from typing import Dict, List, Tuple
+from src.parsing.utils import iter_ags_records, normalize_token
+
+# group name -> [(start byte, end byte, line number of the section's first line), ...] in file order.
+# A group owns several sections when its name appears more than once in the file.
+GroupIndex = Dict[str, List[Tuple[int, int, int]]]
+
+# Characters str.splitlines() breaks on in latin-1 text, i.e. where the AGS3 tokenizer ends a line
+_AGS3_BREAK_BYTES = [bytes([b]) for b in b"\n\r\x0b\x0c\x1c\x1d\x1e\x85"]
+_AGS3_LINE_END = re.compile(b"[\n\r\x0b\x0c\x1c\x1d\x1e\x85]")
+_AGS3_LINE_BREAK = re.compile(b"\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85]")
+
+
+def _sections(headers: List[Tuple[int, str, int]], end: int) -> GroupIndex:
+    index: GroupIndex = {}
+    for i, (section_start, name, line_no) in enumerate(headers):
+        section_end = headers[i + 1][0] if i + 1 < len(headers) else end
+        index.setdefault(name, []).append((section_start, section_end, line_no))
+    return index
+
+
+def index_ags3_groups(content: bytes, start: int = 0) -> GroupIndex:
+    """
+    Byte ranges of the `**GROUP` sections of an AGS3 file (read as latin-1, one byte per character).
+    Only lines containing "**" are tokenized: a line starts a section when its first field is a
+    `**` keyword, exactly as the parser reads it. Lines before the first group are not indexed
+    (the parser ignores them).
+    """
+    headers: List[Tuple[int, str, int]] = []
+    line_no, counted = 1, start
+    searched = start
+    pos = content.find(b"**", start)
+    while pos != -1:
+        # The line holding `pos` starts after the last break since the previous candidate line
+        line_start = max(max(content.rfind(b, searched, pos) for b in _AGS3_BREAK_BYTES) + 1, searched)
+        match = _AGS3_LINE_END.search(content, pos)
+        line_end = match.start() if match else len(content)
+
+        for _, parts in iter_ags_records(content[line_start:line_end]):
+            keyword = normalize_token(parts[0])
+            if keyword.startswith("**"):
+                line_no += len(_AGS3_LINE_BREAK.findall(content, counted, line_start))
+                counted = line_start
+                headers.append((line_start, keyword[2:], line_no))
+
+        searched = line_end
+        pos = content.find(b"**", line_end)
+
+    return _sections(headers, len(content))
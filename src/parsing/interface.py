@@ -1,10 +1,33 @@
-from typing import Protocol, List, Dict
+from typing import Protocol, List, Dict, Iterable, Iterator, Mapping, Optional, Tuple
 import pandas as pd
-from src.domain.models import ParsedAGSFile
+from src.domain.models import ParsedAGSFile, AGSDetection, HoleFilter
+from src.parsing.utils import DEFAULT_CHUNK_ROWS
 
 class AGSParser(Protocol):
     """Interface for AGS file parsers."""
 
-    def parse(self, file_content: bytes, filename: str) -> ParsedAGSFile:
-        """Parses the AGS file content and returns a ParsedAGSFile object."""
+    def parse(self, file_content: bytes, filename: str, detection: Optional[AGSDetection] = None,
+              lazy: bool = False, groups: Optional[Iterable[str]] = None,
+              columns: Optional[Mapping[str, Iterable[str]]] = None,
+              hole_filter: Optional[HoleFilter] = None, typed: bool = False) -> ParsedAGSFile:
+        """
+        Parses the AGS file content and returns a ParsedAGSFile object.
+        `detection` is the result of `detect_ags` on the same content, when the caller already has it.
+        With `lazy=True`, `groups` is a LazyGroups mapping that parses each group on first access.
+        `groups` selects the groups to parse and `columns` maps a group name to the columns to keep
+        (groups not in `columns` keep all of theirs); nothing else is tokenized or stored.
+        `hole_filter` drops the rows of unwanted holes while the file is read.
+        `typed=True` converts depth/numeric columns to floats, dates to datetimes and codes to categoricals.
+        """
+        ...
+
+    def iter_chunks(self, file_content: bytes, filename: str, detection: Optional[AGSDetection] = None,
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS, groups: Optional[Iterable[str]] = None,
+                    columns: Optional[Mapping[str, Iterable[str]]] = None,
+                    hole_filter: Optional[HoleFilter] = None, typed: bool = False) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        Streams the file as (group name, DataFrame) batches of at most `chunk_rows` rows, so callers
+        can process files larger than the memory a full `parse` needs. Concatenating the batches of
+        a group gives the table `parse` would return. Options are the same as for `parse`.
+        """
         ...
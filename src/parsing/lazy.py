@@ -0,0 +1,85 @@
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterator, List
+import pandas as pd
+
+GroupLoader = Callable[[str], pd.DataFrame]
+GroupTransform = Callable[[pd.DataFrame], None]
+
+
+class LazyGroups(MutableMapping):
+    """
+    Group name -> DataFrame mapping that parses a group the first time it is accessed.
+    `load(name)` builds one group from the file's group index. Transforms registered with
+    `add_transform` (e.g. HOLE_ID prefixing) run on loaded groups now and on the others when they load.
+    Loader and transforms must be picklable (module-level functions, partials, bound methods)
+    so parsed files can still be returned from worker processes.
+    """
+
+    def __init__(self, names: List[str], load: GroupLoader, source_bytes: int = 0):
+        self._names = list(names)
+        self._load = load
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._transforms: List[GroupTransform] = []
+        # Size of the raw content kept alive for groups not loaded yet
+        self.source_bytes = source_bytes
+        # Estimated memory of each loaded group, measured once when it is stored
+        self._sizes: Dict[str, int] = {}
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        df = self._frames.get(name)
+        if df is None:
+            if name not in self._names:
+                raise KeyError(name)
+            df = self._load(name)
+            for transform in self._transforms:
+                transform(df)
+            self._store(name, df)
+        return df
+
+    def __setitem__(self, name: str, df: pd.DataFrame):
+        if name not in self._names:
+            self._names.append(name)
+        self._store(name, df)
+
+    def __delitem__(self, name: str):
+        self._names.remove(name)
+        self._frames.pop(name, None)
+        self._sizes.pop(name, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._names))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name) -> bool:
+        return name in self._names
+
+    def __repr__(self) -> str:
+        return f"LazyGroups({len(self._frames)}/{len(self._names)} loaded: {self._names})"
+
+    def _store(self, name: str, df: pd.DataFrame):
+        self._frames[name] = df
+        self._sizes[name] = int(df.memory_usage(index=True, deep=True).sum())
+
+    @property
+    def loaded_bytes(self) -> int:
+        """Estimated memory of the groups loaded so far (grows as groups are accessed)."""
+        return sum(self._sizes.values())
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._frames
+
+    def loaded_items(self):
+        """Groups parsed so far, without loading any others."""
+        return [(name, self._frames[name]) for name in self._names if name in self._frames]
+
+    def add_transform(self, transform: GroupTransform):
+        for name, df in self.loaded_items():
+            transform(df)
+            self._store(name, df)
+        self._transforms.append(transform)
+
+    def materialize(self) -> Dict[str, pd.DataFrame]:
+        """Loads every group and returns them as a plain dict."""
+        return {name: self[name] for name in self._names}
@@ -1,6 +1,16 @@
+import codecs
 import csv
 import io
-from typing import List, Dict
+from itertools import count, repeat
+from typing import List, Dict, Iterable, Iterator, Mapping, Optional, Set, Tuple, Union, BinaryIO
+import numpy as np
+from src.domain.models import AGSDetection
+
+# Size of the decoded text blocks handed to the tokenizer; bounds the transient line copies.
+TOKENIZER_BLOCK_SIZE = 1 << 20
+
+# Default number of rows per DataFrame batch of the streaming `iter_chunks` parsers
+DEFAULT_CHUNK_ROWS = 50_000
 
 def split_quoted_csv(line: str) -> List[str]:
     """
@@ -14,29 +24,182 @@ def split_quoted_csv(line: str) -> List[str]:
     except Exception:
         return []
 
+def _iter_text_blocks(source: Union[str, bytes, BinaryIO], encoding: str, block_size: int) -> Iterator[str]:
+    """
+    Yields decoded text blocks that always end on a newline, so that splitting
+    each block into lines gives the same lines as splitting the whole text.
+    """
+    if isinstance(source, str):
+        start = 0
+        while start < len(source):
+            end = source.find("\n", start + block_size)
+            end = len(source) if end == -1 else end + 1
+            yield source[start:end]
+            start = end
+        return
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+    pending = ""
+    while True:
+        raw = source.read(block_size)
+        final = not raw
+        pending += decoder.decode(raw, final=final)
+        cut = pending.rfind("\n")
+        if final:
+            if pending:
+                yield pending
+            return
+        if cut != -1:
+            yield pending[:cut + 1]
+            pending = pending[cut + 1:]
+
+
+def iter_ags_records(
+    source: Union[str, bytes, BinaryIO],
+    encoding: str = "latin-1",
+    start_line: int = 1,
+    block_size: int = TOKENIZER_BLOCK_SIZE,
+) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Single-pass tokenizer for AGS text.
+    Yields (line_number, fields) for every non-blank line, with exactly the fields
+    `split_quoted_csv` returns for that line (lines it cannot parse are skipped).
+    Accepts decoded text, raw bytes or a binary stream.
+
+    Every line of a block is split as a plain `"a","b",...` record in one pass; the lines that
+    are not plain records (embedded or doubled quotes, unquoted fields, surrounding whitespace,
+    blank lines) are then found for the whole block at once, from per-line quote and field
+    counts, and only those are re-parsed with the csv module.
+    """
+    line_no = start_line
+    for block in _iter_text_blocks(source, encoding, block_size):
+        lines = block.splitlines()
+        n_lines = len(lines)
+        records = [line[1:-1].split('","') for line in lines]
+        # A plain record is quoted at both ends and has no quotes besides its separators
+        plain = (
+            (np.fromiter(map(str.count, lines, repeat('"')), np.int64, n_lines)
+             == 2 * np.fromiter(map(len, records), np.int64, n_lines))
+            & np.fromiter(map(str.startswith, lines, repeat('"')), bool, n_lines)
+            & np.fromiter(map(str.endswith, lines, repeat('"')), bool, n_lines)
+        )
+        for row in np.flatnonzero(~plain).tolist():
+            records[row] = split_quoted_csv(lines[row])
+        # Lines split_quoted_csv cannot parse (blank ones) are left out
+        yield from ((number, parts) for number, parts in zip(count(line_no), records) if parts)
+        line_no += n_lines
+
+
+# Column projection: group name -> column names to keep (groups not listed keep every column)
+ColumnSelection = Dict[str, Set[str]]
+
+
+def select_columns(columns: Optional[Mapping[str, Iterable[str]]]) -> Optional[ColumnSelection]:
+    if not columns:
+        return None
+    # SOURCE_FILE is added by the parsers themselves and is always kept
+    return {group: set(names) | {"SOURCE_FILE"} for group, names in columns.items()}
+
+
 def normalize_token(token: str) -> str:
     if token is None:
         return ""
     return token.strip().strip('"').lstrip("\ufeff").upper()
 
+# Detection looks at the first DETECT_MAX_LINES lines, read from a byte prefix that starts at
+# DETECT_PREFIX_BYTES and grows only when those lines are longer than the prefix.
+DETECT_MAX_LINES = 50
+DETECT_PREFIX_BYTES = 64 * 1024
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+
+
+def sniff_bom(file_bytes: bytes) -> Tuple[bytes, str]:
+    """Returns (bom bytes, encoding it implies), or (b"", "") when the file has no BOM."""
+    for bom, encoding in _BOMS:
+        if file_bytes.startswith(bom):
+            return bom, encoding
+    return b"", ""
+
+
+def detect_ags(file_bytes: bytes, prefix_bytes: int = DETECT_PREFIX_BYTES) -> AGSDetection:
+    """
+    Determines the AGS version from a bounded prefix of the file (never the whole upload).
+    The prefix is widened until it holds DETECT_MAX_LINES complete lines or the whole file.
+    Also reports the BOM and the encoding of the scanned prefix, for the parsers to reuse.
+    """
+    bom, bom_encoding = sniff_bom(file_bytes)
+    body = memoryview(file_bytes)[len(bom):]
+    text_encoding = bom_encoding if bom_encoding.startswith("utf-16") else "latin-1"
+
+    window = max(prefix_bytes, 1)
+    while True:
+        complete = window >= len(body)
+        prefix = body[:window]
+        lines = str(prefix, text_encoding, "ignore").splitlines()
+        # With more lines than needed, the last one inspected cannot be cut by the window
+        if complete or len(lines) > DETECT_MAX_LINES:
+            break
+        window *= 4
+    lines = lines[:DETECT_MAX_LINES]
+
+    encoding = bom_encoding
+    if not encoding:
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(prefix, final=complete)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+
+    version, confidence = "UNKNOWN", 0.0
+    marker_line = None
+    for i, line in enumerate(lines):
+        s = line.strip()
+        if not s: continue
+
+        if marker_line is None:
+            # Check for AGS4 GROUP tag
+            if s.startswith('"GROUP"') or s.startswith("GROUP"):
+                version = "AGS4"
+            # Check for AGS3 ** tag
+            elif s.startswith('"**') or s.startswith("**"):
+                version = "AGS3"
+            else:
+                continue
+            marker_line = i
+            confidence = 0.75 if s.startswith('"') else 0.5
+            continue
+
+        # The record after the marker should be the group's headings
+        if version == "AGS4" and s.startswith('"HEADING"'):
+            confidence = 1.0
+        elif version == "AGS3" and s.startswith('"*') and not s.startswith('"**'):
+            confidence = 1.0
+        break
+
+    return AGSDetection(
+        version=version,
+        confidence=confidence,
+        encoding=encoding,
+        bom=bom,
+        bytes_scanned=len(prefix) + len(bom),
+        lines_scanned=len(lines),
+    )
+
+
 def detect_ags_version(file_bytes: bytes) -> str:
     """
     Quickly scans the file to determine AGS version.
     Returns "AGS3", "AGS4", or "UNKNOWN".
     """
     try:
-        content = file_bytes.decode("latin-1", errors="ignore")
-        lines = content.splitlines()[:50]
-        for line in lines:
-            s = line.strip()
-            if not s: continue
-            
-            # Check for AGS4 GROUP tag
-            if s.startswith('"GROUP"') or s.startswith("GROUP"):
-                return "AGS4"
-            # Check for AGS3 ** tag
-            if s.startswith('"**') or s.startswith("**"):
-                return "AGS3"
+        return detect_ags(file_bytes).version
     except Exception:
-        pass
-    return "UNKNOWN"
+        return "UNKNOWN"
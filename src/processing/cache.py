@@ -0,0 +1,93 @@
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from src.domain.models import ParsedAGSFile, HoleFilter
+from src.parsing.lazy import LazyGroups
+
+CacheKey = Tuple[str, str, str, bool, Optional[HoleFilter], bool, bool]
+
+
+def estimate_parsed_size(parsed_file: ParsedAGSFile) -> int:
+    """
+    Approximate in-memory size (bytes) of all group DataFrames of a parsed file.
+    Lazy groups count the raw content they keep plus the groups loaded so far.
+    """
+    groups = parsed_file.groups
+    if isinstance(groups, LazyGroups):
+        return groups.source_bytes + groups.loaded_bytes
+    return sum(int(df.memory_usage(index=True, deep=True).sum()) for df in groups.values())
+
+
+class ParseCache:
+    """
+    LRU cache of parse results, bounded by the estimated memory of the cached DataFrames.
+
+    Entries are keyed by (content hash, filename, version mode, prefix flag, hole filter, typed flag, lazy flag)
+    so that unchanged uploads are not re-parsed when Streamlit re-runs the script.
+    Lazy entries grow as their groups are loaded, so they are re-measured each time they are read.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._entries: "OrderedDict[CacheKey, Tuple[ParsedAGSFile, int]]" = OrderedDict()
+
+    @staticmethod
+    def make_key(content: bytes, filename: str, version: str, needs_prefix: bool,
+                 hole_filter: Optional[HoleFilter] = None, typed: bool = False, lazy: bool = False) -> CacheKey:
+        # The filename is part of the key because it feeds SOURCE_FILE and the HOLE_ID prefix
+        digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+        return (digest, filename, version, needs_prefix, hole_filter, typed, lazy)
+
+    def get(self, key: CacheKey) -> Optional[ParsedAGSFile]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        parsed_file = entry[0]
+        if isinstance(parsed_file.groups, LazyGroups):
+            # Groups loaded since the entry was stored count now
+            self._store(key, parsed_file, estimate_parsed_size(parsed_file))
+        else:
+            self._entries.move_to_end(key)
+        return parsed_file
+
+    def put(self, key: CacheKey, parsed_file: ParsedAGSFile) -> None:
+        self._store(key, parsed_file, estimate_parsed_size(parsed_file))
+
+    def _store(self, key: CacheKey, parsed_file: ParsedAGSFile, size: int) -> None:
+        """Stores the entry as the most recently used and evicts the least recently used ones over budget."""
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            # Larger than the whole budget: caching it would evict everything else
+            return
+        self._entries[key] = (parsed_file, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: CacheKey) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "bytes": self.current_bytes,
+        }
@@ -1,7 +1,11 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Tuple
-from src.domain.models import ParsedAGSFile
+from pandas.api.types import union_categoricals
+from typing import List, Dict, FrozenSet, Hashable, Set, Tuple, Iterable, Optional
+from src.domain.models import ParsedAGSFile, HOLE_KEY_COLUMNS
+from src.parsing.column_types import numeric_values
+from src.processing.keys import KeyDictionary, SharedKeys, encode_keys
+from src.processing.depth_index import DepthIndex
 import io
 
 
@@ -9,149 +13,438 @@ def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [str(col).upper().strip() for col in df.columns]
     return df
 
-def drop_singleton_rows(df: pd.DataFrame) -> pd.DataFrame:
+def _filled_codes(codes: np.ndarray, values) -> np.ndarray:
+    # codes index `values` (-1 for missing); each distinct value is checked for blank text once
+    blank = np.fromiter((isinstance(v, str) and not v.strip() for v in values), dtype=bool, count=len(values))
+    if not blank.any():
+        return codes >= 0
+    return (codes >= 0) & ~blank[np.maximum(codes, 0)]
+
+
+def _filled(values: pd.Series) -> np.ndarray:
+    """Cells of one column that are neither missing nor blank text (whitespace only)."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return _filled_codes(values.cat.codes.to_numpy(), values.cat.categories)
+    if values.dtype != object:
+        return values.notna().to_numpy()
+    codes, uniques = pd.factorize(values)
+    return _filled_codes(codes, uniques)
+
+
+def drop_singleton_rows(df: pd.DataFrame, non_blank: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    Drops rows with fewer than 2 filled cells (not missing, not blank text), e.g. rows holding only
+    their SOURCE_FILE. Cells are counted column by column; columns in `non_blank` are counted as
+    filled without being inspected, and counting stops once every row is known to be kept.
+    """
     if df.empty:
         return df
-    # Modern pandas: replace empty strings with NaN, then check count
-    clean = df.replace(r"^\s*$", np.nan, regex=True).infer_objects(copy=False)
-    # Require at least 2 non-null values (assuming FILE_SOURCE is 1)
-    nn = clean.notna().sum(axis=1)
-    return df.loc[nn > 1].reset_index(drop=True)
+    kept = _kept_rows(df, non_blank)
+    return df.reset_index(drop=True) if kept is None else df.loc[kept].reset_index(drop=True)
+
+
+def _kept_rows(df: pd.DataFrame, non_blank: Iterable[str] = ()) -> Optional[np.ndarray]:
+    # Mask of the rows drop_singleton_rows keeps, or None when it keeps them all
+    non_blank = set(non_blank)
+    known = [col in non_blank for col in df.columns]
+    counts = np.full(len(df.index), min(sum(known), 2), dtype=np.int8)
+    for i, skip in enumerate(known):
+        if (counts > 1).all():
+            return None
+        if not skip:
+            counts += _filled(df.iloc[:, i]) & (counts < 2)
+    return counts > 1
+
+# Separator of the values merged from AGS3 <CONT> lines
+CONT_SEPARATOR = " | "
+
+
+def _split_cells(values: pd.Series) -> Tuple[np.ndarray, List[List[str]]]:
+    """Row positions of the text cells of one column holding CONT_SEPARATOR, and their parts."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        if categories.dtype != object:
+            return np.empty(0, dtype=np.intp), []
+        split_categories = np.array([isinstance(c, str) and CONT_SEPARATOR in c for c in categories], dtype=bool)
+        if not split_categories.any():
+            return np.empty(0, dtype=np.intp), []
+        codes = values.cat.codes.to_numpy()
+        mask = (codes >= 0) & split_categories[np.maximum(codes, 0)]
+    elif values.dtype == object:
+        try:
+            mask = values.str.contains(CONT_SEPARATOR, regex=False, na=False).to_numpy(dtype=bool)
+        except AttributeError:
+            # No text in the column (.str is only available when it holds strings)
+            return np.empty(0, dtype=np.intp), []
+    else:
+        return np.empty(0, dtype=np.intp), []
+    positions = np.flatnonzero(mask)
+    return positions, [str(v).split(CONT_SEPARATOR) for v in values.to_numpy()[positions]]
+
 
 def expand_rows(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Optimized expansion of rows with | separators using explode.
+    Expands rows whose text cells hold " | " separated values (merged <CONT> lines) into one row per part.
+    A row whose split cells only repeat one value each (e.g. "A | A") is kept once with that value.
+    Otherwise it becomes as many rows as its longest split; cells with fewer parts, and cells that
+    were not split, are "" in the added rows. Splitting is done per column, only on the split cells;
+    `df` itself is returned when no cell holds a separator.
     """
     if df.empty:
         return df
 
-    # 1. Identify columns that contain separators
-    # We only care about string columns
-    str_cols = df.select_dtypes(include=['object']).columns
-    
-    # 2. Check if expansion is needed at all (fast check)
-    needs_expansion = False
-    for col in str_cols:
-        if df[col].astype(str).str.contains(r'\|').any():
-            needs_expansion = True
-            break
-            
-    if not needs_expansion:
+    n = len(df.index)
+    splits = {}
+    row_len = np.ones(n, dtype=np.int64)
+    varied = np.zeros(n, dtype=bool)
+    for i in range(len(df.columns)):
+        positions, parts = _split_cells(df.iloc[:, i])
+        if not len(positions):
+            continue
+        splits[i] = (positions, parts)
+        lengths = np.fromiter((len(p) for p in parts), dtype=np.int64, count=len(parts))
+        np.maximum.at(row_len, positions, lengths)
+        varied[positions[[len(set(p)) > 1 for p in parts]]] = True
+    if not splits:
         return df
 
-    # 3. Split all columns by separator
-    # This might be memory intensive for huge DFs but much faster than iterrows
-    expanded = df.copy()
-    for col in df.columns:
-        if col in str_cols:
-            # Split by " | "
-            expanded[col] = expanded[col].astype(str).str.split(r' \| ')
-        else:
-            # Wrap non-string/numeric cols in list for uniformity if they don't split?
-            # Actually explode allows mixing lists and scalars, but for proper alignment
-            # we typically want everything to be list-like or scalar.
-            # However, AGS logic implies if a cell is NOT split, it repeats?
-            # Or does it imply that if one col splits, ALL must split?
-            # Original code: checks if ALL columns split into same length. 
-            pass
-
-    # The logic in original cleaners.py was complex:
-    # "skip expansion if all split values across columns are identical"
-    # That part is specific. Let's replicate the intent but faster.
-    
-    # Actually, the original loop was:
-    # for each row:
-    #   split available fields
-    #   if all fields repeat same value (e.g. "A|A|A", "B|B|B"): keep single row
-    #   else: explode
-    
-    # Vectorized approach for "all components identical" is hard. 
-    # But strictly speaking, standard pandas `explode` repeats scalars.
-    # If we split column A into [A1, A2] and column B is scalar B, explode(A) gives (A1, B), (A2, B).
-    # AGS "Continuation" usually implies aligned lists. [A1, A2] and [B1, B2].
-    
-    # Let's take a safe middle ground: 
-    # For now, we use a robust row-based generator but simpler than iterrows,
-    # OR we assume standard AGS expansion where all lists are same length.
-    
-    # Let's stick to the safe row-iteration for the unique "deduplication" logic 
-    # but clean it up.
-    
-    # Actually, let's use the provided improvement idea:
-    # If we split into lists, we can explode all columns.
-    
-    rows = []
-    for row in df.to_dict('records'):
-        # Split all values
-        split_data = {}
-        max_len = 1
-        
-        for k, v in row.items():
-            if isinstance(v, str) and " | " in v:
-                parts = v.split(" | ")
-                split_data[k] = parts
-                max_len = max(max_len, len(parts))
-            else:
-                split_data[k] = [v]
-        
-        # Check if all split lists are effectively "same value" 
-        # (Original logic: "all_same")
-        # If all effective lists (length > 1) contain only identical elements?
-        # No, the original logic was:
-        # unique_values_per_col = {col: set(vals) for col...}
-        # if all cols have len(set) == 1: don't expand (just take first)
-        
-        is_redundant = True
-        if max_len > 1:
-            for k, parts in split_data.items():
-                if len(parts) > 1 and len(set(parts)) > 1:
-                    is_redundant = False
-                    break
-        
-        if is_redundant and max_len > 1:
-            # Just take the first element of each
-            new_row = {k: v[0] for k, v in split_data.items()}
-            rows.append(new_row)
-        else:
-            # Expand
-            for i in range(max_len):
-                new_row = {}
-                for k, v in split_data.items():
-                    # If list is shorter, take last value? Or empty?
-                    # Original code: "if i < len... else ''"
-                    val = v[i] if i < len(v) else ""
-                    new_row[k] = val
-                rows.append(new_row)
-                
-    return pd.DataFrame(rows)
-
-def combine_files(parsed_files: List[ParsedAGSFile]) -> Dict[str, pd.DataFrame]:
+    # Rows kept once take one output row, the others one per part of their longest split
+    reps = np.where(varied, row_len, 1)
+    starts = np.concatenate(([0], np.cumsum(reps)[:-1]))
+    source_rows = np.repeat(np.arange(n), reps)
+    added = np.arange(len(source_rows)) - np.repeat(starts, reps) > 0
+
+    columns = {}
+    for i, col in enumerate(df.columns):
+        out = np.asarray(df.iloc[:, i].astype(object).to_numpy(), dtype=object)[source_rows]
+        out[added] = ""
+        if i in splits:
+            positions, parts = splits[i]
+            lengths = np.fromiter((len(p) if varied[row] else 1 for row, p in zip(positions, parts)),
+                                  dtype=np.int64, count=len(parts))
+            # Part k of a cell goes to the k-th output row of its source row
+            targets = np.repeat(starts[positions], lengths) + (
+                np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+            out[targets] = [part for row, p in zip(positions, parts) for part in (p if varied[row] else p[:1])]
+        columns[col] = out
+
+    # Column types are inferred from the values again, as building the frame from records does
+    return pd.DataFrame(columns).infer_objects()
+
+# "aligned" stacks each group's columns straight from the parsed frames; "concat" copies and
+# normalizes every frame and leaves the alignment to pd.concat (the previous behaviour)
+COMBINE_ENGINES = ("aligned", "concat")
+
+# Columns re-encoded by encode_keys, whose categoricals only need common categories
+_KEY_COLUMNS = ("SOURCE_FILE",) + HOLE_KEY_COLUMNS
+
+
+def _prepared(filename: str, df: pd.DataFrame) -> pd.DataFrame:
+    # Ensure separate copy and add filename
+    clean_df = normalize_columns(df.copy())
+    if "SOURCE_FILE" not in clean_df.columns:
+        clean_df["SOURCE_FILE"] = filename
+    return clean_df
+
+
+def _same_dtype(a, b) -> bool:
+    # Unordered categoricals compare equal with their categories in any order; their codes do not
+    if isinstance(a, pd.CategoricalDtype) and isinstance(b, pd.CategoricalDtype):
+        return a.ordered == b.ordered and a.categories.equals(b.categories)
+    return a == b
+
+
+def _common_dtype(pieces: List[Optional[pd.Series]]):
+    """The dtype shared by every present piece, or None when they differ."""
+    present = [piece for piece in pieces if piece is not None]
+    dtype = present[0].dtype
+    return dtype if all(_same_dtype(piece.dtype, dtype) for piece in present) else None
+
+
+def _stack_column(name: str, pieces: List[Optional[pd.Series]], lengths: List[int], out: Optional[np.ndarray] = None):
+    """
+    One combined column from the column of each frame (None where a frame lacks it), with the
+    values and dtype pd.concat gives: missing pieces are NaN and do not count towards the dtype.
+    Plain numpy columns are written into `out` when it is given.
+    """
+    dtype = _common_dtype(pieces)
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes = [piece.cat.codes.to_numpy() if piece is not None else np.full(n, -1, dtype=np.int8)
+                 for piece, n in zip(pieces, lengths)]
+        return pd.Categorical.from_codes(np.concatenate(codes), dtype=dtype)
+    if isinstance(dtype, np.dtype) and dtype.kind in "OfMm":
+        fill = np.nan if dtype.kind in "Of" else dtype.type("NaT")
+        return np.concatenate([piece.to_numpy() if piece is not None else np.full(n, fill, dtype=dtype)
+                               for piece, n in zip(pieces, lengths)], out=out)
+    present = [piece for piece in pieces if piece is not None]
+    if (name in _KEY_COLUMNS and len(present) == len(pieces)
+            and all(isinstance(piece.dtype, pd.CategoricalDtype) and not piece.cat.ordered for piece in present)):
+        # e.g. key columns of frames already encoded by encode_keys with other dictionaries
+        return union_categoricals(present)
+    # Mixed dtypes: let pandas decide, one column at a time
+    frames = [piece.to_frame(name) if piece is not None else pd.DataFrame(index=pd.RangeIndex(n))
+              for piece, n in zip(pieces, lengths)]
+    return pd.concat(frames, ignore_index=True)[name].array
+
+
+def _stack_group(frames: List[Tuple[str, pd.DataFrame]]) -> pd.DataFrame:
+    """
+    The frames of one group stacked on the union of their (normalized) columns, in first-seen order.
+    Each combined column is built once from the frames' own arrays; the frames are not copied, and
+    the text columns are written straight into the single object block of the result.
+    """
+    names = [[str(col).upper().strip() for col in df.columns] for _, df in frames]
+    if any(len(set(cols)) != len(cols) for cols in names):
+        # Repeated headings cannot be aligned by name
+        return pd.concat([_prepared(filename, df) for filename, df in frames], ignore_index=True)
+
+    schema: Dict[str, List[Optional[pd.Series]]] = {}
+    for i, ((filename, df), cols) in enumerate(zip(frames, names)):
+        for col, (_, values) in zip(cols, df.items()):
+            schema.setdefault(col, [None] * len(frames))[i] = values
+        if "SOURCE_FILE" not in cols:
+            schema.setdefault("SOURCE_FILE", [None] * len(frames))[i] = pd.Series(
+                np.full(len(df.index), filename, dtype=object))
+
+    lengths = [len(df.index) for _, df in frames]
+    text = [col for col, pieces in schema.items() if _common_dtype(pieces) == np.dtype(object)]
+    block = np.empty((len(text), sum(lengths)), dtype=object)
+    for row, col in zip(block, text):
+        _stack_column(col, schema[col], lengths, out=row)
+    merged = pd.DataFrame(block.T, columns=text, dtype=object, copy=False)
+    text = set(text)
+    for position, (col, pieces) in enumerate(schema.items()):
+        if col not in text:
+            merged.insert(position, col, _stack_column(col, pieces, lengths))
+    return merged
+
+
+def combine_files(parsed_files: List[ParsedAGSFile], groups: Optional[Iterable[str]] = None,
+                  keys: Optional[SharedKeys] = None, engine: str = "aligned") -> Dict[str, pd.DataFrame]:
     """
     Combines parsed files into a single dictionary of DataFrames (Groups).
+    `groups` restricts the result to those group names (other lazy groups are not parsed).
+    SOURCE_FILE and the hole key columns come back as categoricals coded by `keys`, shared by all
+    groups (pass the same SharedKeys to keep codes comparable across calls).
+    `engine` is one of COMBINE_ENGINES; both give the same tables.
     """
-    combined: Dict[str, List[pd.DataFrame]] = {}
+    if engine not in COMBINE_ENGINES:
+        raise ValueError(f"Unknown combine engine '{engine}', expected one of {COMBINE_ENGINES}")
+    keys = keys if keys is not None else SharedKeys()
+    combined: Dict[str, List[Tuple[str, pd.DataFrame]]] = {}
+    wanted = set(groups) if groups is not None else None
     
     for pfile in parsed_files:
-        for group_name, df in pfile.groups.items():
+        for group_name in pfile.groups:
+            if wanted is not None and group_name not in wanted: continue
+            df = pfile.groups[group_name]
             if df.empty: continue
-            
-            # Ensure separate copy and add filename
-            clean_df = df.copy()
-            clean_df = normalize_columns(clean_df)
-            
-            if "SOURCE_FILE" not in clean_df.columns:
-                 clean_df["SOURCE_FILE"] = pfile.filename
-                 
-            combined.setdefault(group_name, []).append(clean_df)
+            combined.setdefault(group_name, []).append((pfile.filename, df))
             
     # Concat and specific cleaning
-    result = {}
-    for group_name, dfs in combined.items():
-        merged = pd.concat(dfs, ignore_index=True)
-        merged = drop_singleton_rows(merged)
-        result[group_name] = merged
-        
-    return result
+    return {group_name: _combine_frames(frames, keys, engine) for group_name, frames in combined.items()}
+
+
+def _combine_frames(frames: List[Tuple[str, pd.DataFrame]], keys: SharedKeys, engine: str = "aligned") -> pd.DataFrame:
+    """One combined group from its (filename, frame) pairs."""
+    return _combine_counted(frames, keys, engine)[0]
+
+
+def _combine_counted(frames: List[Tuple[str, pd.DataFrame]], keys: SharedKeys,
+                     engine: str = "aligned") -> Tuple[pd.DataFrame, np.ndarray]:
+    """`_combine_frames`, plus the number of rows each frame keeps in the combined group."""
+    if engine == "aligned":
+        merged = _stack_group(frames)
+    else:
+        merged = pd.concat([_prepared(filename, df) for filename, df in frames], ignore_index=True)
+    bounds = np.cumsum([0] + [len(df.index) for _, df in frames])
+    kept = _kept_rows(merged, non_blank=["SOURCE_FILE"]) if len(merged.index) else None
+    if kept is None:
+        return encode_keys(merged.reset_index(drop=True), keys), np.diff(bounds)
+    # Singleton rows are dropped row by row, so each frame loses its own
+    kept_before = np.concatenate([[0], np.cumsum(kept)])
+    return encode_keys(merged.loc[kept].reset_index(drop=True), keys), np.diff(kept_before[bounds])
+
+
+def _frame_schema(df: pd.DataFrame) -> List[Tuple[str, object]]:
+    # (normalized column, dtype) pairs a parsed frame contributes to its combined group
+    schema = [(str(col).upper().strip(), dtype) for col, dtype in df.dtypes.items()]
+    if "SOURCE_FILE" not in (col for col, _ in schema):
+        schema.append(("SOURCE_FILE", np.dtype(object)))
+    return schema
+
+
+def _keeps_dtypes(merged: pd.DataFrame, df: pd.DataFrame) -> bool:
+    """Whether appending a parsed frame to a combined group leaves the dtypes of its columns unchanged."""
+    return all(col in _KEY_COLUMNS or col not in merged.columns or _same_dtype(merged[col].dtype, dtype)
+               for col, dtype in _frame_schema(df))
+
+
+class CombinedStore:
+    """
+    Combined groups kept up to date as parsed files are added or removed, instead of re-running
+    `combine_files` over every file. Only the groups of the added/removed file are touched.
+
+    Each group remembers the row range of every file, so removing a file slices its rows out;
+    the group is only rebuilt from the remaining files when the removal changes its columns or
+    their dtypes. Files added together are combined once per group and appended after the stored ones. `groups` always matches `combine_files(store.files, keys=store.keys)`, except that
+    the key categoricals may keep categories of removed files (codes are never reused).
+    Files are stored under a key per upload, so files sharing a name are kept apart.
+    """
+
+    def __init__(self, keys: Optional[SharedKeys] = None):
+        self.keys = keys if keys is not None else SharedKeys()
+        self._files: Dict[Hashable, ParsedAGSFile] = {}
+        self._groups: Dict[str, pd.DataFrame] = {}
+        # group -> entry key -> (start, stop) rows of the combined group, in file order
+        self._ranges: Dict[str, Dict[Hashable, Tuple[int, int]]] = {}
+        # group -> entry key -> the (column, dtype) pairs the file's frame contributes (filled on first use)
+        self._schemas: Dict[str, Dict[Hashable, List[Tuple[str, object]]]] = {}
+
+    @property
+    def files(self) -> List[ParsedAGSFile]:
+        return list(self._files.values())
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._files
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    @property
+    def groups(self) -> Dict[str, pd.DataFrame]:
+        """Combined groups, in first-seen order across the files (as `combine_files` returns them)."""
+        names: Dict[str, None] = {}
+        for key, pfile in self._files.items():
+            names.update((name, None) for name in pfile.groups if key in self._ranges.get(name, ()))
+        return {name: self._groups[name] for name in names}
+
+    def row_range(self, group_name: str, key: Hashable) -> Tuple[int, int]:
+        """(start, stop) rows of the entry `key` in the combined `group_name`."""
+        return self._ranges[group_name][key]
+
+    def add(self, key: Hashable, parsed_file: ParsedAGSFile) -> None:
+        """
+        Appends the file's rows to its groups under `key` (an entry already stored under `key` is
+        replaced). Keys identify uploads, not file names: two files with the same name need two keys.
+        """
+        if key in self._files:
+            self.remove(key)
+        self._append([(key, parsed_file)])
+
+    def remove(self, key: Hashable) -> None:
+        """Removes the rows of the entry `key` from its groups."""
+        if key not in self._files:
+            raise KeyError(key)
+        self._drop({key})
+
+    def sync(self, entries: Dict[Hashable, ParsedAGSFile]) -> None:
+        """
+        Adds and removes entries so that the store holds `entries` (key -> parsed file) in their
+        order, such as one entry per upload keyed by its ParseCache key. An entry whose ParsedAGSFile
+        object changed (e.g. parsed again with other options) is replaced. Entries are kept up to the
+        first position that differs from `entries`; the rest are dropped and added again in one pass
+        per group, so the groups match `combine_files(list(entries.values()))`.
+        """
+        kept = [key for key, pfile in self._files.items() if entries.get(key) is pfile]
+        wanted = list(entries)
+        first = next((i for i, (key, other) in enumerate(zip(kept, wanted)) if key != other), min(len(kept), len(wanted)))
+        stale = set(self._files) - set(kept[:first])
+        if stale:
+            self._drop(stale)
+        if first < len(wanted):
+            self._append([(key, entries[key]) for key in wanted[first:]])
+
+    def _drop(self, keys: Set[Hashable]) -> None:
+        # Slices the rows of `keys` out of their groups in one take per group
+        for group_name, ranges in list(self._ranges.items()):
+            if not any(key in ranges for key in keys): continue
+            removed = [pair for key in keys if key in ranges for pair in self._schema(group_name, key)]
+            for key in keys:
+                self._schemas[group_name].pop(key, None)
+            spans = {key: span for key, span in ranges.items() if key not in keys}
+            if not spans:
+                del self._groups[group_name], self._ranges[group_name], self._schemas[group_name]
+                continue
+            self._ranges[group_name] = spans
+            if self._changes_schema(group_name, removed):
+                self._rebuild(group_name)
+                continue
+            kept = self._groups[group_name].take(np.concatenate([np.arange(start, stop) for start, stop in spans.values()]))
+            kept.index = pd.RangeIndex(len(kept.index))
+            self._groups[group_name] = kept
+            stop = 0
+            for key, (first, last) in spans.items():
+                spans[key] = (stop, stop + last - first)
+                stop += last - first
+        for key in keys:
+            del self._files[key]
+
+    def _append(self, entries: List[Tuple[Hashable, ParsedAGSFile]]) -> None:
+        # Adds the entries' rows after the stored ones, combining the new frames of each group once
+        added: Dict[str, List[Tuple[Hashable, str, pd.DataFrame]]] = {}
+        for key, parsed_file in entries:
+            self._files[key] = parsed_file
+            for group_name in parsed_file.groups:
+                df = parsed_file.groups[group_name]
+                if df.empty: continue
+                added.setdefault(group_name, []).append((key, parsed_file.filename, df))
+
+        for group_name, new in added.items():
+            merged = self._groups.get(group_name)
+            ranges = self._ranges.setdefault(group_name, {})
+            stored = len(ranges)
+            for key, _, _ in new:
+                ranges[key] = (0, 0)
+            if merged is None or len(new) > stored or not all(_keeps_dtypes(merged, df) for _, _, df in new):
+                # The combined dtypes depend on every file's frame, and a group that mostly consists
+                # of new frames is as cheap to combine again in one pass
+                self._rebuild(group_name)
+                continue
+            part, lengths = _combine_counted([(filename, df) for _, filename, df in new], self.keys)
+            start = len(merged.index)
+            self._groups[group_name] = encode_keys(_stack_group([("", merged), ("", part)]), self.keys)
+            for (key, _, _), stop in zip(new, start + np.cumsum(lengths)):
+                ranges[key] = (start, int(stop))
+                start = int(stop)
+
+    def _remaining_frames(self, group_name: str) -> List[Tuple[str, pd.DataFrame]]:
+        return [(self._files[key].filename, self._files[key].groups[group_name]) for key in self._ranges[group_name]]
+
+    def _schema(self, group_name: str, key: Hashable) -> List[Tuple[str, object]]:
+        schemas = self._schemas.setdefault(group_name, {})
+        if key not in schemas:
+            schemas[key] = _frame_schema(self._files[key].groups[group_name])
+        return schemas[key]
+
+    def _changes_schema(self, group_name: str, removed: List[Tuple[str, object]]) -> bool:
+        """Whether removing files' frames changes the group's column order or a (non-key) column dtype."""
+        columns: Dict[str, List[object]] = {}
+        for key in self._ranges[group_name]:
+            for col, dtype in self._schema(group_name, key):
+                columns.setdefault(col, []).append(dtype)
+        if list(columns) != list(self._groups[group_name].columns):
+            return True
+        return any(col not in _KEY_COLUMNS and not any(_same_dtype(dtype, other) for other in columns[col])
+                   for col, dtype in removed)
+
+    def _rebuild(self, group_name: str) -> None:
+        self._groups[group_name], lengths = _combine_counted(self._remaining_frames(group_name), self.keys)
+        ranges = self._ranges[group_name]
+        for key, stop, length in zip(list(ranges), np.cumsum(lengths).tolist(), lengths.tolist()):
+            ranges[key] = (stop - length, stop)
+
+def combined_group_names(parsed_files: List[ParsedAGSFile]) -> List[str]:
+    """Group names across all files, in first-seen order, without parsing lazy groups."""
+    names: Dict[str, None] = {}
+    for pfile in parsed_files:
+        names.update(dict.fromkeys(pfile.groups))
+    return list(names)
+
+def combine_group(parsed_files: List[ParsedAGSFile], group_name: str,
+                  keys: Optional[SharedKeys] = None) -> pd.DataFrame:
+    """Combines a single group across files (empty DataFrame when no file has rows for it)."""
+    return combine_files(parsed_files, [group_name], keys).get(group_name, pd.DataFrame())
 
 def create_excel_from_dict(data_dict: Dict[str, pd.DataFrame], filename: str = "workbook.xlsx") -> bytes:
     """Excel builder - takes any dict of DataFrames and returns Excel bytes."""
@@ -171,40 +464,141 @@ def build_key_data_excel_options(key_data_groups: Dict[str, pd.DataFrame]) -> Di
     if not key_data_groups:
         return {}
     
-    options = {}
-    
-    # Option 1: Mapped intervals
-    mapped_df = get_key_data_intervals_mapped(key_data_groups)
-    if not mapped_df.empty:
-        options["Mapped Intervals"] = create_excel_from_dict(
-            {"Mapped_Intervals": mapped_df}, "intervals_mapped.xlsx"
-        )
-    
-    # Option 2: Full intervals
-    full_df = get_key_data_intervals_full(key_data_groups)
-    if not full_df.empty:
-        options["Full Intervals"] = create_excel_from_dict(
-            {"Full_Intervals": full_df}, "intervals_full.xlsx"
-        )
-    
- 
-    
-    return options
+    return KeyDataSession(key_data_groups).excel_options()
+
+# Groups used by the key data interval views
+KEY_DATA_GROUPS = ["CORE", "WETH", "GEOL", "FRAC", "DETL", "SAMP"]
+
+# Mapped interval view: group -> (top column, base column, {source column: output column}); this is from legacy code
+KEY_DATA_MAPPED_CONFIG = {
+    'CORE': ('CORE_TOP', 'CORE_BOT', {'CORE_RQD': 'RQD', 'CORE_PREC': 'TCR'}),
+    'DETL': ('DETL_TOP', 'DETL_BASE', {'DETL_DESC': 'Details'}),
+    'FRAC': ('FRAC_TOP', 'FRAC_BASE', {'FRAC_FI': 'FI'}),
+    'GEOL': ('GEOL_TOP', 'GEOL_BASE', {'GEOL_LEG': 'GEOL', 'GEOL_DESC': 'GEOL_DESC'}),
+    'WETH': ('WETH_TOP', 'WETH_BASE', {'WETH_GRAD': 'WETH_GRAD'}),
+    'SAMP': ('SAMP_TOP', 'SAMP_BASE', {'SAMP_TYPE': 'SAMP_TYPE', 'SAMP_ID': 'SAMP_ID'})
+}
+
+# Top / base depth columns of each key group; both interval views slice the holes on these
+KEY_DATA_DEPTH_KEYS = {group: (top_col, base_col) for group, (top_col, base_col, _) in KEY_DATA_MAPPED_CONFIG.items()}
+
+def key_data_mapped_columns() -> Dict[str, List[str]]:
+    """
+    Columns the mapped interval view reads from each key group, for parser projection
+    (`parse(..., groups=KEY_DATA_GROUPS, columns=key_data_mapped_columns())`).
+    """
+    return {
+        group: ["HOLE_ID", "LOCA_ID", top_col, base_col, *column_mapping]
+        for group, (top_col, base_col, column_mapping) in KEY_DATA_MAPPED_CONFIG.items()
+    }
 
 def get_key_data_groups(combined_groups: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
     """
     Extract key data groups: CORE, WETH, GEOL, FRAC, DETL, SAMP
     """
-    key_groups = ["CORE", "WETH", "GEOL", "FRAC", "DETL", "SAMP"]
     key_data = {}
     
-    for group_name in key_groups:
+    for group_name in KEY_DATA_GROUPS:
         if group_name in combined_groups:
-            key_data[group_name] = combined_groups[group_name]
+            df = combined_groups[group_name]
+            # A lazily combined group no file had rows for comes back without columns
+            if df.empty and len(df.columns) == 0: continue
+            key_data[group_name] = df
     
     return key_data
 
 
+
+
+class _KeyIntervals:
+    """
+    Master intervals of a set of key groups, with the typed inputs both interval views reuse:
+    each group's HOLE_ID codes (one dictionary, matched as text) and numeric top/base depths,
+    and the source row covering each interval per group.
+    """
+
+    def __init__(self, key_data_groups: Dict[str, pd.DataFrame], group_depth_keys: Dict[str, Tuple[str, str]]):
+        self.key_data_groups = key_data_groups
+        self.group_depth_keys = group_depth_keys
+        self.holes = KeyDictionary()
+        known = []
+        for df in key_data_groups.values():
+            if 'HOLE_ID' in df.columns:
+                known.append(self.holes.codes(df['HOLE_ID'].dropna(), as_text=True))
+
+        # group -> (hole codes, top depths, base depths); a missing depth column is None
+        self.sources: Dict[str, Tuple[np.ndarray, Optional[pd.Series], Optional[pd.Series]]] = {}
+        for group_name, (top_col, base_col) in group_depth_keys.items():
+            if group_name not in key_data_groups: continue
+            df = key_data_groups[group_name]
+            if 'HOLE_ID' not in df.columns: continue
+            self.sources[group_name] = (
+                self.holes.codes(df['HOLE_ID'], as_text=True),
+                *(numeric_values(df[col]) if col in df.columns else None for col in (top_col, base_col))
+            )
+        self._covering: Dict[str, Optional[Tuple[np.ndarray, np.ndarray]]] = {}
+        self.frame = self._master_intervals(np.concatenate(known) if known else np.empty(0, dtype=np.int64))
+
+    def _master_intervals(self, known: np.ndarray) -> pd.DataFrame:
+        hole_codes, depths = [], []
+        for codes, *columns in self.sources.values():
+            for column in columns:
+                if column is not None:
+                    values = column.to_numpy()
+                    keep = ~pd.isna(values)
+                    hole_codes.append(codes[keep])
+                    depths.append(values[keep])
+        # Hole codes and DEPTH_FROM of the intervals, for `covering`
+        self.codes, self.depth_from = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        if not depths:
+            return pd.DataFrame()
+        hole_codes, depths = np.concatenate(hole_codes), np.concatenate(depths).astype(np.float64)
+
+        # Only holes with a non-missing HOLE_ID somewhere (a missing one reads as "nan")
+        keep = np.isin(hole_codes, known)
+        hole_codes, depths = hole_codes[keep], depths[keep]
+
+        # Sort by (hole ID, depth) and drop repeated depths of a hole
+        hole_ids = self.holes.categories.to_numpy()
+        ranks = np.empty(len(hole_ids), dtype=np.int64)
+        ranks[np.argsort(hole_ids, kind="stable")] = np.arange(len(hole_ids))
+        order = np.lexsort((depths, ranks[hole_codes]))
+        hole_codes, depths = hole_codes[order], depths[order]
+        first = np.ones(len(depths), dtype=bool)
+        first[1:] = (hole_codes[1:] != hole_codes[:-1]) | (depths[1:] != depths[:-1])
+        hole_codes, depths = hole_codes[first], depths[first]
+
+        # Each depth but the last of its hole starts a slice ending at the next one
+        starts = np.flatnonzero(hole_codes[:-1] == hole_codes[1:])
+        if not len(starts):
+            return pd.DataFrame()
+        self.codes, self.depth_from = hole_codes[starts], depths[starts]
+        return pd.DataFrame({
+            'HOLE_ID': hole_ids[self.codes],
+            'DEPTH_FROM': self.depth_from,
+            'DEPTH_TO': depths[starts + 1],
+            'THICKNESS_M': depths[starts + 1] - self.depth_from,
+        })
+
+    def covering(self, group_name: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (interval positions, source row positions) of the intervals the group's rows cover, each
+        taking the last row that covers it. None when the group has no HOLE_ID / top / base column.
+        """
+        if group_name not in self._covering:
+            source = self.sources.get(group_name)
+            if source is None or source[1] is None or source[2] is None:
+                self._covering[group_name] = None
+            else:
+                codes, tops, bases = source
+                valid = (tops.notna() & bases.notna()).to_numpy()
+                winners = _interval_join(self.codes, self.depth_from, codes[valid],
+                                         tops.to_numpy()[valid], bases.to_numpy()[valid])
+                covered = np.flatnonzero(winners >= 0)
+                self._covering[group_name] = (covered, np.flatnonzero(valid)[winners[covered]])
+        return self._covering[group_name]
+
+
 def get_key_data_intervals_mapped(key_data_groups: Dict[str, pd.DataFrame]) -> pd.DataFrame:
     """
     VERSION 1: Mapped Columns ("Like Before")
@@ -213,25 +607,16 @@ def get_key_data_intervals_mapped(key_data_groups: Dict[str, pd.DataFrame]) -> p
     """
     if not key_data_groups:
         return pd.DataFrame()
-    
-    # Configuration with specific mappings (Source Column -> Output Column) this is from legacy code
-    group_configs = {
-        'CORE': ('CORE_TOP', 'CORE_BOT', {'CORE_RQD': 'RQD', 'CORE_PREC': 'TCR'}),
-        'DETL': ('DETL_TOP', 'DETL_BASE', {'DETL_DESC': 'Details'}),
-        'FRAC': ('FRAC_TOP', 'FRAC_BASE', {'FRAC_FI': 'FI'}),
-        'GEOL': ('GEOL_TOP', 'GEOL_BASE', {'GEOL_LEG': 'GEOL', 'GEOL_DESC': 'GEOL_DESC'}),
-        'WETH': ('WETH_TOP', 'WETH_BASE', {'WETH_GRAD': 'WETH_GRAD'}),
-        'SAMP': ('SAMP_TOP', 'SAMP_BASE', {'SAMP_TYPE': 'SAMP_TYPE', 'SAMP_ID': 'SAMP_ID'})
-    }
+    return _intervals_mapped(_KeyIntervals(key_data_groups, KEY_DATA_DEPTH_KEYS))
 
-    # 1. Prepare simple depth keys for the helper
-    simple_depth_keys = {g: (cfg[0], cfg[1]) for g, cfg in group_configs.items()}
-    
-    # 2. Use Helper to get Master Intervals
-    result_df = _calculate_master_intervals(key_data_groups, simple_depth_keys)
 
-    if result_df.empty:
+def _intervals_mapped(intervals: _KeyIntervals) -> pd.DataFrame:
+    # Configuration with specific mappings (Source Column -> Output Column)
+    group_configs = KEY_DATA_MAPPED_CONFIG
+
+    if intervals.frame.empty:
         return pd.DataFrame()
+    result_df = intervals.frame.copy()
 
     # Initialize Mapped Columns
     output_columns = set()
@@ -240,130 +625,186 @@ def get_key_data_intervals_mapped(key_data_groups: Dict[str, pd.DataFrame]) -> p
     for col in output_columns:
         result_df[col] = None
 
-    # 3. Fill Data using Mappings
+    # Fill Data using Mappings: each interval takes its values from the last source row covering it
     for group_name, (top_col, base_col, column_mapping) in group_configs.items():
-        if group_name not in key_data_groups: continue
-        source_df = key_data_groups[group_name].copy()
-        
-        if top_col not in source_df.columns or base_col not in source_df.columns: continue
-        
-        source_df[top_col] = pd.to_numeric(source_df[top_col], errors='coerce')
-        source_df[base_col] = pd.to_numeric(source_df[base_col], errors='coerce')
-        source_df = source_df.dropna(subset=[top_col, base_col])
-
-        for _, row in source_df.iterrows():
-            mask = (
-                (result_df['HOLE_ID'] == str(row['HOLE_ID'])) & 
-                (result_df['DEPTH_FROM'] >= row[top_col]) & 
-                (result_df['DEPTH_FROM'] < row[base_col])
-            )
-            if mask.any():
-                for source_col, target_col in column_mapping.items():
-                    if source_col in row.index:
-                        result_df.loc[mask, target_col] = row[source_col]
+        covering = intervals.covering(group_name)
+        if covering is None or not len(covering[0]): continue
+        covered, rows = covering
+        source_df = intervals.key_data_groups[group_name]
+        _, tops, bases = intervals.sources[group_name]
+        depths = {top_col: tops, base_col: bases}
+
+        for source_col, target_col in column_mapping.items():
+            if source_col in source_df.columns:
+                values = depths.get(source_col, source_df[source_col]).to_numpy(dtype=object)
+                column = result_df[target_col].to_numpy(dtype=object, copy=True)
+                column[covered] = values[rows]
+                result_df[target_col] = column
 
     return result_df.reset_index(drop=True)
 
 
+def _interval_join(codes: np.ndarray, depths: np.ndarray, source_codes: np.ndarray,
+                   tops: np.ndarray, bases: np.ndarray) -> np.ndarray:
+    """
+    For each interval (hole code, DEPTH_FROM), the position of the last source row of the same hole
+    with top <= DEPTH_FROM < base, or -1 when no row covers it (later rows overwrite earlier ones).
+    The intervals are sorted once by (hole, depth); each source row finds its covered range with
+    two binary searches.
+    """
+    key = np.dtype([("hole", np.int64), ("depth", np.float64)])
+    order = np.lexsort((depths, codes))
+    intervals = np.empty(len(order), dtype=key)
+    intervals["hole"], intervals["depth"] = codes[order], depths[order]
+
+    def first_at_or_after(values: np.ndarray) -> np.ndarray:
+        bounds = np.empty(len(source_codes), dtype=key)
+        bounds["hole"], bounds["depth"] = source_codes, values
+        return np.searchsorted(intervals, bounds, side="left")
+
+    starts = first_at_or_after(tops)
+    counts = np.maximum(first_at_or_after(bases) - starts, 0)
+    rows = np.repeat(np.arange(len(source_codes)), counts)
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - starts, counts)
+    winners = np.full(len(order), -1, dtype=np.int64)
+    np.maximum.at(winners, order[positions], rows)
+    return winners
+
+
 def get_key_data_intervals_full(key_data_groups: Dict[str, pd.DataFrame]) -> pd.DataFrame:
     """
     VERSION 2: All Columns )
     Combine key data groups into depth intervals and automatically attach ALL available columns.
     Includes robust type conversion.
+    The interval columns (HOLE_ID, DEPTH_FROM, DEPTH_TO, THICKNESS_M) always hold the master
+    intervals: a source column with one of those names is not copied (it used to overwrite them).
     """
     if not key_data_groups:
         return pd.DataFrame()
-    
-    group_depth_keys = {
-        'CORE': ('CORE_TOP', 'CORE_BOT'),
-        'DETL': ('DETL_TOP', 'DETL_BASE'),
-        'FRAC': ('FRAC_TOP', 'FRAC_BASE'),
-        'GEOL': ('GEOL_TOP', 'GEOL_BASE'),
-        'WETH': ('WETH_TOP', 'WETH_BASE'),
-        'SAMP': ('SAMP_TOP', 'SAMP_BASE')
-    }
-    
-    # 1. Use Helper to get Master Intervals
-    result_df = _calculate_master_intervals(key_data_groups, group_depth_keys)
+    return _intervals_full(_KeyIntervals(key_data_groups, KEY_DATA_DEPTH_KEYS))
+
+
+def _intervals_full(intervals: _KeyIntervals) -> pd.DataFrame:
+    key_data_groups, group_depth_keys = intervals.key_data_groups, intervals.group_depth_keys
+    result_df = intervals.frame
 
     if result_df.empty:
         return pd.DataFrame()
 
-    # 2. Initialize ALL Columns (Dynamic Discovery)
-    structural_cols = {'HOLE_ID', 'SOURCE_FILE', 'GIU_HOLE_ID', 'GIU_NO'}
+    # Discover ALL Columns. Source columns named like an interval column (DEPTH_FROM, DEPTH_TO,
+    # THICKNESS_M) are left out, so the intervals stay the master slices
+    structural_cols = {'HOLE_ID', 'SOURCE_FILE', 'GIU_HOLE_ID', 'GIU_NO', *result_df.columns}
     for t, b in group_depth_keys.values():
         structural_cols.add(t)
         structural_cols.add(b)
 
+    data_cols: Dict[str, int] = {}
     for group_name in group_depth_keys:
         if group_name in key_data_groups:
-            cols = key_data_groups[group_name].columns
-            data_cols = [c for c in cols if c not in structural_cols]
-            for col in data_cols:
-                if col not in result_df.columns:
-                    result_df[col] = None
-
-    # 3. Fill Data Dynamically
-    for group_name, (top_col, base_col) in group_depth_keys.items():
+            for col in key_data_groups[group_name].columns:
+                if col not in structural_cols:
+                    data_cols.setdefault(col, len(data_cols))
+    data = np.full((len(result_df.index), len(data_cols)), None, dtype=object)
+
+    # Fill Data Dynamically: the source row of every interval, then all of its columns in one take
+    for group_name in group_depth_keys:
         if group_name not in key_data_groups: continue
-        source_df = key_data_groups[group_name].copy()
-        
-        if top_col not in source_df.columns or base_col not in source_df.columns: continue
-        
-        source_df[top_col] = pd.to_numeric(source_df[top_col], errors='coerce')
-        source_df[base_col] = pd.to_numeric(source_df[base_col], errors='coerce')
-        source_df = source_df.dropna(subset=[top_col, base_col])
-
-        # Identify columns to copy (intersection of source and result, excluding structural)
-        valid_cols = [c for c in source_df.columns if c in result_df.columns and c not in structural_cols]
+        source_df = key_data_groups[group_name]
+
+        # Columns to copy (intersection of source and result, excluding structural)
+        valid_cols = [c for c in source_df.columns if c in data_cols]
         if not valid_cols: continue
 
-        for _, row in source_df.iterrows():
-            mask = (
-                (result_df['HOLE_ID'] == str(row['HOLE_ID'])) & 
-                (result_df['DEPTH_FROM'] >= row[top_col]) & 
-                (result_df['DEPTH_FROM'] < row[base_col])
-            )
-            if mask.any():
-                result_df.loc[mask, valid_cols] = row[valid_cols].values
+        covering = intervals.covering(group_name)
+        if covering is None or not len(covering[0]): continue
+        covered, rows = covering
+        values = source_df[valid_cols].take(rows).to_numpy(dtype=object)
+        data[np.ix_(covered, [data_cols[c] for c in valid_cols])] = values
 
-    return result_df.reset_index(drop=True)
+    data_df = pd.DataFrame(data, columns=list(data_cols), dtype=object)
+    return pd.concat([result_df, data_df], axis=1)
 
 def _calculate_master_intervals(key_data_groups: Dict[str, pd.DataFrame], group_depth_keys: Dict[str, Tuple[str, str]]) -> pd.DataFrame:
-    """Helper: Calculates the master depth slices based on provided groups."""
-    all_holes = set()
-    for df in key_data_groups.values():
-        if 'HOLE_ID' in df.columns:
-            all_holes.update(df['HOLE_ID'].dropna().astype(str).unique())
-            
-    hole_intervals = {}
-    for hole_id in all_holes:
-        all_depths = []
-        for group_name, (top_col, base_col) in group_depth_keys.items():
-            if group_name not in key_data_groups: continue
-            df = key_data_groups[group_name]
-            hole_data = df[df['HOLE_ID'].astype(str) == hole_id]
-            
-            if top_col in hole_data.columns:
-                all_depths.extend(pd.to_numeric(hole_data[top_col], errors='coerce').dropna().tolist())
-            if base_col in hole_data.columns:
-                all_depths.extend(pd.to_numeric(hole_data[base_col], errors='coerce').dropna().tolist())
-        
-        if all_depths:
-            unique_depths = sorted(list(set(all_depths)))
-            if len(unique_depths) > 1:
-                intervals = []
-                for i in range(len(unique_depths) - 1):
-                    intervals.append({
-                        'HOLE_ID': hole_id,
-                        'DEPTH_FROM': unique_depths[i],
-                        'DEPTH_TO': unique_depths[i + 1],
-                        'THICKNESS_M': unique_depths[i + 1] - unique_depths[i]
-                    })
-                hole_intervals[hole_id] = intervals
-                
-    all_rows = []
-    for intervals in hole_intervals.values():
-        all_rows.extend(intervals)
-    return pd.DataFrame(all_rows)
+    """
+    Helper: Calculates the master depth slices based on provided groups.
+    Every (hole, depth) pair of the groups' top/base columns is stacked once, then sorted and
+    de-duplicated per hole; consecutive depths of a hole are its slices (as floats).
+    Holes come out sorted by ID.
+    """
+    return _KeyIntervals(key_data_groups, group_depth_keys).frame
+
+
+class KeyDataSession:
+    """
+    Key data interval views of one set of key groups. The master intervals and the typed source
+    groups are computed once per selection of groups and shared by the mapped view, the full view
+    and their workbooks; each of these is built on first use and kept for later calls with the
+    same selection. The returned frames are shared between calls, so copy them before editing.
+    """
+
+    def __init__(self, key_data_groups: Dict[str, pd.DataFrame]):
+        self.key_data_groups = key_data_groups
+        self._intervals: Dict[FrozenSet[str], _KeyIntervals] = {}
+        # (selection, result name) -> mapped / full frame or workbook options
+        self._results: Dict[Tuple[FrozenSet[str], str], object] = {}
+
+    def holds(self, key_data_groups: Dict[str, pd.DataFrame]) -> bool:
+        """Whether the session was built from these same group tables, so its results still apply."""
+        return (list(key_data_groups) == list(self.key_data_groups)
+                and all(key_data_groups[name] is df for name, df in self.key_data_groups.items()))
+
+    def _selection(self, groups: Optional[Iterable[str]]) -> FrozenSet[str]:
+        if groups is None:
+            return frozenset(self.key_data_groups)
+        return frozenset(name for name in groups if name in self.key_data_groups)
+
+    def _prepared(self, selection: FrozenSet[str]) -> _KeyIntervals:
+        if selection not in self._intervals:
+            selected = {name: df for name, df in self.key_data_groups.items() if name in selection}
+            self._intervals[selection] = _KeyIntervals(selected, KEY_DATA_DEPTH_KEYS)
+        return self._intervals[selection]
+
+    def _result(self, groups: Optional[Iterable[str]], name: str, build):
+        key = (self._selection(groups), name)
+        if key not in self._results:
+            self._results[key] = build(key[0])
+        return self._results[key]
+
+    def intervals(self, groups: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Master intervals (HOLE_ID, DEPTH_FROM, DEPTH_TO, THICKNESS_M) of the selected groups (default all)."""
+        return self._prepared(self._selection(groups)).frame
+
+    def mapped(self, groups: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Same as `get_key_data_intervals_mapped` of the selected groups."""
+        return self._result(groups, "mapped", lambda selection: _intervals_mapped(self._prepared(selection)))
+
+    def full(self, groups: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Same as `get_key_data_intervals_full` of the selected groups."""
+        return self._result(groups, "full", lambda selection: _intervals_full(self._prepared(selection)))
+
+    def depth_index(self, groups: Optional[Iterable[str]] = None) -> DepthIndex:
+        """Depth index over the full view of the selected groups, for point / range lookups by hole."""
+        return self._result(groups, "index", lambda selection: DepthIndex(self.full(selection)))
+
+    def excel_options(self, groups: Optional[Iterable[str]] = None) -> Dict[str, bytes]:
+        """Workbook bytes of the non-empty views ("Mapped Intervals", "Full Intervals")."""
+        return self._result(groups, "excel", self._excel_options)
+
+    def _excel_options(self, selection: FrozenSet[str]) -> Dict[str, bytes]:
+        options = {}
+
+        # Option 1: Mapped intervals
+        mapped_df = self.mapped(selection)
+        if not mapped_df.empty:
+            options["Mapped Intervals"] = create_excel_from_dict(
+                {"Mapped_Intervals": mapped_df}, "intervals_mapped.xlsx"
+            )
+
+        # Option 2: Full intervals
+        full_df = self.full(selection)
+        if not full_df.empty:
+            options["Full Intervals"] = create_excel_from_dict(
+                {"Full_Intervals": full_df}, "intervals_full.xlsx"
+            )
 
+        return options
@@ -0,0 +1,146 @@
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from src.parsing.column_types import numeric_values
+from src.processing.keys import KeyDictionary
+
+# Hole key columns a query table may use (GIU_HOLE_ID as in the legacy Search_Depth input)
+QUERY_HOLE_COLUMNS = ("HOLE_ID", "GIU_HOLE_ID")
+
+_KEY = np.dtype([("hole", np.int64), ("depth", np.float64)])
+
+
+def _keys(codes: np.ndarray, depths: np.ndarray) -> np.ndarray:
+    keys = np.empty(len(codes), dtype=_KEY)
+    keys["hole"], keys["depth"] = codes, depths
+    return keys
+
+
+class DepthIndex:
+    """
+    Per-hole depth index over an interval table (HOLE_ID, DEPTH_FROM, DEPTH_TO, ...), such as the
+    key data interval views. The intervals are sorted once by (hole, DEPTH_FROM); every point or
+    range query of a batch is then two binary searches, instead of a scan of the whole table.
+
+    Intervals are [DEPTH_FROM, DEPTH_TO) and the intervals of a hole must not overlap (master
+    intervals never do). A depth at the base of an interval no other interval starts from still
+    falls in that interval, so the bottom of a hole is found. Hole IDs are matched as text.
+    """
+
+    def __init__(self, intervals: pd.DataFrame):
+        self.intervals = intervals.reset_index(drop=True)
+        self.holes = KeyDictionary()
+        if self.intervals.empty:
+            codes, tops, bases = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        else:
+            codes = self.holes.codes(self.intervals["HOLE_ID"], as_text=True)
+            tops, bases = (numeric_values(self.intervals[col]).to_numpy(dtype=np.float64, na_value=np.nan)
+                           for col in ("DEPTH_FROM", "DEPTH_TO"))
+        rows = np.flatnonzero(tops < bases)
+        rows = rows[np.lexsort((tops[rows], codes[rows]))]
+        codes, tops, bases = codes[rows], tops[rows], bases[rows]
+
+        same_hole = codes[1:] == codes[:-1]
+        overlaps = np.flatnonzero(same_hole & (tops[1:] < bases[:-1]))
+        if len(overlaps):
+            hole_id = self.holes.categories[codes[overlaps[0]]]
+            raise ValueError(f"Intervals of hole '{hole_id}' overlap at {tops[overlaps[0] + 1]} m")
+
+        # Positions in `intervals` in (hole, depth) order, searched by top for points, by base for ranges
+        self._rows = rows
+        self._tops = _keys(codes, tops)
+        self._bases = _keys(codes, bases)
+        # Whether a point query at the base still matches (no interval of the hole starts there)
+        self._closed = np.ones(len(rows), dtype=bool)
+        self._closed[:-1] = ~(same_hole & (tops[1:] == bases[:-1]))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _codes(self, hole_ids) -> np.ndarray:
+        # Holes without intervals are -1 and are not added, so queries never grow the dictionary
+        return self.holes.codes(pd.Series(hole_ids, dtype=object), as_text=True, add=False)
+
+    def rows_at(self, hole_ids, depths) -> np.ndarray:
+        """Row position in `intervals` of the interval holding each (hole, depth), -1 when none does."""
+        codes = self._codes(hole_ids)
+        depths = pd.to_numeric(pd.Series(depths), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        if not len(self._rows):
+            return np.full(len(codes), -1, dtype=np.int64)
+        below = np.maximum(np.searchsorted(self._tops, _keys(codes, depths), side="right") - 1, 0)
+        base = self._bases["depth"][below]
+        found = ((self._tops["hole"][below] == codes) & (self._tops["depth"][below] <= depths)
+                 & ((depths < base) | ((depths == base) & self._closed[below])))
+        return np.where(found, self._rows[below], -1)
+
+    def rows_between(self, hole_ids, depths_from, depths_to) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (query positions, row positions in `intervals`) of the intervals overlapping each
+        (hole, DEPTH_FROM, DEPTH_TO) range, the intervals of a query in depth order.
+        """
+        codes = self._codes(hole_ids)
+        depths_from, depths_to = (pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                                  for values in (depths_from, depths_to))
+        # Intervals ending below DEPTH_FROM come first, those starting at or below DEPTH_TO last
+        first = np.searchsorted(self._bases, _keys(codes, depths_from), side="right")
+        stop = np.searchsorted(self._tops, _keys(codes, depths_to), side="left")
+        counts = np.where(np.isnan(depths_from) | np.isnan(depths_to), 0, np.maximum(stop - first, 0))
+        queries = np.repeat(np.arange(len(codes)), counts)
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - first, counts)
+        return queries, self._rows[positions]
+
+    def at(self, hole_ids, depths) -> pd.DataFrame:
+        """The interval row holding each (hole, depth), one row per query (missing values when none does)."""
+        return self.intervals.reindex(self.rows_at(hole_ids, depths)).reset_index(drop=True)
+
+    def between(self, hole_ids, depths_from, depths_to) -> pd.DataFrame:
+        """The interval rows overlapping each range, with the query position in a QUERY column."""
+        queries, rows = self.rows_between(hole_ids, depths_from, depths_to)
+        result = self.intervals.take(rows).reset_index(drop=True)
+        result.insert(0, "QUERY", queries)
+        return result
+
+    def search(self, queries: pd.DataFrame) -> pd.DataFrame:
+        """
+        Batch lookup in the format of the legacy Search_Depth tool: `queries` has a hole column
+        (HOLE_ID or GIU_HOLE_ID) and either DEPTH (points) or DEPTH_FROM / DEPTH_TO (ranges).
+        The result keeps the query columns and adds the interval columns they do not have.
+        Points give one row per query; ranges one row per overlapping interval, with DEPTH_FROM /
+        DEPTH_TO (and THICKNESS_M) cut to the queried range. Queries without a match are kept once.
+        """
+        hole_col = next((col for col in QUERY_HOLE_COLUMNS if col in queries.columns), None)
+        if hole_col is None:
+            raise ValueError(f"Query table needs one of the columns {QUERY_HOLE_COLUMNS}")
+        queries = queries.reset_index(drop=True)
+        added = [col for col in self.intervals.columns if col not in queries.columns and col not in QUERY_HOLE_COLUMNS]
+
+        if "DEPTH" in queries.columns:
+            rows = self.rows_at(queries[hole_col], queries["DEPTH"])
+            found = self.intervals[added].reindex(rows).reset_index(drop=True)
+            return pd.concat([queries, found], axis=1)
+
+        if "DEPTH_FROM" not in queries.columns or "DEPTH_TO" not in queries.columns:
+            raise ValueError("Query table needs a DEPTH column, or DEPTH_FROM and DEPTH_TO columns")
+        matched, rows = self.rows_between(queries[hole_col], queries["DEPTH_FROM"], queries["DEPTH_TO"])
+        # Queries without an overlapping interval stay, in query order, with an empty match
+        unmatched = np.setdiff1d(np.arange(len(queries.index)), matched)
+        order = np.argsort(np.concatenate([matched, unmatched]), kind="stable")
+        matched = np.concatenate([matched, unmatched])[order]
+        rows = np.concatenate([rows, np.full(len(unmatched), -1)])[order]
+
+        result = queries.take(matched).reset_index(drop=True)
+        found = rows >= 0
+        for col in ("DEPTH_FROM", "DEPTH_TO"):
+            query_depths = numeric_values(result[col]).to_numpy(dtype=np.float64, na_value=np.nan)
+            interval_depths = self._depths(col, rows)
+            cut = np.maximum if col == "DEPTH_FROM" else np.minimum
+            result[col] = np.where(found, cut(query_depths, interval_depths), query_depths)
+        if "THICKNESS_M" in added:
+            added.remove("THICKNESS_M")
+            result["THICKNESS_M"] = np.where(found, result["DEPTH_TO"] - result["DEPTH_FROM"], np.nan)
+        found_columns = self.intervals[added].reindex(rows).reset_index(drop=True)
+        return pd.concat([result, found_columns], axis=1)
+
+    def _depths(self, col: str, rows: np.ndarray) -> np.ndarray:
+        depths = numeric_values(self.intervals[col]).to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.where(rows >= 0, depths[np.maximum(rows, 0)] if len(depths) else np.nan, np.nan)
@@ -0,0 +1,204 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from src.parsing import get_parser
+from src.parsing.lazy import LazyGroups
+from src.parsing.utils import detect_ags, DEFAULT_CHUNK_ROWS
+from src.domain.models import ParsedAGSFile, AGSDetection, HoleFilter, hole_key_columns
+from src.processing.keys import KeyDictionary
+
+
+@dataclass
+class IngestJob:
+    """One uploaded file waiting to be parsed."""
+    filename: str
+    content: bytes
+    needs_prefix: bool = False
+
+
+@dataclass
+class IngestResult:
+    """Outcome of ingesting one file: either a parsed file or an error message."""
+    filename: str
+    parsed_file: Optional[ParsedAGSFile] = None
+    error: Optional[str] = None
+    prefix: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.parsed_file is not None
+
+
+def default_worker_count() -> int:
+    return max(1, os.cpu_count() or 1)
+
+
+def make_prefix(filename: str) -> str:
+    base = filename.split('.')[0].upper()
+    # Sanitize prefix (alphanumeric only, max 5 chars)
+    return re.sub(r'[^A-Z0-9]', '', base)[:5] + "_"
+
+
+class HolePrefix:
+    """
+    In-place prefixing of every hole key column (see `hole_key_columns`) of a file's groups.
+    Hole IDs go through one key dictionary for the whole file, so each distinct ID is stripped and
+    prefixed once and a column is rebuilt with a single take, whatever its number of rows.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.holes = KeyDictionary()
+        # Prefixed ID of every dictionary code
+        self._prefixed = np.empty(0, dtype=object)
+
+    def __call__(self, df: pd.DataFrame) -> None:
+        for col in hole_key_columns(df.columns):
+            # Keyed as text, like astype(str) (a missing ID becomes e.g. "F_None")
+            codes = self.holes.codes(df[col], as_text=True)
+            if len(self.holes) > len(self._prefixed):
+                added = self.holes.categories[len(self._prefixed):]
+                self._prefixed = np.concatenate([self._prefixed,
+                                                 np.array([self.prefix + value.strip() for value in added], dtype=object)])
+            df[col] = self._prefixed[codes]
+
+
+def prefix_hole_ids(df: pd.DataFrame, prefix: str) -> None:
+    """In-place prefixing of the hole key columns of one group."""
+    HolePrefix(prefix)(df)
+
+
+def apply_prefix(parsed_file: ParsedAGSFile, prefix: str) -> None:
+    """In-place prefixing of the hole key columns of every group (lazy groups are prefixed as they load)."""
+    transform = HolePrefix(prefix)
+    if isinstance(parsed_file.groups, LazyGroups):
+        parsed_file.groups.add_transform(transform)
+        return
+    for df in parsed_file.groups.values():
+        transform(df)
+
+
+def _detect(job: IngestJob, target_version: str) -> AGSDetection:
+    detection = detect_ags(job.content)
+    if target_version == "AGS3" and detection.version == "AGS4":
+        raise ValueError("Detected AGS4 file in AGS3 mode.")
+    if target_version == "AGS4" and detection.version == "AGS3":
+        raise ValueError("Detected AGS3 file in AGS4 mode.")
+    return detection
+
+
+def ingest_file(
+    job: IngestJob,
+    target_version: str,
+    lazy: bool = False,
+    groups: Optional[Iterable[str]] = None,
+    columns: Optional[Dict[str, List[str]]] = None,
+    hole_filter: Optional[HoleFilter] = None,
+    typed: bool = False,
+) -> IngestResult:
+    """
+    Detects, parses, validates and prefixes a single file. Never raises.
+    With `lazy=True` groups are only indexed here and parsed when first accessed;
+    `groups` / `columns` / `hole_filter` are handed to the parser to limit what is parsed
+    (hole IDs are matched before the prefix is applied); `typed` asks it for typed columns.
+    """
+    fname = job.filename
+    try:
+        # A. Detect Version
+        # (bounded prefix scan; the BOM/encoding it saw is handed on to the parser)
+        detection = _detect(job, target_version)
+
+        # B. Parse
+        parser = get_parser(target_version)
+        parsed_file = parser.parse(job.content, fname, detection=detection, lazy=lazy, groups=groups, columns=columns,
+                                   hole_filter=hole_filter, typed=typed)
+
+        if not parsed_file.is_valid:
+            error_msg = "; ".join([e.message for e in parsed_file.errors])
+            raise ValueError(f"Parsing failed: {error_msg}")
+
+        if not parsed_file.groups:
+            raise ValueError("No valid groups found.")
+
+        # C. Apply Prefix (in-memory modifier on the dataframe)
+        prefix = None
+        if job.needs_prefix:
+            prefix = make_prefix(fname)
+            apply_prefix(parsed_file, prefix)
+
+        return IngestResult(filename=fname, parsed_file=parsed_file, prefix=prefix)
+
+    except Exception as e:
+        return IngestResult(filename=fname, error=str(e))
+
+
+def iter_file_chunks(
+    job: IngestJob,
+    target_version: str,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    groups: Optional[Iterable[str]] = None,
+    columns: Optional[Dict[str, List[str]]] = None,
+    hole_filter: Optional[HoleFilter] = None,
+    typed: bool = False,
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    Streaming counterpart of `ingest_file`: yields the file's (group, DataFrame) batches of at most
+    `chunk_rows` rows, prefixed like `ingest_file` does, without building the whole parsed file.
+    Raises on detection or format errors.
+    """
+    detection = _detect(job, target_version)
+    parser = get_parser(target_version)
+    hole_prefix = HolePrefix(make_prefix(job.filename)) if job.needs_prefix else None
+    for group, df in parser.iter_chunks(job.content, job.filename, detection=detection, chunk_rows=chunk_rows,
+                                        groups=groups, columns=columns, hole_filter=hole_filter,
+                                        typed=typed):
+        if hole_prefix:
+            hole_prefix(df)
+        yield group, df
+
+
+def ingest_files(
+    jobs: List[IngestJob],
+    target_version: str,
+    max_workers: Optional[int] = None,
+    on_result: Optional[Callable[[int, IngestResult], None]] = None,
+    lazy: bool = False,
+    groups: Optional[Iterable[str]] = None,
+    columns: Optional[Dict[str, List[str]]] = None,
+    hole_filter: Optional[HoleFilter] = None,
+    typed: bool = False,
+) -> List[IngestResult]:
+    """
+    Parses files in a pool of worker processes.
+    Results are reported through `on_result(index, result)` as they complete,
+    but the returned list always follows the order of `jobs`.
+    """
+    results: List[Optional[IngestResult]] = [None] * len(jobs)
+    groups = list(groups) if groups is not None else None
+    workers = min(max_workers or default_worker_count(), len(jobs))
+
+    def _collect(idx: int, result: IngestResult):
+        results[idx] = result
+        if on_result:
+            on_result(idx, result)
+
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(ingest_file, job, target_version, lazy, groups, columns, hole_filter, typed): idx for idx, job in enumerate(jobs)}
+                for future in as_completed(futures):
+                    _collect(futures[future], future.result())
+        except (BrokenProcessPool, OSError):
+            # Worker processes unavailable (e.g. sandboxed host): finish in-process
+            pass
+
+    for idx, job in enumerate(jobs):
+        if results[idx] is None:
+            _collect(idx, ingest_file(job, target_version, lazy, groups, columns, hole_filter, typed))
+
+    return results
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List
+import numpy as np
+import pandas as pd
+from src.domain.models import HOLE_KEY_COLUMNS
+
+
+class KeyDictionary:
+    """
+    Append-only value -> integer code dictionary for repeated keys (file names, hole IDs).
+    A value keeps its code for the lifetime of the dictionary, so columns encoded at different
+    times (other groups, files added later) can be compared on their codes directly.
+    """
+
+    def __init__(self):
+        self._codes: Dict[Hashable, int] = {}
+        self._values: List[Hashable] = []
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, value) -> bool:
+        return value in self._codes
+
+    def code(self, value: Hashable) -> int:
+        """Code of `value`, added to the dictionary if it is new."""
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    @property
+    def categories(self) -> pd.Index:
+        return pd.Index(self._values, dtype=object)
+
+    def codes(self, values: pd.Series, as_text: bool = False, add: bool = True) -> np.ndarray:
+        """
+        Integer codes of `values` (-1 for missing values). Only the distinct values are looked up.
+        With `as_text`, values are keyed by `str(value)` (missing ones included), as `astype(str)` would.
+        With `add=False` the dictionary is left unchanged and values it does not hold are -1 too.
+        """
+        local_codes, uniques = pd.factorize(values)
+        if as_text:
+            uniques = [str(value) for value in uniques]
+            missing = np.flatnonzero(local_codes < 0)
+            if len(missing):
+                # factorize folds None, NaN and NA together; astype(str) gives each its own text
+                missing_codes, missing_text = pd.factorize(
+                    np.array([str(value) for value in np.asarray(values, dtype=object)[missing]], dtype=object))
+                local_codes[missing] = missing_codes + len(uniques)
+                uniques += list(missing_text)
+        if add:
+            lookup = np.fromiter((self.code(value) for value in uniques), dtype=np.int64, count=len(uniques))
+        else:
+            lookup = np.fromiter((self._codes.get(value, -1) for value in uniques), dtype=np.int64, count=len(uniques))
+        if not len(lookup):
+            return np.full(len(local_codes), -1, dtype=np.int64)
+        return np.where(local_codes >= 0, lookup[local_codes], -1)
+
+    def encode(self, values: pd.Series) -> pd.Categorical:
+        """`values` as a categorical whose categories are the dictionary (so far)."""
+        codes = self.codes(values)
+        return pd.Categorical.from_codes(codes, categories=self.categories)
+
+
+@dataclass
+class SharedKeys:
+    """The dictionaries shared by every combined group: one for SOURCE_FILE, one for hole keys."""
+    files: KeyDictionary = field(default_factory=KeyDictionary)
+    holes: KeyDictionary = field(default_factory=KeyDictionary)
+
+
+def encode_keys(df: pd.DataFrame, keys: SharedKeys) -> pd.DataFrame:
+    """In-place encoding of SOURCE_FILE and the hole key columns of one group as shared categoricals."""
+    if "SOURCE_FILE" in df.columns:
+        df["SOURCE_FILE"] = keys.files.encode(df["SOURCE_FILE"])
+    for col in HOLE_KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = keys.holes.encode(df[col])
+    return df
@@ -0,0 +1,140 @@
+import re
+from typing import Dict, Iterable, List, Optional, Union
+import numpy as np
+import pandas as pd
+
+# Description columns searched for keywords: mapped interval view (GEOL_DESC, Details), full view / DETL group
+KEYWORD_TEXT_COLUMNS = ("GEOL_DESC", "Details", "DETL_DESC")
+# Fracture index columns read by the "No Recovery" rule (mapped view, then full view / FRAC group)
+FI_COLUMNS = ("FI", "FRAC_FI")
+# From the legacy Search_KeyWord tool: this keyword also flags rows whose FI reads "NR"
+NO_RECOVERY = "No Recovery"
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Regex of the words as a trie (shared prefixes written once), so that at each position the
+    engine follows a single branch and the longest word starting there is the one matched.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def branch(node: dict) -> str:
+        alternatives = [re.escape(char) + branch(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return branch(trie)
+
+
+class KeywordMatcher:
+    """
+    Keywords compiled once into a single case-insensitive regex, for flagging many descriptions
+    against many keywords. Keywords are plain text (not regular expressions) and match anywhere
+    in a description, like `str.contains(keyword, case=False)`.
+
+    The regex is a trie of the keywords inside a lookahead, so one scan reports the longest keyword
+    starting at every position; the shorter keywords starting there are its prefixes and are added
+    from a prefix table. Each distinct description is scanned once, whatever the number of keywords.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        # Column names: the first spelling of each keyword (keywords differing in case are one)
+        self.keywords: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for keyword in keywords:
+            key = str(keyword).lower()
+            if not key.strip() or "\0" in key or key in self._ids:
+                continue
+            self._ids[key] = len(self.keywords)
+            self.keywords.append(str(keyword))
+
+        # Keyword ids each matched keyword implies: itself and the keywords that are its prefixes
+        prefixes = [[self._ids[key[:end]] for end in range(1, len(key) + 1) if key[:end] in self._ids]
+                    for key in self._ids]
+        self._prefix_counts = np.array([len(ids) for ids in prefixes], dtype=np.int64)
+        self._prefix_ids = np.array([i for ids in prefixes for i in ids], dtype=np.int64)
+        self._pattern = re.compile(f"(?=({_trie_pattern(self._ids)}))", re.IGNORECASE) if self._ids else None
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    @property
+    def columns(self) -> List[str]:
+        """Names of the flag columns `flag_keywords` adds, one per keyword."""
+        return [NO_RECOVERY if keyword.casefold() == NO_RECOVERY.casefold() else keyword for keyword in self.keywords]
+
+    def match_texts(self, texts: List[str]) -> np.ndarray:
+        """(texts x keywords) boolean matrix; the texts are joined and scanned in one pass."""
+        flags = np.zeros((len(texts), len(self.keywords)), dtype=bool)
+        if self._pattern is None or not texts:
+            return flags
+        starts = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]])
+        matches = [(m.start(), m.group(1)) for m in self._pattern.finditer("\0".join(texts))]
+        if not matches:
+            return flags
+        positions, found = zip(*matches)
+        found_ids = pd.Series(found, dtype=object).str.lower().map(self._ids)
+        known = found_ids.notna().to_numpy()
+        rows = np.searchsorted(starts, np.asarray(positions)[known], side="right") - 1
+        ids = found_ids.to_numpy()[known].astype(np.int64)
+
+        # Expand every match to the keywords it implies (itself and its prefixes)
+        counts = self._prefix_counts[ids]
+        offsets = np.cumsum(self._prefix_counts) - self._prefix_counts
+        implied = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - offsets[ids], counts)
+        flags[np.repeat(rows, counts), self._prefix_ids[implied]] = True
+        return flags
+
+    def flags(self, columns: List[pd.Series]) -> np.ndarray:
+        """
+        (rows x keywords) boolean matrix, True where any of the (equally long) text columns holds the
+        keyword. Missing and non-text values match nothing.
+        """
+        n_rows = len(columns[0].index) if columns else 0
+        if not columns or not len(self.keywords):
+            return np.zeros((n_rows, len(self.keywords)), dtype=bool)
+        # Distinct descriptions of all columns, each scanned once
+        codes, uniques = pd.factorize(pd.concat([pd.Series(column.to_numpy(dtype=object)) for column in columns],
+                                                ignore_index=True))
+        texts = [value if isinstance(value, str) else "" for value in uniques]
+        found = np.vstack([self.match_texts(texts), np.zeros((1, len(self.keywords)), dtype=bool)])
+        codes = np.where(codes >= 0, codes, len(texts)).reshape(len(columns), n_rows)
+        return np.logical_or.reduce(found[codes], axis=0)
+
+
+def _reads_no_recovery(values: pd.Series) -> np.ndarray:
+    """FI values containing both 'N' and 'R' (such as "NR"), as the legacy tool tested them."""
+    codes, uniques = pd.factorize(pd.Series(values.to_numpy(dtype=object)))
+    hits = np.array([isinstance(value, str) and "N" in value and "R" in value for value in uniques] + [False])
+    return hits[np.where(codes >= 0, codes, len(uniques))]
+
+
+def flag_keywords(df: pd.DataFrame, keywords: Union[KeywordMatcher, Iterable[str]],
+                  text_columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Copy of `df` with one boolean column per keyword: whether any description column (default
+    KEYWORD_TEXT_COLUMNS present in `df`) contains it, case-insensitively.
+    The keyword "No Recovery" (any case) gives a "No Recovery" column that is also True where the
+    FI column (FI or FRAC_FI) reads "NR", the rule of the legacy Search_KeyWord tool.
+    """
+    matcher = keywords if isinstance(keywords, KeywordMatcher) else KeywordMatcher(keywords)
+    columns = [col for col in (text_columns or KEYWORD_TEXT_COLUMNS) if col in df.columns]
+    if not columns:
+        raise ValueError(f"No description column to search, expected one of {tuple(text_columns or KEYWORD_TEXT_COLUMNS)}")
+
+    flags = matcher.flags([df[col] for col in columns])
+    names = matcher.columns
+    fi_column = next((col for col in FI_COLUMNS if col in df.columns), None)
+    if NO_RECOVERY in names and fi_column is not None:
+        flags[:, names.index(NO_RECOVERY)] |= _reads_no_recovery(df[fi_column])
+
+    # A keyword named like an existing column replaces it (the legacy tool overwrote it)
+    kept = df.drop(columns=[name for name in names if name in df.columns])
+    return pd.concat([kept, pd.DataFrame(flags, columns=names, index=df.index)], axis=1)
@@ -0,0 +1,123 @@
+import re
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+# Columns the rules read, by role: legacy Match_Soil name first, then the mapped interval view / group names
+SOIL_COLUMNS = {
+    'GEOL_DESC': ('GEOL_DESC',),
+    'GEOL': ('GEOL', 'GEOL_LEG'),
+    'Details': ('Details', 'DETL_DESC'),
+    'WETH': ('WETH', 'WETH_GRAD'),
+}
+
+# Soil types from the legacy Match_Soil, in its order (a later match replaces an earlier one):
+# name -> (code, {column role: case-sensitive regex patterns})
+SOIL_TYPE_RULES = {
+    'IV': ('IV', {'WETH': [r'\bIV\b']}),
+    'V': ('V', {'WETH': [r'\bV\b']}),
+    'VI (RESIDUAL SOIL)': ('VI', {'WETH': [r'\bVI\b'], 'GEOL_DESC': ['RESIDUAL SOIL']}),
+    'TOPSOIL': ('TS', {'GEOL_DESC': ['TOPSOIL', 'TOP SOIL'], 'GEOL': ['TOPSOIL', 'TOP SOIL']}),
+    'MARINE DEPOSIT': ('MD', {'GEOL_DESC': ['MARINE DEPOSIT'], 'GEOL': ['MARINE']}),
+    'ALLUVIUM': ('ALL', {'GEOL_DESC': ['ALLUVIUM'], 'GEOL': ['ALL']}),
+    'COLLUVIUM': ('COLL', {'GEOL_DESC': ['COLLUVIUM'], 'GEOL': ['COLL']}),
+    'FILL': ('FILL', {'GEOL_DESC': ['FILL'], 'GEOL': ['FILL']}),
+    'ESTUARINE DEPOSIT': ('ED', {'GEOL_DESC': ['ESTUARINE DEPOSIT'], 'GEOL': ['EST']}),
+}
+
+# Grain sizes, fine to coarse (the order of the code): name -> (output column, code, {column role: patterns})
+GRAIN_SIZE_RULES = {
+    'CLAY': ('Clay', 'c', {'GEOL_DESC': ['CLAY'], 'GEOL': ['CLAY'], 'Details': ['CLAY']}),
+    'SILT': ('Silt', 'z', {'GEOL_DESC': ['SILT'], 'GEOL': ['SILT'], 'Details': ['SILT']}),
+    'SAND': ('Sand', 's', {'GEOL_DESC': ['SAND'], 'GEOL': ['SAND'], 'Details': ['SAND']}),
+    'GRAVEL': ('Gravel', 'g', {'GEOL_DESC': ['GRAV'], 'GEOL': ['GRAV'], 'Details': ['GRAV']}),
+    'COBBLE': ('Cobble', 'cb', {'GEOL_DESC': ['COBBLE'], 'GEOL': ['CBBL'], 'Details': ['COBBLE']}),
+    'BOULDER': ('Boulder', 'bd', {'GEOL_DESC': ['BOULDER'], 'GEOL': ['BLDR'], 'Details': ['BOULDER']}),
+}
+
+SOIL_CODE_COLUMN = "Soil Type/Grain Size"
+
+
+def _column_matches(values: pd.Series, patterns: List[str]) -> np.ndarray:
+    """
+    (rows x patterns) boolean matrix of the patterns found in a text column. The distinct values
+    are joined and scanned once: the pattern only stops where at least one pattern starts, and
+    reports every pattern starting there through optional lookahead groups.
+    Missing and non-text values match nothing.
+    """
+    codes, uniques = pd.factorize(pd.Series(values.to_numpy(dtype=object)))
+    texts = [value if isinstance(value, str) else "" for value in uniques]
+    found = np.zeros((len(texts) + 1, len(patterns)), dtype=bool)
+    if texts and patterns:
+        any_pattern = "|".join(f"(?:{pattern})" for pattern in patterns)
+        scan = re.compile(f"(?=(?:{any_pattern}))" + "".join(f"(?:(?=({pattern})))?" for pattern in patterns))
+        starts = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]])
+        positions, hits = [], []
+        for m in scan.finditer("\0".join(texts)):
+            positions.append(m.start())
+            hits.append([group is not None for group in m.groups()])
+        if positions:
+            rows = np.searchsorted(starts, positions, side="right") - 1
+            np.logical_or.at(found, rows, np.array(hits, dtype=bool))
+    return found[np.where(codes >= 0, codes, len(texts))]
+
+
+def _rule_matches(df: pd.DataFrame, rules: List[Dict[str, List[str]]]) -> np.ndarray:
+    """(rows x rules) boolean matrix: whether any pattern of a rule is found in its column."""
+    matches = np.zeros((len(df.index), len(rules)), dtype=bool)
+    for role, candidates in SOIL_COLUMNS.items():
+        col = next((col for col in candidates if col in df.columns), None)
+        # Every pattern read from this column, over all rules, in one scan
+        owners = [(r, pattern) for r, rule in enumerate(rules) for pattern in rule.get(role, ())]
+        if col is None or not owners:
+            continue
+        found = _column_matches(df[col], [pattern for _, pattern in owners])
+        for i, (r, _) in enumerate(owners):
+            matches[:, r] |= found[:, i]
+    return matches
+
+
+def _codes_by_combination(keys: np.ndarray, build) -> np.ndarray:
+    """`build(key)` for each row's key, called once per distinct key."""
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    codes = np.empty(len(uniques), dtype=object)
+    codes[:] = [build(key) for key in uniques]
+    return codes[inverse.reshape(-1)]
+
+
+def classify_soil(df: pd.DataFrame,
+                  soil_types: Dict[str, Tuple[str, Dict[str, List[str]]]] = SOIL_TYPE_RULES,
+                  grain_sizes: Dict[str, Tuple[str, str, Dict[str, List[str]]]] = GRAIN_SIZE_RULES) -> pd.DataFrame:
+    """
+    Soil type / grain size classification of the legacy Match_Soil tool, driven by rule tables.
+    Runs on the mapped interval view (`get_key_data_intervals_mapped`) or any table with the
+    SOIL_COLUMNS; a missing column matches nothing.
+
+    Returns a copy of `df` with one column per grain size (its code where found, e.g. Sand = "s")
+    and "Soil Type/Grain Size": the code of the last matching soil type, "-", and the codes of the
+    grain sizes found, fine to coarse (e.g. "ALL-c,s"); missing unless both a soil type and a grain
+    size are found.
+    """
+    types = list(soil_types.values())
+    sizes = list(grain_sizes.values())
+    matches = _rule_matches(df, [patterns for _, patterns in types] + [patterns for _, _, patterns in sizes])
+    type_matches, size_matches = matches[:, :len(types)], matches[:, len(types):]
+
+    # Last matching soil type (-1 for none); grain sizes found as a bit mask
+    last_type = np.where(type_matches.any(axis=1), len(types) - 1 - np.argmax(type_matches[:, ::-1], axis=1), -1) \
+        if types else np.full(len(df.index), -1)
+    size_mask = (size_matches.astype(np.int64) << np.arange(len(sizes), dtype=np.int64)).sum(axis=1) \
+        if sizes else np.zeros(len(df.index), dtype=np.int64)
+
+    def soil_code(key: int):
+        soil_type, mask = divmod(int(key), 1 << len(sizes))
+        if soil_type == 0 or mask == 0:
+            return None
+        codes = [code for g, (_, code, _) in enumerate(sizes) if mask >> g & 1]
+        return f"{types[soil_type - 1][0]}-{','.join(codes)}"
+
+    result = df.copy()
+    for g, (column, code, _) in enumerate(sizes):
+        result[column] = np.where(size_matches[:, g], code, None)
+    result[SOIL_CODE_COLUMN] = _codes_by_combination(((last_type + 1) << len(sizes)) + size_mask, soil_code)
+    return result
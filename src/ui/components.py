@@ -2,7 +2,9 @@ import streamlit as st
 import pandas as pd
 from typing import List, Tuple, Any
 import io
-from src.processing.combiner import get_key_data_intervals_mapped,get_key_data_intervals_full,build_key_data_excel_options
+from src.processing.combiner import KeyDataSession
+from src.processing.keywords import KeywordMatcher, flag_keywords
+from src.processing.soil import SOIL_CODE_COLUMN, classify_soil
 
 def setup_page():
     st.set_page_config(page_title="AGS File Processor", layout="wide")
@@ -105,9 +107,10 @@ def display_workbook_download(combined_groups: dict):
             custom_excel = buffer.getvalue()
         st.download_button("Download selected groups workbook", custom_excel, "custom_groups.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
         
-def display_key_data_workbook(key_data_groups: dict):
+def display_key_data_workbook(session: KeyDataSession):
     
     
+    key_data_groups = session.key_data_groups
     st.subheader("Key Data Combined by Depth Intervals")
 
     if not key_data_groups:
@@ -128,9 +131,6 @@ def display_key_data_workbook(key_data_groups: dict):
         st.warning("Please select at least one group to proceed.")
         return
     
-    # Filter the key data groups based on selection
-    filtered_key_data = {k: v for k, v in key_data_groups.items() if k in selected_key_groups}
-
     # Add button to trigger processing
     if st.button("🔄 Generate Key Data Intervals", type="primary"):
         # Build all Excel options at once
@@ -140,7 +140,8 @@ def display_key_data_workbook(key_data_groups: dict):
         status.text("Building Excel files...")
         progress.progress(0.5)
         
-        excel_options = build_key_data_excel_options(filtered_key_data)
+        # Intervals are computed once per group selection and shared by both views and workbooks
+        excel_options = session.excel_options(selected_key_groups)
         
         progress.progress(1.0)
         status.text("Ready!")
@@ -162,9 +163,9 @@ def display_key_data_workbook(key_data_groups: dict):
                 
                 # Show quick preview (only mapped and full intervals)
                 if option_name == "Mapped Intervals":
-                    df = get_key_data_intervals_mapped(filtered_key_data)
+                    df = session.mapped(selected_key_groups)
                 elif option_name == "Full Intervals":
-                    df = get_key_data_intervals_full(filtered_key_data)
+                    df = session.full(selected_key_groups)
                 else:
                     continue  # Skip raw groups
                 
@@ -187,4 +188,116 @@ def display_key_data_workbook(key_data_groups: dict):
         progress.empty()
         status.empty()
     else:
-        st.info(f"Selected {len(selected_key_groups)} groups. Click the button above to generate depth intervals.")
\ No newline at end of file
+        st.info(f"Selected {len(selected_key_groups)} groups. Click the button above to generate depth intervals.")
+
+
+def display_depth_search(session: KeyDataSession):
+    st.subheader("🔎 Search key data by depth")
+
+    # Same groups as the interval mapping above (all of them until the selection is made)
+    selected_key_groups = st.session_state.get("key_data_groups", list(session.key_data_groups))
+    if not session.key_data_groups or not selected_key_groups:
+        return
+
+    # Holes read from the group tables: the depth index is only built once a search is submitted
+    hole_ids = sorted({str(hole_id) for name, df in session.key_data_groups.items()
+                       if name in selected_key_groups and "HOLE_ID" in df.columns
+                       for hole_id in df["HOLE_ID"].dropna().unique()})
+    with st.form("depth_search"):
+        st.caption("Upload a table with HOLE_ID (or GIU_HOLE_ID) and DEPTH, or DEPTH_FROM and DEPTH_TO, to search many depths at once.")
+        query_file = st.file_uploader("Depths to search (optional)", type=["xlsx", "csv"], key="depth_queries")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            hole_id = st.selectbox("Hole", hole_ids, key="depth_hole")
+        with col2:
+            depth_from = st.number_input("Depth from (m)", min_value=0.0, value=0.0, key="depth_from")
+        with col3:
+            depth_to = st.number_input("Depth to (m, same as from for a single depth)", min_value=0.0, value=0.0, key="depth_to")
+        submitted = st.form_submit_button("Search depths")
+    if not submitted:
+        return
+
+    if query_file is not None:
+        if query_file.name.lower().endswith(".csv"):
+            queries = pd.read_csv(query_file)
+        else:
+            queries = pd.read_excel(query_file)
+    elif depth_to > depth_from:
+        queries = pd.DataFrame({"HOLE_ID": [hole_id], "DEPTH_FROM": [depth_from], "DEPTH_TO": [depth_to]})
+    else:
+        queries = pd.DataFrame({"HOLE_ID": [hole_id], "DEPTH": [depth_from]})
+
+    index = session.depth_index(selected_key_groups)
+    if not len(index):
+        st.info("No depth intervals to search.")
+        return
+
+    try:
+        results = index.search(queries)
+    except ValueError as e:
+        st.error(str(e))
+        return
+
+    st.caption(f"{len(results):,} rows")
+    st.dataframe(results, use_container_width=True)
+    st.download_button(
+        "Download search results",
+        results.to_csv(index=False).encode('utf-8'),
+        "key_data_depth_search.csv",
+        "text/csv"
+    )
+
+
+def display_keyword_search(session: KeyDataSession):
+    st.subheader("🔤 Search keywords in descriptions")
+
+    selected_key_groups = st.session_state.get("key_data_groups", list(session.key_data_groups))
+    if not session.key_data_groups or not selected_key_groups:
+        return
+
+    keywords_text = st.text_area(
+        "Keywords to look for in GEOL_DESC and Details, one per line ('No Recovery' also flags intervals with FI = NR)",
+        key="search_keywords"
+    )
+    matcher = KeywordMatcher(line.strip() for line in keywords_text.splitlines())
+    if not len(matcher):
+        return
+
+    intervals = session.mapped(selected_key_groups)
+    if intervals.empty:
+        st.info("No depth intervals to search.")
+        return
+
+    results = flag_keywords(intervals, matcher)
+    flag_columns = matcher.columns
+    st.caption(f"{int(results[flag_columns].any(axis=1).sum()):,} of {len(results):,} intervals contain a keyword")
+    st.dataframe(results[flag_columns].sum().rename("Intervals").to_frame().T, use_container_width=True)
+    st.download_button(
+        "Download intervals with keyword columns",
+        results.to_csv(index=False).encode('utf-8'),
+        "key_data_keywords.csv",
+        "text/csv"
+    )
+
+
+def display_soil_classification(session: KeyDataSession):
+    st.subheader("🪨 Soil type / grain size")
+
+    selected_key_groups = st.session_state.get("key_data_groups", list(session.key_data_groups))
+    if not session.key_data_groups or not selected_key_groups:
+        return
+
+    if st.checkbox("Classify soil types and grain sizes of the mapped intervals (e.g. ALL-c,s)", key="classify_soil"):
+        intervals = session.mapped(selected_key_groups)
+        if intervals.empty:
+            st.info("No depth intervals to classify.")
+            return
+
+        results = classify_soil(intervals)
+        st.dataframe(results[SOIL_CODE_COLUMN].value_counts().rename("Intervals").to_frame(), use_container_width=True)
+        st.download_button(
+            "Download intervals with soil classification",
+            results.to_csv(index=False).encode('utf-8'),
+            "key_data_soil_types.csv",
+            "text/csv"
+        )
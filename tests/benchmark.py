@@ -0,0 +1,566 @@
+import sys
+import os
+import glob
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Add root to path so we can import src
+sys.path.append(os.getcwd())
+
+from src.parsing.utils import split_quoted_csv, iter_ags_records, detect_ags_version
+from src.parsing.ags3 import AGS3Parser
+from src.parsing.ags4 import AGS4Parser
+from src.processing.combiner import KEY_DATA_GROUPS, key_data_mapped_columns, combine_files, expand_rows, \
+    drop_singleton_rows, normalize_columns, CombinedStore, KEY_DATA_MAPPED_CONFIG, get_key_data_groups, \
+    get_key_data_intervals_mapped, get_key_data_intervals_full, _calculate_master_intervals, KeyDataSession
+from src.processing.keys import KeyDictionary
+from src.processing.ingest import HolePrefix
+from src.processing.depth_index import DepthIndex
+from src.processing.keywords import flag_keywords
+from src.processing.soil import SOIL_TYPE_RULES, GRAIN_SIZE_RULES, SOIL_COLUMNS, classify_soil
+
+
+def best_of(fn, repeat: int = 20) -> float:
+    """Best wall time (seconds) over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(label: str, before: float, after: float):
+    print(f"  {label:<40} {before * 1e3:9.2f} ms -> {after * 1e3:9.2f} ms  (x{before / after:.1f})")
+
+
+def bench_tokenizer(min_size: int = 300_000):
+    print("AGS3 tokenizer (per-line csv.reader -> iter_ags_records)")
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if len(content) < min_size:
+            continue
+
+        def per_line():
+            for line in content.decode("latin-1").splitlines():
+                if line.strip():
+                    split_quoted_csv(line)
+
+        def single_pass():
+            for _ in iter_ags_records(content):
+                pass
+
+        lines = content.decode("latin-1").splitlines()
+
+        def split_only():
+            # Lower bound of any tokenizer returning a field list per line
+            for line in lines:
+                line[1:-1].split('","')
+
+        before = best_of(per_line)
+        report(os.path.basename(file_path), before, best_of(single_pass))
+        report("  ... bound: str.split per line only", before, best_of(split_only))
+
+
+def bench_ags4_engines():
+    print("AGS4 parser (python_ags4 engine -> native engine)")
+    python_ags4 = AGS4Parser(engine="python_ags4")
+    native = AGS4Parser(engine="native")
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) != "AGS4":
+            continue
+        # Same groups with every DATA row repeated, to see how both engines scale with rows
+        enlarged = b"".join(line * 20 if line.startswith(b'"DATA"') else line
+                            for line in content.splitlines(keepends=True))
+        for label, data in ((os.path.basename(file_path), content), ("  ... DATA rows x20", enlarged)):
+            report(label,
+                   best_of(lambda: python_ags4.parse(data, "f.ags"), repeat=5),
+                   best_of(lambda: native.parse(data, "f.ags"), repeat=5))
+
+
+def bench_lazy_groups(min_size: int = 300_000):
+    print("Time to first view (full parse -> group index + GEOL on demand)")
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if len(content) < min_size or detect_ags_version(content) != "AGS3":
+            continue
+        parser = AGS3Parser()
+
+        def first_view():
+            groups = parser.parse(content, "f.ags", lazy=True).groups
+            if "GEOL" in groups:
+                groups["GEOL"]
+
+        report(os.path.basename(file_path),
+               best_of(lambda: parser.parse(content, "f.ags"), repeat=5),
+               best_of(first_view, repeat=5))
+
+
+def bench_projection(min_size: int = 300_000):
+    print("Key data parse (all groups -> KEY_DATA_GROUPS with mapped-view columns)")
+    columns = key_data_mapped_columns()
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if len(content) < min_size or detect_ags_version(content) != "AGS3":
+            continue
+        parser = AGS3Parser()
+        report(os.path.basename(file_path),
+               best_of(lambda: parser.parse(content, "f.ags"), repeat=5),
+               best_of(lambda: parser.parse(content, "f.ags", groups=KEY_DATA_GROUPS, columns=columns), repeat=5))
+
+
+def peak_memory(fn) -> int:
+    """Peak traced allocation (bytes) while running `fn`."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_chunked_parse(copies: int = 40, chunk_rows: int = 5_000):
+    print(f"Peak memory, full parse -> iter_chunks({chunk_rows} rows), largest AGS3 file repeated x{copies}")
+    largest = max((p for p in glob.glob("ags_data/*") if detect_ags_version(open(p, "rb").read()) == "AGS3"),
+                  key=os.path.getsize)
+    with open(largest, "rb") as f:
+        content = f.read()
+    # Repeat the data rows of every section so each group grows without duplicating group headers
+    lines = content.splitlines(keepends=True)
+    body = [line for line in lines if not line.lstrip().startswith(b'"*')]
+    content = content + b"".join(body) * (copies - 1)
+    parser = AGS3Parser()
+
+    def consume():
+        for _ in parser.iter_chunks(content, "f.ags", chunk_rows=chunk_rows):
+            pass
+
+    full, chunked = peak_memory(lambda: parser.parse(content, "f.ags")), peak_memory(consume)
+    print(f"  {os.path.basename(largest):<40} {full / 1e6:9.1f} MB -> {chunked / 1e6:9.1f} MB  (x{full / chunked:.1f})")
+
+
+def bench_typed_columns(min_size: int = 300_000):
+    print("Depth columns, text -> typed parse (memory of all groups; pd.to_numeric on *_TOP/*_BASE as the interval code does)")
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if len(content) < min_size or detect_ags_version(content) != "AGS3":
+            continue
+        parser = AGS3Parser()
+        text, typed = parser.parse(content, "f.ags").groups, parser.parse(content, "f.ags", typed=True).groups
+
+        def size(groups):
+            return sum(int(df.memory_usage(deep=True).sum()) for df in groups.values())
+
+        def to_numeric(groups):
+            for df in groups.values():
+                for col in df.columns:
+                    if col.endswith(("_TOP", "_BASE", "_BOT")):
+                        pd.to_numeric(df[col], errors="coerce")
+
+        name = os.path.basename(file_path)
+        print(f"  {name:<40} {size(text) / 1e6:9.2f} MB -> {size(typed) / 1e6:9.2f} MB")
+        report(name, best_of(lambda: to_numeric(text), repeat=5), best_of(lambda: to_numeric(typed), repeat=5))
+
+
+def bench_key_encoding():
+    print("Combined AGS3 corpus, SOURCE_FILE + hole keys as text -> shared categoricals")
+    combined = combined_ags3_corpus()
+    key_cols = ["SOURCE_FILE", "HOLE_ID"]
+    as_text = sum(int(df[c].astype(object).memory_usage(deep=True)) for df in combined.values() for c in key_cols if c in df)
+    encoded = sum(int(df[c].memory_usage(deep=True)) for df in combined.values() for c in key_cols if c in df)
+    print(f"  {'key column memory':<40} {as_text / 1e6:9.2f} MB -> {encoded / 1e6:9.2f} MB")
+
+    geol = combined["GEOL"]
+    hole_ids = geol["HOLE_ID"].astype(str).unique()[:200]
+    text = geol["HOLE_ID"].astype(str)
+    keys = KeyDictionary()
+    codes = keys.codes(geol["HOLE_ID"], as_text=True)
+
+    def compare_text():
+        for hole_id in hole_ids:
+            (text == str(hole_id)).any()
+
+    def compare_codes():
+        for hole_id in hole_ids:
+            (codes == keys.code(hole_id)).any()
+
+    report("GEOL hole lookups (200 holes)", best_of(compare_text, repeat=5), best_of(compare_codes, repeat=5))
+
+
+def expand_rows_by_record(df: pd.DataFrame) -> pd.DataFrame:
+    """The previous row-by-row expand_rows, kept as the benchmark reference."""
+    rows = []
+    for row in df.to_dict('records'):
+        split_data = {k: v.split(" | ") if isinstance(v, str) and " | " in v else [v] for k, v in row.items()}
+        max_len = max(len(v) for v in split_data.values())
+        if all(len(set(v)) == 1 for v in split_data.values() if len(v) > 1):
+            rows.append({k: v[0] for k, v in split_data.items()})
+        else:
+            for i in range(max_len):
+                rows.append({k: v[i] if i < len(v) else "" for k, v in split_data.items()})
+    return pd.DataFrame(rows)
+
+
+def combined_ags3_corpus():
+    parsed = []
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) == "AGS3":
+            parsed.append(AGS3Parser().parse(content, os.path.basename(file_path)))
+    return combine_files(parsed)
+
+
+def bench_expand_rows(min_rows: int = 100_000):
+    print(f"expand_rows, combined corpus groups repeated to {min_rows:,}+ rows (records loop -> split/explode)")
+    combined = combined_ags3_corpus()
+    for group in ("GEOL", "SAMP", "DETL"):
+        df = combined[group]
+        big = pd.concat([df] * (min_rows // len(df.index) + 1), ignore_index=True)
+        report(f"{group} ({len(big.index):,} rows)",
+               best_of(lambda: expand_rows_by_record(big), repeat=3), best_of(lambda: expand_rows(big), repeat=3))
+
+
+def drop_singleton_rows_by_replace(df: pd.DataFrame) -> pd.DataFrame:
+    """The previous drop_singleton_rows (whole-frame regex replace), kept as the benchmark reference."""
+    clean = df.replace(r"^\s*$", np.nan, regex=True).infer_objects(copy=False)
+    return df.loc[clean.notna().sum(axis=1) > 1].reset_index(drop=True)
+
+
+def bench_drop_singleton_rows(copies: int = 20):
+    print(f"drop_singleton_rows per merged group, AGS3 corpus x{copies} (regex replace -> column counts)")
+    merged = {}
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) == "AGS3":
+            for name, df in AGS3Parser().parse(content, os.path.basename(file_path)).groups.items():
+                merged.setdefault(name, []).extend([normalize_columns(df.copy())] * copies)
+    merged = {name: pd.concat(dfs, ignore_index=True) for name, dfs in merged.items()}
+    for name, df in sorted(merged.items(), key=lambda item: -item[1].size)[:8]:
+        report(f"{name} ({len(df.index):,} rows x {len(df.columns)})",
+               best_of(lambda: drop_singleton_rows_by_replace(df), repeat=3),
+               best_of(lambda: drop_singleton_rows(df, non_blank=["SOURCE_FILE"]), repeat=3))
+
+
+def bench_combine_engines(copies: int = 10):
+    print(f"combine_files per group, AGS3 corpus x{copies} (concat -> aligned): time, then peak memory")
+    parsed = []
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) == "AGS3":
+            parsed.append(AGS3Parser().parse(content, os.path.basename(file_path)))
+    parsed = parsed * copies
+    sizes = {}
+    for pfile in parsed:
+        for name, df in pfile.groups.items():
+            sizes[name] = sizes.get(name, 0) + df.size
+    for name in sorted(sizes, key=sizes.get, reverse=True)[:6]:
+        before = best_of(lambda: combine_files(parsed, [name], engine="concat"), repeat=3)
+        after = best_of(lambda: combine_files(parsed, [name], engine="aligned"), repeat=3)
+        report(name, before, after)
+        before = peak_memory(lambda: combine_files(parsed, [name], engine="concat"))
+        after = peak_memory(lambda: combine_files(parsed, [name], engine="aligned"))
+        print(f"  {name + ' peak memory':<40} {before / 1e6:9.1f} MB -> {after / 1e6:9.1f} MB  "
+              f"(saved {(before - after) / 1e6:.1f} MB)")
+    report("all groups", best_of(lambda: combine_files(parsed, engine="concat"), repeat=3),
+           best_of(lambda: combine_files(parsed, engine="aligned"), repeat=3))
+
+
+def bench_combined_store(copies: int = 10):
+    print(f"One file added / removed, AGS3 corpus x{copies} (combine_files over all files -> CombinedStore)")
+    parsed = []
+    for copy in range(copies):
+        for file_path in sorted(glob.glob("ags_data/*")):
+            with open(file_path, "rb") as f:
+                content = f.read()
+            if detect_ags_version(content) == "AGS3":
+                parsed.append(AGS3Parser().parse(content, f"{copy}_{os.path.basename(file_path)}"))
+    extra = max(parsed, key=lambda pfile: sum(df.size for df in pfile.groups.values()))
+    others = [pfile for pfile in parsed if pfile is not extra]
+    store = CombinedStore()
+    for pfile in others:
+        store.add(pfile.filename, pfile)
+
+    def add_then_remove():
+        start = time.perf_counter()
+        store.add(extra.filename, extra)
+        added = time.perf_counter() - start
+        start = time.perf_counter()
+        store.remove(extra.filename)
+        return added, time.perf_counter() - start
+
+    add, remove = (min(times) for times in zip(*[add_then_remove() for _ in range(5)]))
+    report(f"sync {len(parsed)} files into an empty store", best_of(lambda: combine_files(parsed), repeat=3),
+           best_of(lambda: CombinedStore().sync({pfile.filename: pfile for pfile in parsed}), repeat=3))
+    report(f"add {extra.filename} ({len(parsed)} files)", best_of(lambda: combine_files(parsed), repeat=3), add)
+    report(f"remove {extra.filename}", best_of(lambda: combine_files(others), repeat=3), remove)
+
+
+def intervals_mapped_by_row(key_data_groups):
+    """The previous get_key_data_intervals_mapped (one mask over all intervals per source row), as the reference."""
+    result_df = _calculate_master_intervals(
+        key_data_groups, {g: (cfg[0], cfg[1]) for g, cfg in KEY_DATA_MAPPED_CONFIG.items()})
+    for _, _, cols in KEY_DATA_MAPPED_CONFIG.values():
+        for col in cols.values():
+            result_df[col] = None
+    holes = KeyDictionary()
+    result_codes = holes.codes(result_df['HOLE_ID'], as_text=True)
+    for group_name, (top_col, base_col, column_mapping) in KEY_DATA_MAPPED_CONFIG.items():
+        if group_name not in key_data_groups: continue
+        source_df = key_data_groups[group_name].copy()
+        source_df[top_col] = pd.to_numeric(source_df[top_col], errors='coerce')
+        source_df[base_col] = pd.to_numeric(source_df[base_col], errors='coerce')
+        source_df = source_df.dropna(subset=[top_col, base_col])
+        source_codes = holes.codes(source_df['HOLE_ID'], as_text=True)
+        for pos, (_, row) in enumerate(source_df.iterrows()):
+            mask = ((result_codes == source_codes[pos]) & (result_df['DEPTH_FROM'] >= row[top_col])
+                    & (result_df['DEPTH_FROM'] < row[base_col]))
+            if mask.any():
+                for source_col, target_col in column_mapping.items():
+                    if source_col in row.index:
+                        result_df.loc[mask, target_col] = row[source_col]
+    return result_df.reset_index(drop=True)
+
+
+def combined_corpus_key_data():
+    parsed = []
+    for file_path in sorted(glob.glob("ags_data/*")):
+        with open(file_path, "rb") as f:
+            content = f.read()
+        parser = AGS3Parser() if detect_ags_version(content) == "AGS3" else AGS4Parser()
+        parsed.append(parser.parse(content, os.path.basename(file_path)))
+    return get_key_data_groups(combine_files(parsed))
+
+
+def bench_intervals_mapped():
+    print("Mapped interval view, whole corpus (row masks -> per-hole interval join)")
+    key_data = combined_corpus_key_data()
+    rows = sum(len(df.index) for df in key_data.values())
+    report(f"key groups ({rows:,} source rows)",
+           best_of(lambda: intervals_mapped_by_row(key_data), repeat=1),
+           best_of(lambda: get_key_data_intervals_mapped(key_data), repeat=3))
+
+
+FULL_DEPTH_KEYS = {
+    'CORE': ('CORE_TOP', 'CORE_BOT'), 'DETL': ('DETL_TOP', 'DETL_BASE'), 'FRAC': ('FRAC_TOP', 'FRAC_BASE'),
+    'GEOL': ('GEOL_TOP', 'GEOL_BASE'), 'WETH': ('WETH_TOP', 'WETH_BASE'), 'SAMP': ('SAMP_TOP', 'SAMP_BASE'),
+}
+
+
+def intervals_full_by_row(key_data_groups):
+    """The previous get_key_data_intervals_full (columns added one by one, .loc per source row), as the reference."""
+    result_df = _calculate_master_intervals(key_data_groups, FULL_DEPTH_KEYS)
+    structural_cols = {'HOLE_ID', 'SOURCE_FILE', 'GIU_HOLE_ID', 'GIU_NO', *(c for keys in FULL_DEPTH_KEYS.values() for c in keys)}
+    for group_name in FULL_DEPTH_KEYS:
+        if group_name in key_data_groups:
+            for col in key_data_groups[group_name].columns:
+                if col not in structural_cols and col not in result_df.columns:
+                    result_df[col] = None
+    holes = KeyDictionary()
+    result_codes = holes.codes(result_df['HOLE_ID'], as_text=True)
+    for group_name, (top_col, base_col) in FULL_DEPTH_KEYS.items():
+        if group_name not in key_data_groups: continue
+        source_df = key_data_groups[group_name].copy()
+        source_df[top_col] = pd.to_numeric(source_df[top_col], errors='coerce')
+        source_df[base_col] = pd.to_numeric(source_df[base_col], errors='coerce')
+        source_df = source_df.dropna(subset=[top_col, base_col])
+        valid_cols = [c for c in source_df.columns if c in result_df.columns and c not in structural_cols]
+        source_codes = holes.codes(source_df['HOLE_ID'], as_text=True)
+        for pos, (_, row) in enumerate(source_df.iterrows()):
+            mask = ((result_codes == source_codes[pos]) & (result_df['DEPTH_FROM'] >= row[top_col])
+                    & (result_df['DEPTH_FROM'] < row[base_col]))
+            if mask.any():
+                result_df.loc[mask, valid_cols] = row[valid_cols].values
+    return result_df.reset_index(drop=True)
+
+
+def bench_intervals_full():
+    print("Full interval view, whole corpus (.loc per source row -> one take per group)")
+    key_data = combined_corpus_key_data()
+    rows = sum(len(df.index) for df in key_data.values())
+    report(f"key groups ({rows:,} source rows)",
+           best_of(lambda: intervals_full_by_row(key_data), repeat=1),
+           best_of(lambda: get_key_data_intervals_full(key_data), repeat=3))
+
+
+def master_intervals_by_hole(key_data_groups, group_depth_keys):
+    """The previous _calculate_master_intervals (one scan of every group per hole), as the reference."""
+    all_holes = set()
+    for df in key_data_groups.values():
+        if 'HOLE_ID' in df.columns:
+            all_holes.update(df['HOLE_ID'].dropna().astype(str).unique())
+    holes = KeyDictionary()
+    group_codes = {group_name: holes.codes(key_data_groups[group_name]['HOLE_ID'], as_text=True)
+                   for group_name in group_depth_keys if group_name in key_data_groups}
+    all_rows = []
+    for hole_id in all_holes:
+        all_depths = []
+        hole_code = holes.code(hole_id)
+        for group_name, (top_col, base_col) in group_depth_keys.items():
+            if group_name not in group_codes: continue
+            hole_data = key_data_groups[group_name][group_codes[group_name] == hole_code]
+            all_depths.extend(pd.to_numeric(hole_data[top_col], errors='coerce').dropna().tolist())
+            all_depths.extend(pd.to_numeric(hole_data[base_col], errors='coerce').dropna().tolist())
+        unique_depths = sorted(set(all_depths))
+        for top, base in zip(unique_depths, unique_depths[1:]):
+            all_rows.append({'HOLE_ID': hole_id, 'DEPTH_FROM': top, 'DEPTH_TO': base, 'THICKNESS_M': base - top})
+    return pd.DataFrame(all_rows)
+
+
+def synthetic_key_data(n_holes: int, rows_per_group: int = 8, seed: int = 0):
+    """Key groups of `n_holes` boreholes with overlapping text depths, like parsed AGS3 tables."""
+    rng = np.random.default_rng(seed)
+    groups = {}
+    for group_name, (top_col, base_col) in FULL_DEPTH_KEYS.items():
+        n = n_holes * rows_per_group
+        tops = np.round(rng.uniform(0, 30, n), 2)
+        groups[group_name] = pd.DataFrame({
+            'HOLE_ID': [f"BH{i}" for i in rng.integers(0, n_holes, n)],
+            top_col: tops.astype(str),
+            base_col: np.round(tops + rng.uniform(0.1, 3, n), 2).astype(str),
+        })
+    return groups
+
+
+def bench_master_intervals():
+    print("Master intervals (per-hole scans -> one stacked sort)")
+    for n_holes in (1_000, 10_000):
+        key_data = synthetic_key_data(n_holes)
+        report(f"{n_holes:,} boreholes", best_of(lambda: master_intervals_by_hole(key_data, FULL_DEPTH_KEYS), repeat=1),
+               best_of(lambda: _calculate_master_intervals(key_data, FULL_DEPTH_KEYS), repeat=3))
+
+
+def bench_key_data_session():
+    print("Key data workbook: both views for the workbooks, again for the previews (4 computations -> 1 session)")
+
+    def standalone(key_data):
+        for _ in range(2):
+            get_key_data_intervals_mapped(key_data)
+            get_key_data_intervals_full(key_data)
+
+    def session(key_data):
+        views = KeyDataSession(key_data)
+        for _ in range(2):
+            views.mapped()
+            views.full()
+
+    for label, key_data in (("whole corpus", combined_corpus_key_data()),
+                            ("10,000 boreholes", synthetic_key_data(10_000))):
+        report(label, best_of(lambda: standalone(key_data), repeat=3), best_of(lambda: session(key_data), repeat=3))
+
+
+def bench_depth_index(n_queries: int = 1_000):
+    print(f"Depth lookups, {n_queries:,} points and ranges (scan of the interval table per query -> DepthIndex)")
+    for n_holes in (1_000, 10_000):
+        intervals = KeyDataSession(synthetic_key_data(n_holes)).intervals()
+        rng = np.random.default_rng(1)
+        hole_ids = intervals["HOLE_ID"].to_numpy()[rng.integers(0, len(intervals.index), n_queries)]
+        depths = rng.uniform(0, 30, n_queries)
+
+        def scan():
+            for hole_id, depth in zip(hole_ids, depths):
+                intervals[(intervals["HOLE_ID"] == hole_id) & (intervals["DEPTH_FROM"] <= depth) & (intervals["DEPTH_TO"] > depth)]
+                intervals[(intervals["HOLE_ID"] == hole_id) & (intervals["DEPTH_FROM"] < depth + 5) & (intervals["DEPTH_TO"] > depth)]
+
+        def indexed():
+            index = DepthIndex(intervals)
+            index.at(hole_ids, depths)
+            index.between(hole_ids, depths, depths + 5)
+
+        report(f"{len(intervals.index):,} intervals", best_of(scan, repeat=1), best_of(indexed, repeat=3))
+
+
+def bench_keyword_flags(n_keywords: int = 200, copies: int = 2):
+    print(f"Keyword flags, {n_keywords} keywords (str.contains per keyword and column -> one combined regex)")
+    intervals = get_key_data_intervals_mapped(combined_corpus_key_data())
+    intervals = pd.concat([intervals] * copies, ignore_index=True)
+    words = pd.Series(" ".join(intervals["GEOL_DESC"].dropna().astype(str)).lower().split()).value_counts().index
+    keywords = [word for word in words if word.isalpha() and len(word) > 3][:n_keywords]
+
+    def per_keyword():
+        # The legacy Search_KeyWord loop
+        for keyword in keywords:
+            intervals["GEOL_DESC"].str.contains(keyword, case=False) | intervals["Details"].str.contains(keyword, case=False)
+
+    report(f"{len(intervals.index):,} intervals", best_of(per_keyword, repeat=1),
+           best_of(lambda: flag_keywords(intervals, keywords), repeat=3))
+
+
+def soil_codes_by_rule(df):
+    """The legacy Match_Soil loop (str.contains per pattern, .loc per rule, stack/groupby join), as the reference."""
+    df = df.copy()
+    columns = {role: next((c for c in names if c in df.columns), None) for role, names in SOIL_COLUMNS.items()}
+
+    def found(patterns):
+        mask = pd.Series(False, index=df.index)
+        for role, role_patterns in patterns.items():
+            for pattern in role_patterns:
+                if columns[role] is not None:
+                    mask |= df[columns[role]].str.contains(pattern, case=True, na=False).astype(bool)
+        return mask
+
+    for code, patterns in SOIL_TYPE_RULES.values():
+        df.loc[found(patterns), 'Soil Type'] = code
+    for column, code, patterns in GRAIN_SIZE_RULES.values():
+        df.loc[found(patterns), column] = code
+    grain_columns = [column for column, _, _ in GRAIN_SIZE_RULES.values() if column in df.columns]
+    df['Grain Size'] = df[grain_columns].stack().groupby(level=0).apply(lambda x: ','.join(x))
+    return df['Soil Type'] + '-' + df['Grain Size']
+
+
+def bench_soil_classification(copies: int = 5):
+    print("Soil type / grain size (str.contains per pattern + groupby join -> one scan per column)")
+    intervals = get_key_data_intervals_mapped(combined_corpus_key_data())
+    intervals = pd.concat([intervals] * copies, ignore_index=True)
+    report(f"{len(intervals.index):,} intervals", best_of(lambda: soil_codes_by_rule(intervals), repeat=3),
+           best_of(lambda: classify_soil(intervals), repeat=3))
+
+
+def bench_hole_prefix(n_rows: int = 1_000_000, n_holes: int = 2_000):
+    print("Hole ID prefixing (astype(str).str.strip() per row -> once per distinct hole)")
+    rng = np.random.default_rng(2)
+    hole_ids = np.array([f" BH{i} " for i in range(n_holes)], dtype=object)[rng.integers(0, n_holes, n_rows)]
+    groups = [pd.DataFrame({"HOLE_ID": hole_ids[i::4]}) for i in range(4)]
+
+    def per_row():
+        for df in groups:
+            "F_" + df["HOLE_ID"].astype(str).str.strip()
+
+    def per_hole():
+        hole_prefix = HolePrefix("F_")
+        for df in groups:
+            hole_prefix(df.copy(deep=False))
+
+    report(f"4 groups, {n_rows:,} rows", best_of(per_row, repeat=3), best_of(per_hole, repeat=3))
+
+
+if __name__ == "__main__":
+    bench_tokenizer()
+    bench_ags4_engines()
+    bench_lazy_groups()
+    bench_projection()
+    bench_chunked_parse()
+    bench_typed_columns()
+    bench_key_encoding()
+    bench_expand_rows()
+    bench_drop_singleton_rows()
+    bench_combine_engines()
+    bench_combined_store()
+    bench_intervals_mapped()
+    bench_intervals_full()
+    bench_master_intervals()
+    bench_key_data_session()
+    bench_depth_index()
+    bench_keyword_flags()
+    bench_soil_classification()
+    bench_hole_prefix()
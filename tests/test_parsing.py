@@ -0,0 +1,803 @@
+import sys
+import os
+import glob
+import warnings
+import numpy as np
+import pandas as pd
+
+# Add root to path so we can import src
+sys.path.append(os.getcwd())
+
+import codecs
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src.parsing.utils import split_quoted_csv, iter_ags_records, detect_ags_version, detect_ags
+from src.parsing.ags3 import AGS3Parser
+from src.parsing.column_types import numeric_values
+from src.parsing.ags4 import AGS4Parser
+from src.processing.cache import ParseCache, estimate_parsed_size
+from src.processing import ingest as ingest_module
+from src.processing.ingest import IngestJob, HolePrefix, apply_prefix, ingest_file, ingest_files, iter_file_chunks
+from src.processing.combiner import KEY_DATA_DEPTH_KEYS, KEY_DATA_GROUPS, key_data_mapped_columns, combine_files, expand_rows, \
+    drop_singleton_rows, CombinedStore, KeyDataSession, get_key_data_intervals_mapped, get_key_data_intervals_full, _calculate_master_intervals
+from src.processing.keys import KeyDictionary
+from src.processing.depth_index import DepthIndex
+from src.processing.keywords import KeywordMatcher, flag_keywords
+from src.processing.soil import SOIL_CODE_COLUMN, classify_soil
+from src.domain.models import AGSVersion, HoleFilter, ParsedAGSFile
+from python_ags4 import AGS4
+
+AGS_FILES = sorted(glob.glob("ags_data/*"))
+
+
+def test_parse_cache():
+    def parsed(size):
+        return ParsedAGSFile(filename="f.ags", groups={"G": pd.DataFrame({"A": np.zeros(size, dtype=np.int8)})},
+                             version=AGSVersion.AGS4)
+
+    one_kb = estimate_parsed_size(parsed(1000))
+    cache = ParseCache(max_bytes=3 * one_kb)
+    keys = [ParseCache.make_key(b"content", f"f{i}.ags", "AGS4", False) for i in range(4)]
+    for key in keys[:3]:
+        cache.put(key, parsed(1000))
+    assert cache.get(keys[0]) is not None  # f0 becomes the most recently used
+    cache.put(keys[3], parsed(1000))
+    assert keys[1] not in cache and all(key in cache for key in (keys[0], keys[2], keys[3]))
+    assert cache.get(keys[1]) is None
+    assert cache.stats() == {"entries": 3, "hits": 1, "misses": 1, "evictions": 1, "bytes": 3 * one_kb}
+
+    # Larger than the whole budget: not cached, nothing evicted
+    cache.put(ParseCache.make_key(b"big", "big.ags", "AGS4", False), parsed(10000))
+    assert len(cache) == 3 and cache.evictions == 1
+
+    # Every parse option is part of the key
+    base = ParseCache.make_key(b"content", "f.ags", "AGS4", False)
+    variants = [
+        ParseCache.make_key(b"content", "g.ags", "AGS4", False),
+        ParseCache.make_key(b"content", "f.ags", "AGS4", True),
+        ParseCache.make_key(b"content", "f.ags", "AGS4", False, typed=True),
+        ParseCache.make_key(b"content", "f.ags", "AGS4", False, lazy=True),
+        ParseCache.make_key(b"content", "f.ags", "AGS3", False),
+        ParseCache.make_key(b"other", "f.ags", "AGS4", False),
+    ]
+    assert len({base, *variants}) == len(variants) + 1
+    assert base == ParseCache.make_key(b"content", "f.ags", "AGS4", False)
+
+    # Lazy entries are re-measured on read, as their groups load
+    content = '\n'.join(['"**HOLE"', '"*HOLE_ID"'] + [f'"BH{i}"' for i in range(2000)]).encode("latin-1")
+    lazy_file = AGS3Parser().parse(content, "f.ags", lazy=True)
+    cache = ParseCache(max_bytes=10 ** 9)
+    lazy_key = ParseCache.make_key(content, "f.ags", "AGS3", False, lazy=True)
+    cache.put(lazy_key, lazy_file)
+    assert cache.current_bytes == len(content)
+    loaded = lazy_file.groups["HOLE"]
+    assert cache.get(lazy_key) is lazy_file
+    assert cache.current_bytes == len(content) + int(loaded.memory_usage(index=True, deep=True).sum())
+    cache.max_bytes = len(content) + 1
+    cache.get(lazy_key)
+    assert lazy_key not in cache and cache.current_bytes == 0
+
+
+def test_ingest_files_pool():
+    paths = [path for path in AGS_FILES if detect_ags_version(open(path, "rb").read()) == "AGS3"][:4]
+    jobs = [IngestJob(filename=os.path.basename(path), content=open(path, "rb").read(), needs_prefix=True) for path in paths]
+    # An AGS4 file in AGS3 mode fails without stopping the batch
+    jobs.insert(2, IngestJob(filename="ags4.ags", content=b'"GROUP","PROJ"\n"HEADING","PROJ_ID"\n'))
+    expected = [ingest_file(job, "AGS3") for job in jobs]
+
+    def check(results, reported):
+        assert [r.filename for r in results] == [job.filename for job in jobs]
+        assert sorted(idx for idx, _ in reported) == list(range(len(jobs)))
+        assert all(result is results[idx] for idx, result in reported)
+        assert [r.ok for r in results] == [r.ok for r in expected]
+        assert results[2].error == expected[2].error
+        for result, reference in zip(results, expected):
+            if result.ok:
+                assert list(result.parsed_file.groups) == list(reference.parsed_file.groups)
+                for name, df in result.parsed_file.groups.items():
+                    pd.testing.assert_frame_equal(df, reference.parsed_file.groups[name], check_exact=True)
+
+    reported = []
+    check(ingest_files(jobs, "AGS3", max_workers=3, on_result=lambda idx, result: reported.append((idx, result))), reported)
+
+    class UnavailablePool:
+        def __init__(self, max_workers):
+            raise OSError("no worker processes")
+
+    class BreakingPool(ProcessPoolExecutor):
+        """Runs the first job in-process, then breaks like a pool whose worker died."""
+
+        def __init__(self, max_workers):
+            self.submitted = 0
+
+        def submit(self, fn, *args):
+            future = Future()
+            if self.submitted:
+                future.set_exception(BrokenProcessPool("worker died"))
+            else:
+                future.set_result(fn(*args))
+            self.submitted += 1
+            return future
+
+        def shutdown(self, wait=True, **kwargs):
+            pass
+
+    try:
+        for pool in (UnavailablePool, BreakingPool):
+            ingest_module.ProcessPoolExecutor = pool
+            reported = []
+            check(ingest_files(jobs, "AGS3", max_workers=3, on_result=lambda idx, result: reported.append((idx, result))), reported)
+    finally:
+        ingest_module.ProcessPoolExecutor = ProcessPoolExecutor
+
+
+def test_tokenizer_matches_split_quoted_csv():
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+
+        expected = []
+        for line_no, line in enumerate(content.decode("latin-1").splitlines(), 1):
+            if not line.strip():
+                continue
+            parts = split_quoted_csv(line)
+            if parts:
+                expected.append((line_no, parts))
+
+        assert list(iter_ags_records(content)) == expected, file_path
+        # Block boundaries must not change the records
+        assert list(iter_ags_records(content, block_size=4096)) == expected, file_path
+
+
+def test_tokenizer_quoting_semantics():
+    text = '\n'.join([
+        '"**HOLE"',
+        '"*HOLE_ID","*HOLE_TYPE",',
+        '"BH1","CP"',
+        '"<CONT>","more"',
+        '"","<CONT>","x"',
+        '"a""b", "c"',
+        '   ',
+        'plain,fields',
+    ])
+    assert list(iter_ags_records(text)) == [
+        (1, ["**HOLE"]),
+        (2, ["*HOLE_ID", "*HOLE_TYPE", ""]),
+        (3, ["BH1", "CP"]),
+        (4, ["<CONT>", "more"]),
+        (5, ["", "<CONT>", "x"]),
+        (6, ['a"b', "c"]),
+        (8, ["plain", "fields"]),
+    ]
+
+
+def test_ags3_continuation_merging():
+    text = '\n'.join([
+        '"**HOLE"',
+        '"*HOLE_ID","*HOLE_REM","*HOLE_LOG"',
+        '"BH1","a | b","x |"',
+        '"<CONT>","b","y"',
+        '"<CONT>","c","| y"',
+        '"<CONT>","a","y"',
+        '"BH2",""',
+        '"","<CONT>","first","z"',
+    ])
+    hole = AGS3Parser().parse(text.encode("latin-1"), "f.ags").groups["HOLE"]
+    assert hole["HOLE_REM"].tolist() == ["a | b | c", "first"]
+    # Parts are compared after splitting the joined cell, exactly like the original merge rule
+    assert hole["HOLE_LOG"].tolist() == ["x | | y | y", "z"]
+
+
+def _assert_same_ags4_tables(content: bytes):
+    expected = AGS4Parser(engine="python_ags4").parse(content, "f.ags")
+    actual = AGS4Parser(engine="native").parse(content, "f.ags")
+    assert actual.is_valid == expected.is_valid
+    assert list(actual.groups) == list(expected.groups)
+    for group, df in expected.groups.items():
+        pd.testing.assert_frame_equal(actual.groups[group], df, check_exact=True)
+
+
+def test_native_ags4_matches_python_ags4():
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) == "AGS4":
+            _assert_same_ags4_tables(content)
+
+    edge_cases = [
+        # BOM, CRLF, duplicate headings, blank line between groups, doubled quotes, space after comma
+        b'\xef\xbb\xbf"GROUP","PROJ"\r\n"HEADING","A","A","B"\r\n"UNIT","","",""\r\n"DATA","1","2",""\r\n\r\n'
+        b'"GROUP","X"\r\n"HEADING","Q"\r\n"DATA","a""b"\r\n"DATA", "c"\r\n',
+        # Not valid UTF-8: whole file read as latin-1
+        '"GROUP","P"\n"HEADING","A"\n"DATA","\xe9\xb0"\n'.encode("latin-1"),
+        # Groups without headings or without data rows
+        b'"GROUP","P"\n"GROUP","Q"\n"HEADING","A"\n',
+        # Unterminated quote, no final newline
+        b'"GROUP","P"\n"HEADING","A"\n"DATA","\n"DATA","1"',
+        # Errors: row length mismatch, duplicated group, HEADING without GROUP
+        b'"GROUP","P"\n"HEADING","A","B"\n"DATA","1"\n',
+        b'"GROUP","P"\n"HEADING","A"\n"GROUP","P"\n',
+        b'"HEADING","A"\n',
+    ]
+    for content in edge_cases:
+        _assert_same_ags4_tables(content)
+
+
+def test_detection_reads_bounded_prefix():
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        detection = detect_ags(content)
+        assert detection.version in ("AGS3", "AGS4"), file_path
+        assert detection.confidence == 1.0
+        assert detection.bytes_scanned < len(content) or len(content) <= 64 * 1024
+        # A tiny starting window is widened until the first lines are complete
+        assert detect_ags(content, prefix_bytes=16).version == detection.version
+
+    ags3 = '"**HOLE"\r\n"*HOLE_ID","*HOLE_TYPE"\r\n"BH1","CP"\r\n'
+    ags4 = '"GROUP","LOCA"\r\n"HEADING","LOCA_ID"\r\n"DATA","BH1 \u00b0"\r\n'
+    for bom, encoding in [(codecs.BOM_UTF8, "utf-8"), (codecs.BOM_UTF16_LE, "utf-16-le")]:
+        content = bom + ags3.encode(encoding)
+        detection = detect_ags(content)
+        assert (detection.version, detection.encoding, detection.bom) == ("AGS3", encoding, bom)
+        hole = AGS3Parser().parse(content, "f.ags", detection=detection).groups["HOLE"]
+        assert hole["HOLE_ID"].tolist() == ["BH1"]
+
+        content = bom + ags4.encode(encoding)
+        detection = detect_ags(content)
+        assert detection.version == "AGS4"
+        for engine in ("python_ags4", "native"):
+            loca = AGS4Parser(engine=engine).parse(content, "f.ags", detection=detection).groups["LOCA"]
+            assert loca["LOCA_ID"].tolist() == ["BH1 \u00b0"]
+
+    assert detect_ags('"GROUP","LOCA"\n"DATA","x"\n'.encode()).confidence < 1.0
+    assert detect_ags(b"no markers here").version == "UNKNOWN"
+
+
+def test_lazy_groups_match_full_parse():
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        version = detect_ags_version(content)
+        parsers = [AGS3Parser()] if version == "AGS3" else [AGS4Parser(engine="python_ags4"), AGS4Parser(engine="native")]
+        for parser in parsers:
+            full = parser.parse(content, "f.ags").groups
+            lazy = parser.parse(content, "f.ags", lazy=True).groups
+            assert list(lazy) == list(full), file_path
+            assert not any(lazy.is_loaded(name) for name in lazy)
+            # Load in reverse order: a group must not depend on the groups parsed before it
+            for name in reversed(list(full)):
+                pd.testing.assert_frame_equal(lazy[name], full[name], check_exact=True)
+
+    # Repeated and renamed AGS3 groups, CR line ends, prefix transform applied on load
+    text = '\r'.join([
+        '"**HOLE"', '"*HOLE_ID"', '"BH1"',
+        '"**?ETH"', '"*HOLE_ID","*?ETH"', '"BH1","W1"',
+        '"**HOLE"', '"*HOLE_ID"', '"BH2"',
+    ]).encode("latin-1")
+    full = AGS3Parser().parse(text, "f.ags").groups
+    lazy = AGS3Parser().parse(text, "f.ags", lazy=True)
+    apply_prefix(lazy, "F_")
+    assert list(lazy.groups) == ["HOLE", "WETH"]
+    assert lazy.groups["HOLE"]["HOLE_ID"].tolist() == ["F_BH1", "F_BH2"]
+    pd.testing.assert_frame_equal(lazy.groups["WETH"].drop(columns="HOLE_ID"), full["WETH"].drop(columns="HOLE_ID"))
+
+
+def test_group_and_column_projection():
+    key_columns = key_data_mapped_columns()
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        version = detect_ags_version(content)
+        parsers = [AGS3Parser()] if version == "AGS3" else [AGS4Parser(engine="python_ags4"), AGS4Parser(engine="native")]
+        for parser in parsers:
+            full = parser.parse(content, "f.ags").groups
+            for lazy in (False, True):
+                projected = parser.parse(content, "f.ags", lazy=lazy, groups=KEY_DATA_GROUPS, columns=key_columns).groups
+                assert list(projected) == [name for name in full if name in KEY_DATA_GROUPS], file_path
+                for name in projected:
+                    keep = set(key_columns[name]) | {"HEADING", "SOURCE_FILE"}
+                    expected = full[name][[col for col in full[name].columns if col in keep]]
+                    pd.testing.assert_frame_equal(projected[name], expected, check_exact=True)
+
+
+def test_hole_filter_while_reading():
+    ags3 = '\n'.join([
+        '"**HOLE"',
+        '"*HOLE_ID","*HOLE_TYPE"',
+        '"BH1","CP"',
+        '"TP1","TP"',
+        '"RC1","CP+RC"',
+        '"**GEOL"',
+        '"*HOLE_ID","*GEOL_TOP","*GEOL_DESC"',
+        '"BH1","0","Clay"',
+        '"TP1","0","Sand"',
+        '"<CONT>","","dropped with its row"',
+        '"RC1","1","Rock"',
+        '"**PROJ"',
+        '"*PROJ_ID"',
+        '"P1"',
+    ]).encode("latin-1")
+    hole_filter = HoleFilter.create(exclude_types=["tp"], exclude_type_contains=["RC"])
+    for lazy in (False, True):
+        groups = AGS3Parser().parse(ags3, "f.ags", lazy=lazy, hole_filter=hole_filter).groups
+        assert groups["HOLE"]["HOLE_ID"].tolist() == ["BH1"]
+        assert groups["GEOL"]["GEOL_DESC"].tolist() == ["Clay"]
+        assert groups["PROJ"]["PROJ_ID"].tolist() == ["P1"]
+    groups = AGS3Parser().parse(ags3, "f.ags", hole_filter=HoleFilter.create(hole_ids=["TP1"])).groups
+    assert groups["GEOL"]["GEOL_DESC"].tolist() == ["Sand | dropped with its row"]
+
+    ags4 = b'"GROUP","LOCA"\n"HEADING","LOCA_ID","LOCA_TYPE"\n"UNIT","",""\n"TYPE","ID","PA"\n' \
+           b'"DATA","BH1","CP"\n"DATA","TP1","TP"\n\n' \
+           b'"GROUP","GEOL"\n"HEADING","LOCA_ID","GEOL_TOP"\n"UNIT","","m"\n"TYPE","ID","2DP"\n' \
+           b'"DATA","BH1","0.00"\n"DATA","TP1","0.00"\n'
+    for engine in ("python_ags4", "native"):
+        groups = AGS4Parser(engine=engine).parse(ags4, "f.ags", hole_filter=HoleFilter.create(exclude_types=["TP"])).groups
+        assert groups["LOCA"]["LOCA_ID"].tolist() == ["", "ID", "BH1"]
+        assert groups["GEOL"]["HEADING"].tolist() == ["UNIT", "TYPE", "DATA"]
+        assert groups["GEOL"]["LOCA_ID"].tolist() == ["", "ID", "BH1"]
+
+
+def test_chunked_parse_matches_full_parse():
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            job = IngestJob(filename=os.path.basename(file_path), content=f.read(), needs_prefix=True)
+        version = detect_ags_version(job.content)
+        full = ingest_file(job, version).parsed_file.groups
+        chunks = {}
+        for group, df in iter_file_chunks(job, version, chunk_rows=50):
+            assert len(df.index) <= 50
+            chunks.setdefault(group, []).append(df)
+        assert list(chunks) == [name for name in full if name in chunks] and set(chunks) == set(full), file_path
+        for group, dfs in chunks.items():
+            pd.testing.assert_frame_equal(pd.concat(dfs, ignore_index=True), full[group], check_exact=True)
+
+
+def test_typed_columns():
+    ags3 = '\n'.join([
+        '"**HOLE"',
+        '"*HOLE_ID","*HOLE_TYPE","*HOLE_NATE","*HOLE_STAR"',
+        '"<UNITS>","","m","dd/mm/yyyy"',
+        '"BH1","CP","830000.5","01/02/2020"',
+        '"BH2","CP","830001","03/02/2020"',
+        '"**GEOL"',
+        '"*HOLE_ID","*GEOL_TOP","*GEOL_BASE","*GEOL_DESC"',
+        '"BH1","0.00","1.50","Clay"',
+        '"BH1","1.50","2.00","Sand"',
+        '"<CONT>","","2.50",""',
+    ]).encode("latin-1")
+    groups = AGS3Parser().parse(ags3, "f.ags", typed=True).groups
+    hole = groups["HOLE"]
+    assert hole["HOLE_NATE"].tolist() == [830000.5, 830001.0]
+    assert hole["HOLE_STAR"].tolist() == [pd.Timestamp(2020, 2, 1), pd.Timestamp(2020, 2, 3)]
+    assert hole["HOLE_TYPE"].dtype == "category"
+    assert groups["GEOL"]["GEOL_TOP"].tolist() == [0.0, 1.5]
+    # A merged <CONT> value is not a number: the column is left as text rather than losing it
+    assert groups["GEOL"]["GEOL_BASE"].tolist() == ["1.50", "2.00 | 2.50"]
+    assert groups["GEOL"]["GEOL_DESC"].tolist() == ["Clay", "Sand"]
+    # Typed depth columns are used as they are; text ones are still converted
+    assert numeric_values(groups["GEOL"]["GEOL_TOP"]) is groups["GEOL"]["GEOL_TOP"]
+    assert numeric_values(groups["GEOL"]["GEOL_BASE"]).tolist()[0] == 1.5
+
+    # Master intervals do not depend on whether the depths were typed while parsing
+    for file_path in [path for path in AGS_FILES if detect_ags_version(open(path, "rb").read()) == "AGS3"][:3]:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        text_groups = AGS3Parser().parse(content, "f.ags", groups=KEY_DATA_GROUPS).groups
+        typed_groups = AGS3Parser().parse(content, "f.ags", groups=KEY_DATA_GROUPS, typed=True).groups
+        pd.testing.assert_frame_equal(_calculate_master_intervals(typed_groups, KEY_DATA_DEPTH_KEYS),
+                                      _calculate_master_intervals(text_groups, KEY_DATA_DEPTH_KEYS))
+
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) != "AGS4":
+            continue
+        tables = AGS4Parser(engine="native").parse(content, "f.ags").groups
+        typed = AGS4Parser(engine="native").parse(content, "f.ags", typed=True).groups
+        for name, df in tables.items():
+            if not len(df.index):
+                continue
+            numeric = AGS4.convert_to_numeric(df.drop(columns="SOURCE_FILE"))
+            assert (typed[name]["HEADING"] == "DATA").all()
+            for col in typed[name].columns:
+                if typed[name][col].dtype == "float64":
+                    pd.testing.assert_series_equal(typed[name][col], numeric[col].astype("float64"))
+
+
+def test_typed_chunks_match_typed_parse():
+    # GEOL_TOP converts in the first batch only and HOLE_TYPE repeats its codes in the first batch only;
+    # the batches still get the dtypes of the whole table
+    ags3 = '\n'.join([
+        '"**HOLE"',
+        '"*HOLE_ID","*HOLE_TYPE","*HOLE_NATE"',
+        '"<UNITS>","","m"',
+        '"BH1","CP","1"', '"BH2","CP","2"', '"BH3","RC","3"', '"BH4","TP","4"', '"BH5","WS","5"',
+        '"**GEOL"',
+        '"*HOLE_ID","*GEOL_TOP","*GEOL_BASE"',
+        '"BH1","0.00","1.50"', '"BH1","1.50","2.00"', '"BH1","see notes","2.50"',
+    ]).encode("latin-1")
+    ags4 = '\n'.join([
+        '"GROUP","LOCA"',
+        '"HEADING","LOCA_ID","LOCA_TYPE","LOCA_NATE"',
+        '"UNIT","","","m"',
+        '"TYPE","ID","PA","2DP"',
+        '"DATA","BH1","CP","1.00"', '"DATA","BH2","CP","2.00"', '"DATA","BH3","RC","n/a"',
+    ]).encode("latin-1")
+    for parser, content in ((AGS3Parser(), ags3), (AGS4Parser(engine="native"), ags4)):
+        full = parser.parse(content, "f.ags", typed=True).groups
+        chunks = {}
+        for group, df in parser.iter_chunks(content, "f.ags", chunk_rows=2, typed=True):
+            chunks.setdefault(group, []).append(df)
+        assert set(chunks) == set(full)
+        for group, dfs in chunks.items():
+            pd.testing.assert_frame_equal(pd.concat(dfs, ignore_index=True), full[group], check_exact=True)
+    hole = AGS3Parser().parse(ags3, "f.ags", typed=True).groups["HOLE"]
+    assert hole["HOLE_NATE"].dtype == "float64" and hole["HOLE_TYPE"].dtype == object
+
+
+def test_shared_key_encoding():
+    parsed = []
+    for file_path in AGS_FILES[:6]:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) == "AGS3":
+            parsed.append(AGS3Parser().parse(content, os.path.basename(file_path)))
+    # Parsed groups keep SOURCE_FILE as text; only the combined groups encode it
+    assert all(df["SOURCE_FILE"].dtype == object for pfile in parsed for df in pfile.groups.values())
+    combined = combine_files(parsed)
+
+    # One dictionary for all groups: a hole has the same code in every group
+    codes = {}
+    for name, df in combined.items():
+        assert df["SOURCE_FILE"].dtype == "category"
+        if "HOLE_ID" not in df.columns:
+            continue
+        for hole_id, code in zip(df["HOLE_ID"].astype(object), df["HOLE_ID"].cat.codes):
+            if isinstance(hole_id, str):
+                assert codes.setdefault(hole_id, code) == code, (name, hole_id)
+
+    keys = KeyDictionary()
+    values = pd.Series(["BH1", None, "BH2", "BH1"])
+    assert keys.codes(values).tolist() == [0, -1, 1, 0]
+    # Codes never change as the dictionary grows
+    assert keys.codes(pd.Series(["BH3", "BH2"])).tolist() == [2, 1]
+    assert keys.encode(values).tolist()[2] == "BH2"
+
+
+def test_expand_rows():
+    df = pd.DataFrame({
+        "HOLE_ID": ["BH1", "BH1 | BH1", "BH2"],
+        "DESC": ["clay", "sand | gravel | silt", "A | A"],
+        "DEPTH": [1.0, 2.0, 3.0],
+    })
+    expanded = expand_rows(df)
+    assert expanded["HOLE_ID"].tolist() == ["BH1", "BH1", "BH1", "", "BH2"]
+    assert expanded["DESC"].tolist() == ["clay", "sand", "gravel", "silt", "A"]
+    # Cells with fewer parts than the longest split of their row are padded with blanks
+    assert expanded["DEPTH"].tolist() == [1.0, 2.0, "", "", 3.0]
+    # Nothing to split (a bare "|" is not the separator): the frame comes back as it is
+    unsplit = pd.DataFrame({"HOLE_ID": ["BH1", "BH2"], "DESC": ["a|b", None], "CODE": pd.Categorical(["x", "y"])})
+    assert expand_rows(unsplit) is unsplit
+
+
+def test_drop_singleton_rows_matches_replace():
+    def by_replace(df):
+        # The previous implementation: blank text to NaN over the whole frame, then count per row
+        with warnings.catch_warnings():
+            # pandas' notice about replace() downcasting, which the old code relied on
+            warnings.simplefilter("ignore", FutureWarning)
+            clean = df.replace(r"^\s*$", np.nan, regex=True).infer_objects(copy=False)
+        return df.loc[clean.notna().sum(axis=1) > 1].reset_index(drop=True)
+
+    df = pd.DataFrame({
+        "HOLE_ID": ["BH1", "BH1", "BH2", "  ", None, "BH3", "BH4", "BH5", "BH6", "BH7"],
+        "DESC": ["clay", "   ", "", "x", np.nan, None, "\t", "sand", None, ""],
+        "CODE": pd.Categorical(["A", " ", None, "", "B", " ", "C", None, "D", None]),
+        "DEPTH": [1.0, np.nan, np.nan, 2.0, np.nan, np.nan, np.nan, 3.0, np.nan, np.nan],
+    })
+    expected = by_replace(df)
+    # Rows holding only their hole key (or nothing but blanks) are dropped
+    assert expected["HOLE_ID"].tolist() == ["BH1", "  ", "BH4", "BH5", "BH6"]
+    pd.testing.assert_frame_equal(drop_singleton_rows(df), expected)
+    with_source = df.assign(SOURCE_FILE="f.ags")
+    pd.testing.assert_frame_equal(drop_singleton_rows(with_source, non_blank=["SOURCE_FILE"]), by_replace(with_source))
+    only_source = with_source[["SOURCE_FILE", "DESC", "CODE"]]
+    pd.testing.assert_frame_equal(drop_singleton_rows(only_source, non_blank=["SOURCE_FILE"]), by_replace(only_source))
+
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) != "AGS3":
+            continue
+        for name, group in AGS3Parser().parse(content, "f.ags").groups.items():
+            pd.testing.assert_frame_equal(drop_singleton_rows(group, non_blank=["SOURCE_FILE"]), by_replace(group))
+
+
+def test_combine_engines_match():
+    parsed = []
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        version = detect_ags_version(content)
+        parser = AGS3Parser() if version == "AGS3" else AGS4Parser()
+        parsed.append(parser.parse(content, os.path.basename(file_path), typed=True))
+    aligned = combine_files(parsed)
+    concat = combine_files(parsed, engine="concat")
+    assert list(aligned) == list(concat)
+    for name in aligned:
+        pd.testing.assert_frame_equal(aligned[name], concat[name], obj=name)
+
+    # Columns missing from a file are NaN, in first-seen column order
+    first = pd.DataFrame({"HOLE_ID": ["BH1"], "A": ["1"]})
+    second = pd.DataFrame({"B": [2.0], "hole_id ": ["BH2"]})
+    files = [ParsedAGSFile(filename=name, version=AGSVersion.AGS3, groups={"G": df})
+             for name, df in (("a.ags", first), ("b.ags", second))]
+    stacked = combine_files(files)["G"]
+    assert list(stacked.columns) == ["HOLE_ID", "A", "SOURCE_FILE", "B"]
+    assert stacked["A"].tolist()[1] is np.nan and stacked["SOURCE_FILE"].tolist() == ["a.ags", "b.ags"]
+
+
+def test_combined_store_add_remove():
+    parsed = []
+    for file_path in AGS_FILES:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        if detect_ags_version(content) == "AGS3":
+            parsed.append(AGS3Parser().parse(content, os.path.basename(file_path)))
+
+    def assert_matches(store, files):
+        expected = combine_files(files)
+        groups = store.groups
+        assert list(groups) == list(expected)
+        for name, df in expected.items():
+            # Key categories may differ (the store's dictionary keeps removed files), values may not
+            pd.testing.assert_frame_equal(groups[name].astype(object), df.astype(object), obj=name)
+
+    store = CombinedStore()
+    for pfile in parsed:
+        store.add(pfile.filename, pfile)
+    assert_matches(store, parsed)
+
+    removed = parsed[1]
+    store.remove(removed.filename)
+    assert removed.filename not in store
+    assert_matches(store, [pfile for pfile in parsed if pfile is not removed])
+    for name, df in store.groups.items():
+        for pfile in store.files:
+            if name in pfile.groups and not pfile.groups[name].empty:
+                start, stop = store.row_range(name, pfile.filename)
+                assert (df["SOURCE_FILE"].iloc[start:stop].astype(str) == pfile.filename).all()
+
+    store.sync({pfile.filename: pfile for pfile in parsed[:1] + [removed]})
+    assert_matches(store, parsed[:1] + [removed])
+
+    # Rows follow the order of the synced entries, after a reorder or an insert in the middle
+    for order in (parsed[::-1], parsed[:2] + parsed[3:], parsed):
+        store.sync({pfile.filename: pfile for pfile in order})
+        assert store.files == order
+        assert_matches(store, order)
+        for name, df in store.groups.items():
+            stops = [0]
+            for pfile in store.files:
+                if name in pfile.groups and not pfile.groups[name].empty:
+                    start, stop = store.row_range(name, pfile.filename)
+                    assert start == stops[-1] and (df["SOURCE_FILE"].iloc[start:stop].astype(str) == pfile.filename).all()
+                    stops.append(stop)
+            assert stops[-1] == len(df.index)
+
+    # The same upload in the no-prefix and with-prefix sections: one name, two entries
+    with open(AGS_FILES[0], "rb") as f:
+        job = IngestJob(filename=os.path.basename(AGS_FILES[0]), content=f.read())
+    version = detect_ags_version(job.content)
+    plain = ingest_file(job, version).parsed_file
+    prefixed = ingest_file(IngestJob(job.filename, job.content, needs_prefix=True), version).parsed_file
+    entries = {ParseCache.make_key(job.content, job.filename, version, needs_prefix): pfile
+               for needs_prefix, pfile in ((False, plain), (True, prefixed))}
+    store = CombinedStore()
+    store.sync(entries)
+    assert len(store) == 2
+    assert_matches(store, [plain, prefixed])
+    # A rerun with the same parsed files changes nothing
+    groups = store.groups
+    store.sync(entries)
+    assert all(store.groups[name] is df for name, df in groups.items())
+
+
+def test_intervals_mapped_last_writer_wins():
+    key_data = {
+        "GEOL": pd.DataFrame({
+            "HOLE_ID": ["BH1", "BH1", "BH2", "BH1"],
+            "GEOL_TOP": ["0", "1.0", "0", "0.5"],
+            "GEOL_BASE": ["2", "3", "1", "1.5"],
+            "GEOL_DESC": ["clay", "sand", "rock", "silt"],
+        }),
+        "SAMP": pd.DataFrame({"HOLE_ID": ["BH1"], "SAMP_TOP": [2.5], "SAMP_BASE": [""], "SAMP_ID": ["S1"]}),
+    }
+    intervals = get_key_data_intervals_mapped(key_data).sort_values(["HOLE_ID", "DEPTH_FROM"])
+    bh1 = intervals[intervals["HOLE_ID"] == "BH1"]
+    assert bh1["DEPTH_FROM"].tolist() == [0.0, 0.5, 1.0, 1.5, 2.0, 2.5]
+    # Overlapping rows: the later row wins from its top down to (not including) its base
+    assert bh1["GEOL_DESC"].tolist() == ["clay", "silt", "silt", "sand", "sand", "sand"]
+    # A row without a base depth maps nothing
+    assert bh1["SAMP_ID"].isna().all()
+    assert intervals.loc[intervals["HOLE_ID"] == "BH2", "GEOL_DESC"].tolist() == ["rock"]
+
+
+def test_intervals_full_attaches_all_columns():
+    key_data = {
+        "GEOL": pd.DataFrame({"HOLE_ID": ["BH1", "BH1"], "GEOL_TOP": ["0", "1"], "GEOL_BASE": ["2", "2"],
+                             "GEOL_DESC": ["clay", "sand"], "GEOL_LEG": ["CL", None]}),
+        "CORE": pd.DataFrame({"HOLE_ID": ["BH1"], "CORE_TOP": [0.5], "CORE_BOT": [1.5], "CORE_RQD": [40.0]}),
+    }
+    intervals = get_key_data_intervals_full(key_data).sort_values("DEPTH_FROM")
+    assert list(intervals.columns) == ["HOLE_ID", "DEPTH_FROM", "DEPTH_TO", "THICKNESS_M",
+                                       "CORE_RQD", "GEOL_DESC", "GEOL_LEG"]
+    assert intervals["CORE_RQD"].tolist() == [None, 40.0, 40.0, None]
+    assert intervals["GEOL_DESC"].tolist() == ["clay", "clay", "sand", "sand"]
+    # Every column of the winning row is taken, missing values included
+    assert intervals["GEOL_LEG"].tolist() == ["CL", "CL", None, None]
+
+    # Source columns named like an interval column are not copied: the intervals keep their own values
+    key_data["GEOL"] = key_data["GEOL"].assign(DEPTH_FROM=["9", "9"], THICKNESS_M=["7", "7"])
+    intervals = get_key_data_intervals_full(key_data).sort_values("DEPTH_FROM")
+    assert list(intervals.columns) == ["HOLE_ID", "DEPTH_FROM", "DEPTH_TO", "THICKNESS_M",
+                                       "CORE_RQD", "GEOL_DESC", "GEOL_LEG"]
+    assert intervals["DEPTH_FROM"].tolist() == [0.0, 0.5, 1.0, 1.5]
+    assert intervals["THICKNESS_M"].tolist() == [0.5, 0.5, 0.5, 0.5]
+
+
+def test_master_intervals():
+    key_data = {
+        "GEOL": pd.DataFrame({"HOLE_ID": ["BH2", "BH1", None, "BH1"], "GEOL_TOP": ["0", "1", "5", "x"],
+                             "GEOL_BASE": ["1", "2.5", "6", "4"]}),
+        "SAMP": pd.DataFrame({"HOLE_ID": ["BH1", "BH3"], "SAMP_TOP": [1.0, 2.0], "SAMP_BASE": [None, 2.0]}),
+    }
+    depth_keys = {"GEOL": ("GEOL_TOP", "GEOL_BASE"), "SAMP": ("SAMP_TOP", "SAMP_BASE")}
+    intervals = _calculate_master_intervals(key_data, depth_keys)
+    # Holes sorted by ID, repeated depths merged, holes with a single depth (BH3) or no ID left out
+    assert intervals["HOLE_ID"].tolist() == ["BH1", "BH1", "BH2"]
+    assert intervals["DEPTH_FROM"].tolist() == [1.0, 2.5, 0.0]
+    assert intervals["DEPTH_TO"].tolist() == [2.5, 4.0, 1.0]
+    assert intervals["THICKNESS_M"].tolist() == [1.5, 1.5, 1.0]
+    assert _calculate_master_intervals({"GEOL": key_data["GEOL"].iloc[:0]}, depth_keys).empty
+
+
+def test_key_data_session():
+    key_data = {
+        "GEOL": pd.DataFrame({"HOLE_ID": ["BH1", "BH1", "BH2"], "GEOL_TOP": ["0", "1", "0"], "GEOL_BASE": ["1", "3", "2"],
+                             "GEOL_DESC": ["clay", "sand", "rock"], "GEOL_LEG": ["CL", "SA", "RK"]}),
+        "CORE": pd.DataFrame({"HOLE_ID": ["BH1"], "CORE_TOP": [0.5], "CORE_BOT": [2.0], "CORE_RQD": [40.0]}),
+        "SAMP": pd.DataFrame({"HOLE_ID": ["BH2"], "SAMP_TOP": [1.5], "SAMP_BASE": [2.0], "SAMP_ID": ["S1"]}),
+    }
+    session = KeyDataSession(key_data)
+    for groups in (None, ["GEOL", "SAMP"], ["SAMP", "GEOL", "LOCA"]):
+        selected = {k: v for k, v in key_data.items() if groups is None or k in groups}
+        pd.testing.assert_frame_equal(session.mapped(groups), get_key_data_intervals_mapped(selected))
+        pd.testing.assert_frame_equal(session.full(groups), get_key_data_intervals_full(selected))
+    # Master intervals once per selection (in any order), views kept for later calls
+    assert len(session._intervals) == 2
+    assert session.full(["GEOL", "SAMP"]) is session.full(["SAMP", "GEOL"])
+    assert session.holds(dict(key_data)) and not session.holds({**key_data, "GEOL": key_data["GEOL"].copy()})
+
+
+def test_depth_index():
+    intervals = pd.DataFrame({
+        "HOLE_ID": ["BH1", "BH2", "BH1", "BH1"],
+        "DEPTH_FROM": [10.0, 0.0, 0.0, 20.0],
+        "DEPTH_TO": [15.0, 5.0, 10.0, 25.0],
+        "GEOL_DESC": ["rock", "sand", "clay", "granite"],
+    })
+    index = DepthIndex(intervals)
+    # Tops are inclusive; a base is only when no interval starts there (15 m is above a gap, 25 m the bottom)
+    rows = index.rows_at(["BH1", "BH1", "BH1", "BH1", "BH1", "BH2", "BH9"], [0, 10, 15, 17, 25, 5, 1])
+    assert rows.tolist() == [2, 0, 0, -1, 3, 1, -1]
+    queries, rows = index.rows_between(["BH1", "BH2", "BH1"], [5, 1, 15], [22, 2, 20])
+    assert queries.tolist() == [0, 0, 0, 1] and rows.tolist() == [2, 0, 3, 1]
+
+    found = index.search(pd.DataFrame({"GIU_HOLE_ID": ["BH1", "BH9"], "DEPTH": [12, 1]}))
+    assert found["GEOL_DESC"].tolist()[0] == "rock" and pd.isna(found["GEOL_DESC"].tolist()[1])
+    found = index.search(pd.DataFrame({"HOLE_ID": ["BH1", "BH2"], "DEPTH_FROM": [5, 7], "DEPTH_TO": [12, 8]}))
+    # Ranges are cut to the queried depths; a range without intervals is kept once
+    assert found["DEPTH_FROM"].tolist() == [5.0, 10.0, 7.0] and found["DEPTH_TO"].tolist() == [10.0, 12.0, 8.0]
+    assert found["GEOL_DESC"].tolist()[:2] == ["clay", "rock"] and pd.isna(found["GEOL_DESC"].tolist()[2])
+    # Unknown holes are looked up without being added
+    assert len(index.holes) == 2
+    index.rows_at([f"BH{i}" for i in range(10, 1010)], np.zeros(1000))
+    index.rows_between(["BH9", None], [0, 0], [1, 1])
+    assert len(index.holes) == 2
+
+    overlapping = intervals.assign(DEPTH_TO=[21.0, 5.0, 10.0, 25.0])
+    try:
+        DepthIndex(overlapping)
+        assert False, "overlapping intervals should be rejected"
+    except ValueError:
+        pass
+
+
+def test_keyword_flags():
+    intervals = pd.DataFrame({
+        "GEOL_DESC": ["Grey SANDSTONE", "Soft clay", None, "sand"],
+        "Details": ["", "no recovery", "Sandy", 12.5],
+        "FI": ["5", None, "NR", "nr"],
+    })
+    flags = flag_keywords(intervals, ["sand", "Sandstone", "Clay", "no recovery", "SAND", "gravel"])
+    assert list(flags.columns[3:]) == ["sand", "Sandstone", "Clay", "No Recovery", "gravel"]
+    # Overlapping keywords ("sand" inside "sandstone") are both found; any description column counts
+    assert flags["sand"].tolist() == [True, False, True, True]
+    assert flags["Sandstone"].tolist() == [True, False, False, False]
+    assert flags["Clay"].tolist() == [False, True, False, False]
+    # "No Recovery" also flags FI values with both N and R (upper case, as the legacy tool tested them)
+    assert flags["No Recovery"].tolist() == [False, True, True, False]
+    assert not flags["gravel"].any()
+
+    matcher = KeywordMatcher(["ab", "abc", "b", "bcd"])
+    assert matcher.match_texts(["xABCD", "ab", "c", ""]).tolist() == [
+        [True, True, True, True], [True, False, True, False], [False] * 4, [False] * 4]
+
+
+def test_soil_classification():
+    intervals = pd.DataFrame({
+        "GEOL_DESC": ["Firm brown sandy CLAY (ALLUVIUM)", "Loose SAND (FILL)", "Dense SAND", None],
+        "GEOL": ["ALL", None, "FILL", "COLL"],
+        "Details": [None, "GRAVEL layer", "", "BOULDER"],
+        "WETH_GRAD": [None, None, "IV", "III/IV"],
+    })
+    result = classify_soil(intervals)
+    # Later soil types replace earlier ones (FILL after IV); grain sizes fine to coarse
+    assert result[SOIL_CODE_COLUMN].tolist() == ["ALL-c", "FILL-s,g", "FILL-s", "COLL-bd"]
+    assert result["Sand"].tolist() == [None, "s", "s", None]
+    # Weathering grades are whole words: IV is not V, and grades alone give no grain size
+    only_grade = classify_soil(intervals.assign(GEOL_DESC="CLAY", GEOL=None, Details=None))
+    assert only_grade[SOIL_CODE_COLUMN].tolist() == [None, None, "IV-c", "IV-c"]
+
+
+def test_prefix_every_hole_key_column():
+    hole_prefix = HolePrefix("F_")
+    legd = pd.DataFrame({"?HOLE_ID": [" BH1", "BH2 ", "BH1"], "?LEGD_TOP": ["0", "1", "2"]})
+    mixed = pd.DataFrame({"HOLE_ID": ["BH1", None], "LOCA_ID": ["BH3", "BH1"], "HOLE_TYPE": ["CP", "RC"]}).astype(
+        {"LOCA_ID": "category"})
+    originals = [legd.copy(), mixed.copy()]
+    hole_prefix(legd)
+    hole_prefix(mixed)
+    assert legd["?HOLE_ID"].tolist() == ["F_BH1", "F_BH2", "F_BH1"]
+    # Every key column is prefixed (as text, like astype(str)), other columns are left alone
+    assert mixed["HOLE_ID"].tolist() == ["F_BH1", "F_None"] and mixed["LOCA_ID"].tolist() == ["F_BH3", "F_BH1"]
+    assert mixed["HOLE_TYPE"].tolist() == ["CP", "RC"]
+    # The same IDs as prefix + astype(str).str.strip()
+    for df, original in zip((legd, mixed), originals):
+        for col in ("?HOLE_ID", "HOLE_ID", "LOCA_ID"):
+            if col in df.columns:
+                assert df[col].tolist() == ("F_" + original[col].astype(str).str.strip()).tolist()
+    # One dictionary for the file: each distinct ID (before stripping) is keyed once
+    assert len(hole_prefix.holes) == 5
+
+
+if __name__ == "__main__":
+    test_parse_cache()
+    test_ingest_files_pool()
+    test_tokenizer_matches_split_quoted_csv()
+    test_tokenizer_quoting_semantics()
+    test_ags3_continuation_merging()
+    test_native_ags4_matches_python_ags4()
+    test_detection_reads_bounded_prefix()
+    test_lazy_groups_match_full_parse()
+    test_group_and_column_projection()
+    test_hole_filter_while_reading()
+    test_chunked_parse_matches_full_parse()
+    test_typed_columns()
+    test_typed_chunks_match_typed_parse()
+    test_shared_key_encoding()
+    test_expand_rows()
+    test_drop_singleton_rows_matches_replace()
+    test_combine_engines_match()
+    test_combined_store_add_remove()
+    test_intervals_mapped_last_writer_wins()
+    test_intervals_full_attaches_all_columns()
+    test_master_intervals()
+    test_key_data_session()
+    test_depth_index()
+    test_keyword_flags()
+    test_soil_classification()
+    test_prefix_every_hole_key_column()
+    print("Parsing tests passed!")